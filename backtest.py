@@ -0,0 +1,225 @@
+"""
+Historical Backtest
+Rebalancing policies replayed over realized CBR key rate, RUONIA and USD/RUB
+history, from every start month at once
+
+Usage:
+    python backtest.py                                # CSV files in ./history, 3-year windows
+    python backtest.py --history-dir data --years 5 --step 3
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from forecast_curves import MONTHS_PER_YEAR
+from monte_carlo import MonteCarloResult
+
+DEFAULT_HISTORY_DIR = 'history'
+# Файлы истории: дата, значение (ставки в %, курс в руб за 1 USD)
+HISTORY_FILES = {
+    'cbr': 'cbr_key_rate.csv',
+    'ruonia': 'ruonia.csv',
+    'usd_rub': 'usd_rub.csv',
+}
+BACKTEST_POLICIES = ('none', 'annual', 'quarterly', 'monthly', 'threshold', 'two_tier')
+
+
+def load_series(path):
+    """
+    Ряд из CSV: первая колонка - дата, вторая - значение
+
+    Dates may be ISO (2024-01-31) or DD.MM.YYYY as exported by the CBR site;
+    a decimal comma in the values is accepted. A header row is expected.
+    """
+    frame = pd.read_csv(path, dtype=str)
+    if frame.shape[1] < 2:
+        raise ValueError(f"{path}: expected two columns (date, value)")
+    raw_dates = frame.iloc[:, 0].str.strip()
+    try:
+        dates = pd.to_datetime(raw_dates, format='ISO8601')
+    except ValueError:
+        dates = pd.to_datetime(raw_dates, format='%d.%m.%Y')
+    values = pd.to_numeric(frame.iloc[:, 1].str.strip().str.replace(',', '.', regex=False))
+    series = pd.Series(values.to_numpy(dtype=float), index=pd.DatetimeIndex(dates)).dropna()
+    return series[~series.index.duplicated(keep='last')].sort_index()
+
+
+class MarketHistory:
+    """
+    Monthly history aligned on month starts: cbr and ruonia are the average
+    rates of each month (%), fx is USD/RUB on the first trading day of the month.
+    """
+
+    def __init__(self, dates, cbr, ruonia, fx):
+        self.dates = pd.DatetimeIndex(dates)
+        self.cbr = np.asarray(cbr, dtype=float)
+        self.ruonia = np.asarray(ruonia, dtype=float)
+        self.fx = np.asarray(fx, dtype=float)
+        if not len(self.dates) == len(self.cbr) == len(self.ruonia) == len(self.fx):
+            raise ValueError("History series must have the same length")
+
+    @classmethod
+    def from_series(cls, cbr, ruonia, fx):
+        """Ряды любой частоты (индекс - даты) → помесячная история на общем интервале"""
+        def monthly(series, how):
+            # Месяцы без наблюдений (ставка не менялась) берут последнее значение
+            return getattr(series.sort_index().resample('MS'), how)().ffill()
+
+        frame = pd.concat({'cbr': monthly(cbr, 'mean'), 'ruonia': monthly(ruonia, 'mean'),
+                           'fx': monthly(fx, 'first')}, axis=1, join='inner').dropna()
+        return cls(frame.index, frame['cbr'], frame['ruonia'], frame['fx'])
+
+    @classmethod
+    def from_csv(cls, directory=DEFAULT_HISTORY_DIR):
+        """История из файлов HISTORY_FILES в directory"""
+        series = {}
+        for name, filename in HISTORY_FILES.items():
+            path = os.path.join(directory, filename)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"History file not found: {path}")
+            series[name] = load_series(path)
+        return cls.from_series(series['cbr'], series['ruonia'], series['usd_rub'])
+
+    def __len__(self):
+        return len(self.dates)
+
+    def windows(self, months, step=1):
+        """
+        Все окна длиной months месяцев, начинающиеся каждые step месяцев
+
+        Returns (start dates, cbr (windows, months), ruonia (windows, months),
+        fx (windows, months + 1)) - fx includes the rate at the end of the last
+        month. The arrays are read-only views of the history, not copies.
+        """
+        count = len(self) - months
+        if count < 1:
+            raise ValueError(f"{len(self)} months of history are too few for {months}-month windows")
+        starts = slice(0, count, step)
+        return (self.dates[starts],
+                sliding_window_view(self.cbr, months)[starts],
+                sliding_window_view(self.ruonia, months)[starts],
+                sliding_window_view(self.fx, months + 1)[starts])
+
+
+class HistoricalBacktest:
+    """
+    Rolling-window backtest of the rebalancing policies.
+
+    Every window starts with the optimizer's initial capital. Decisions use
+    only what is known at the start of the month: the current key rate and
+    RUONIA, and USD/RUB as a random walk (no expected FX gain beyond the
+    spread). Returns are realized: RUONIA-linked instruments earn the
+    realized RUONIA, deposits CBR - 0.5%, USD the realized monthly FX move.
+    All windows are simulated together; the loop runs over months only.
+    """
+
+    def __init__(self, history, years=3, step_months=1, rebalancer=None, two_tier=None):
+        # Импорт здесь: dynamic_rebalancer и two_tier_strategy тянут весь оптимизатор
+        from dynamic_rebalancer import DynamicRebalancer
+        from two_tier_strategy import TwoTierStrategy
+
+        self.history = history
+        self.months = years * MONTHS_PER_YEAR
+        self.rebalancer = rebalancer if rebalancer is not None else DynamicRebalancer()
+        self.two_tier = two_tier if two_tier is not None else TwoTierStrategy()
+        self.start_dates, self.cbr, self.ruonia, self.fx = history.windows(self.months, step_months)
+
+    def __len__(self):
+        return len(self.start_dates)
+
+    def yields(self):
+        """(decision yields, realized yields): (windows, months, n) annual after-tax %"""
+        table = self.rebalancer.instrument_table
+        cbr, ruonia = self.cbr[..., None], self.ruonia[..., None]
+        fx_start = self.fx[:, :-1, None]
+        decision = table.after_tax_yields(cbr, fx_start, fx_start, self.rebalancer.usd_spread_pct,
+                                          ruonia_rate=ruonia)
+        # Месячное изменение курса в годовом выражении (доходы делятся на 12 как у ставок)
+        fx_move = (self.fx[:, 1:, None] / fx_start - 1) * MONTHS_PER_YEAR * 100
+        realized = (table.after_tax_yields(cbr, 1.0, 1.0, 0.0, ruonia_rate=ruonia)
+                    + np.where(table.is_usd, fx_move, 0.0))
+        return decision, realized
+
+    def run(self, policies=BACKTEST_POLICIES):
+        """Распределение дохода и итогового капитала по окнам для каждой политики"""
+        unknown = set(policies) - set(BACKTEST_POLICIES)
+        if unknown:
+            raise ValueError(f"Unknown policies: {sorted(unknown)}; expected {BACKTEST_POLICIES}")
+        decision, realized = self.yields()
+        results = []
+        for policy in policies:
+            if policy == 'two_tier':
+                results.append(self.two_tier.two_tier_batch(self.cbr, self.ruonia))
+            else:
+                results.append(self.rebalancer.rebalance_batch(decision, realized, policy))
+        return BacktestResult(
+            policies, self.start_dates,
+            MonteCarloResult(np.concatenate([r.monthly_income for r in results]),
+                             np.concatenate([r.terminal_capital for r in results]),
+                             self.rebalancer.monthly_income_target))
+
+
+class BacktestResult:
+    """
+    Outcomes of every policy in every window: result.monthly_income
+    (policies, windows, months) and result.terminal_capital (policies, windows).
+    """
+
+    def __init__(self, policies, start_dates, result):
+        self.policies = tuple(policies)
+        self.start_dates = start_dates
+        self.result = result
+
+    def __len__(self):
+        return len(self.start_dates)
+
+    def policy(self, name):
+        """(monthly income (windows, months), terminal capital (windows,)) of one policy"""
+        index = self.policies.index(name)
+        return self.result.monthly_income[index], self.result.terminal_capital[index]
+
+    def summary(self, percentiles=(5, 50, 95)):
+        """Строка на политику: перцентили дохода и капитала по окнам, худшее окно"""
+        rows = []
+        for index, name in enumerate(self.policies):
+            row = {'policy': name, **self.result.summary(index, percentiles)}
+            del row['paths']
+            worst = int(np.argmin(self.result.terminal_capital[index]))
+            row['worst_start'] = self.start_dates[worst].strftime('%Y-%m')
+            rows.append(row)
+        return pd.DataFrame(rows).set_index('policy')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest rebalancing policies on historical rates")
+    parser.add_argument('--history-dir', default=DEFAULT_HISTORY_DIR,
+                        help=f"directory with {', '.join(HISTORY_FILES.values())}")
+    parser.add_argument('--years', type=int, default=3, help="window length in years")
+    parser.add_argument('--step', type=int, default=1, help="months between window starts")
+    args = parser.parse_args(argv)
+
+    try:
+        history = MarketHistory.from_csv(args.history_dir)
+        backtest = HistoricalBacktest(history, args.years, args.step)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
+
+    result = backtest.run()
+    print(f"\n📜 История: {history.dates[0]:%Y-%m} - {history.dates[-1]:%Y-%m}, "
+          f"{len(backtest)} окон по {backtest.months} мес. (шаг {args.step} мес.)")
+    summary = result.summary()
+    columns = ['mean_monthly_income', 'monthly_income_p5', 'monthly_income_p95',
+               'mean_terminal_capital', 'terminal_capital_p5', 'terminal_capital_p95',
+               'prob_income_below_target', 'worst_start']
+    print(summary[columns].to_string(float_format=lambda v: f"{v:,.2f}" if abs(v) <= 1 else f"{v:,.0f}"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
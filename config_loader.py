@@ -5,70 +5,205 @@ Loads instruments and forecasts from YAML files
 
 import yaml
 import os
+import sys
+import json
+import threading
+from types import MappingProxyType
+
+import numpy as np
+
+# Compiled binary snapshot of both YAML files (see ConfigLoader.compile_snapshot)
+SNAPSHOT_FILENAME = 'config_snapshot.npz'
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_SOURCES = ('instruments_config.yaml', 'forecasts_config.yaml')
+
+# Process-wide cache of parsed YAML documents.
+# Key: absolute path -> (mtime_ns, size, frozen document)
+_yaml_cache = {}
+_yaml_cache_lock = threading.Lock()
+_yaml_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+# Key: absolute snapshot path -> (snapshot stamp, header, frozen snapshot)
+_snapshot_cache = {}
+
+
+def _freeze(obj):
+    """Recursively convert dicts/lists into read-only views"""
+    if isinstance(obj, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in obj.items()})
+    if isinstance(obj, list):
+        return tuple(_freeze(v) for v in obj)
+    return obj
+
+
+def _thaw(obj):
+    """Recursively convert read-only views back into mutable dicts/lists"""
+    if isinstance(obj, (dict, MappingProxyType)):
+        return {k: _thaw(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_thaw(v) for v in obj]
+    return obj
+
+
+def _file_stamp(path):
+    """(mtime_ns, size) of a file - changes whenever the file is edited"""
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def load_yaml_cached(path):
+    """
+    Parse a YAML file once per (path, mtime, size) and return an immutable view.
+
+    The returned object is shared between all callers in the process,
+    so it is frozen (MappingProxyType / tuple) to prevent accidental mutation.
+    """
+    path = os.path.abspath(path)
+    stamp = _file_stamp(path)
+
+    with _yaml_cache_lock:
+        entry = _yaml_cache.get(path)
+        if entry is not None and entry[:2] == stamp:
+            _yaml_cache_stats['hits'] += 1
+            return entry[2]
+        _yaml_cache_stats['misses'] += 1
+
+    with open(path, 'r', encoding='utf-8') as f:
+        document = _freeze(yaml.safe_load(f))
+
+    with _yaml_cache_lock:
+        _yaml_cache[path] = (stamp[0], stamp[1], document)
+
+    return document
+
+
+def invalidate_config_cache(path=None):
+    """Drop one cached file (or the whole cache if path is None)"""
+    with _yaml_cache_lock:
+        if path is None:
+            dropped = len(_yaml_cache) + len(_snapshot_cache)
+            _yaml_cache.clear()
+            _snapshot_cache.clear()
+        else:
+            path = os.path.abspath(path)
+            dropped = sum(1 for cache in (_yaml_cache, _snapshot_cache)
+                          if cache.pop(path, None) is not None)
+        _yaml_cache_stats['invalidations'] += dropped
+    return dropped
+
+
+def config_cache_info():
+    """Hit/miss counters and the list of cached files"""
+    with _yaml_cache_lock:
+        info = dict(_yaml_cache_stats)
+        info['entries'] = sorted(list(_yaml_cache.keys()) + list(_snapshot_cache.keys()))
+    total = info['hits'] + info['misses']
+    info['hit_rate'] = info['hits'] / total if total else 0.0
+    return info
+
+
+def _snapshot_arrays(prefix, series):
+    """Pack {name: [values]} into names / padded matrix / lengths arrays"""
+    names = list(series.keys())
+    width = max([len(v) for v in series.values()], default=0)
+    matrix = np.full((len(names), width), np.nan)
+    lengths = np.zeros(len(names), dtype=np.int64)
+    for i, name in enumerate(names):
+        values = series[name]
+        matrix[i, :len(values)] = values
+        lengths[i] = len(values)
+    return {
+        f'{prefix}_names': np.array(names, dtype=str),
+        f'{prefix}_values': matrix,
+        f'{prefix}_lengths': lengths,
+    }
+
+
+def _unpack_series(data, prefix):
+    """Inverse of _snapshot_arrays"""
+    names = data[f'{prefix}_names'].tolist()
+    matrix = data[f'{prefix}_values']
+    lengths = data[f'{prefix}_lengths']
+    return {name: tuple(matrix[i, :lengths[i]].tolist()) for i, name in enumerate(names)}
+
 
 class ConfigLoader:
-    """Loads configuration from YAML files"""
+    """
+    Loads configuration from YAML files (or, with use_snapshot=True, from the
+    compiled binary snapshot, which is written next to the YAML files)
+    """
     
-    def __init__(self, config_dir=None):
+    def __init__(self, config_dir=None, use_snapshot=False):
         if config_dir is None:
             config_dir = os.path.dirname(os.path.abspath(__file__))
         self.config_dir = config_dir
+        self.use_snapshot = use_snapshot
+        self.snapshot_path = os.path.join(config_dir, SNAPSHOT_FILENAME)
+    
+    def _source_paths(self):
+        return {name: os.path.join(self.config_dir, name) for name in SNAPSHOT_SOURCES}
         
     def load_instruments(self):
-        """Load instruments configuration"""
+        """Load instruments configuration (mutable copy of the cached document)"""
+        if self.use_snapshot:
+            return _thaw(self.load_snapshot()['instruments'])
+        
         config_path = os.path.join(self.config_dir, 'instruments_config.yaml')
         
         if not os.path.exists(config_path):
             raise FileNotFoundError(f"Instruments config not found: {config_path}")
         
-        with open(config_path, 'r', encoding='utf-8') as f:
-            instruments = yaml.safe_load(f)
+        instruments = load_yaml_cached(config_path)
         
         # Remove metadata and templates, keep only instruments
         if instruments:
-            instruments = {k: v for k, v in instruments.items() if isinstance(v, dict) and 'type' in v}
+            instruments = {k: _thaw(v) for k, v in instruments.items()
+                           if isinstance(v, MappingProxyType) and 'type' in v}
         
         return instruments
     
     def load_forecasts(self):
-        """Load forecasts configuration"""
+        """Load forecasts configuration (mutable copy of the cached document)"""
+        return _thaw(self._forecasts_document())
+    
+    def _forecasts_document(self):
+        """Cached forecasts document (read-only view, shared process-wide)"""
         config_path = os.path.join(self.config_dir, 'forecasts_config.yaml')
         
         if not os.path.exists(config_path):
             raise FileNotFoundError(f"Forecasts config not found: {config_path}")
         
-        with open(config_path, 'r', encoding='utf-8') as f:
-            forecasts = yaml.safe_load(f)
-        
-        return forecasts
+        return load_yaml_cached(config_path)
     
     def get_cbr_scenarios(self):
         """Get CBR rate scenarios"""
-        forecasts = self.load_forecasts()
-        cbr_data = forecasts.get('cbr_scenarios', {})
-        
-        scenarios = {}
-        for scenario_name, scenario_data in cbr_data.items():
-            if isinstance(scenario_data, dict) and 'rates' in scenario_data:
-                scenarios[scenario_name] = scenario_data['rates']
-        
-        return scenarios
+        if self.use_snapshot:
+            return {k: list(v) for k, v in self.load_snapshot()['cbr_scenarios'].items()}
+        return self._parse_scenarios('cbr_scenarios')
     
     def get_fx_scenarios(self):
         """Get FX rate scenarios"""
-        forecasts = self.load_forecasts()
-        fx_data = forecasts.get('fx_scenarios', {})
+        if self.use_snapshot:
+            return {k: list(v) for k, v in self.load_snapshot()['fx_scenarios'].items()}
+        return self._parse_scenarios('fx_scenarios')
+    
+    def _parse_scenarios(self, section):
+        """Extract {scenario: rates} from a forecasts_config.yaml section"""
+        forecasts = self._forecasts_document()
+        section_data = forecasts.get(section, {})
         
         scenarios = {}
-        for scenario_name, scenario_data in fx_data.items():
-            if isinstance(scenario_data, dict) and 'rates' in scenario_data:
-                scenarios[scenario_name] = scenario_data['rates']
+        for scenario_name, scenario_data in section_data.items():
+            if isinstance(scenario_data, MappingProxyType) and 'rates' in scenario_data:
+                scenarios[scenario_name] = list(scenario_data['rates'])
         
         return scenarios
     
     def get_structured_bond_coupons(self, bond_name='Структурная облигация Сбер'):
         """Get structured bond monthly coupon forecast"""
-        forecasts = self.load_forecasts()
+        if self.use_snapshot:
+            return list(self.load_snapshot()['structured_bond_coupons'].get(bond_name, ()))
+        
+        forecasts = self._forecasts_document()
         bond_data = forecasts.get('structured_bond_coupons', {}).get(bond_name, {})
         
         if 'monthly_coupons' in bond_data:
@@ -78,6 +213,120 @@ class ConfigLoader:
         
         return []
     
+    def get_instrument_description(self, instrument_name):
+        """Long description text (kept out of the snapshot, read from YAML on demand)"""
+        config_path = os.path.join(self.config_dir, 'instruments_config.yaml')
+        if not os.path.exists(config_path):
+            return None
+        instrument = load_yaml_cached(config_path).get(instrument_name)
+        if isinstance(instrument, MappingProxyType):
+            return instrument.get('description')
+        return None
+    
+    def compile_snapshot(self, write=True):
+        """
+        Compile both YAML files into a compact binary snapshot (.npz).
+        
+        The snapshot keeps only what the engines read: instrument parameters
+        (without long 'description' texts), rate/FX scenarios and coupon forecasts.
+        A JSON header records the (mtime, size) of the source files so a stale
+        snapshot is detected and rebuilt automatically. The stamps are taken
+        before parsing; if a file changes while it is parsed, the snapshot is
+        not written (the stale stamps make the next load compile again).
+        """
+        source_paths = self._source_paths()
+        sources = {name: list(_file_stamp(path)) for name, path in source_paths.items()}
+        yaml_loader = ConfigLoader(self.config_dir, use_snapshot=False)
+        
+        instruments = yaml_loader.load_instruments()
+        for data in instruments.values():
+            data.pop('description', None)
+        
+        bond_names = [name for name, data in instruments.items() if data.get('variable_coupon', False)]
+        coupons = {name: yaml_loader.get_structured_bond_coupons(name) for name in bond_names}
+        
+        header = {'format': SNAPSHOT_FORMAT_VERSION, 'sources': sources}
+        
+        arrays = {
+            'header': np.array(json.dumps(header)),
+            'instruments': np.array(json.dumps(instruments, ensure_ascii=False, default=str)),
+        }
+        arrays.update(_snapshot_arrays('cbr', yaml_loader.get_cbr_scenarios()))
+        arrays.update(_snapshot_arrays('fx', yaml_loader.get_fx_scenarios()))
+        arrays.update(_snapshot_arrays('coupons', coupons))
+        
+        # Файл изменился во время разбора: снимок мог смешать старое и новое содержимое
+        if any(list(_file_stamp(path)) != sources[name] for name, path in source_paths.items()):
+            write = False
+        
+        if write:
+            tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    np.savez(f, **arrays)
+                os.replace(tmp_path, self.snapshot_path)
+            except OSError:
+                # Read-only deployment: keep working from the in-memory result
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        
+        return arrays
+    
+    def _snapshot_is_fresh(self, header):
+        """True if the snapshot was compiled from the current YAML files"""
+        if header.get('format') != SNAPSHOT_FORMAT_VERSION:
+            return False
+        for name, path in self._source_paths().items():
+            if not os.path.exists(path):
+                continue  # Deployed without YAML - trust the snapshot
+            if list(_file_stamp(path)) != header.get('sources', {}).get(name):
+                return False
+        return True
+    
+    def load_snapshot(self, auto_compile=True):
+        """
+        Load the compiled snapshot (frozen, shared process-wide).
+        
+        If the snapshot is missing or older than the YAML files it is rebuilt
+        first (when auto_compile=True).
+        """
+        path = os.path.abspath(self.snapshot_path)
+        stamp = _file_stamp(path) if os.path.exists(path) else None
+        
+        with _yaml_cache_lock:
+            entry = _snapshot_cache.get(path)
+        if entry is not None and entry[0] == stamp and self._snapshot_is_fresh(entry[1]):
+            with _yaml_cache_lock:
+                _yaml_cache_stats['hits'] += 1
+            return entry[2]
+        
+        arrays = None
+        if stamp is not None:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {key: data[key] for key in data.files}
+            if not self._snapshot_is_fresh(json.loads(arrays['header'].item())):
+                arrays = None
+        
+        if arrays is None:
+            if not auto_compile:
+                raise FileNotFoundError(f"Config snapshot missing or stale: {path}")
+            arrays = self.compile_snapshot()
+            stamp = _file_stamp(path) if os.path.exists(path) else None
+        
+        header = json.loads(arrays['header'].item())
+        snapshot = MappingProxyType({
+            'instruments': _freeze(json.loads(arrays['instruments'].item())),
+            'cbr_scenarios': MappingProxyType(_unpack_series(arrays, 'cbr')),
+            'fx_scenarios': MappingProxyType(_unpack_series(arrays, 'fx')),
+            'structured_bond_coupons': MappingProxyType(_unpack_series(arrays, 'coupons')),
+        })
+        
+        with _yaml_cache_lock:
+            _yaml_cache_stats['misses'] += 1
+            _snapshot_cache[path] = (stamp, header, snapshot)
+        
+        return snapshot
+    
     def update_instrument_with_forecast(self, instrument_name, instrument_data):
         """Update instrument data with forecast information"""
         
@@ -99,6 +348,14 @@ class ConfigLoader:
 
 
 if __name__ == "__main__":
+    if '--compile' in sys.argv[1:]:
+        # Build step: python config_loader.py --compile
+        loader = ConfigLoader()
+        loader.compile_snapshot()
+        size_kb = os.path.getsize(loader.snapshot_path) / 1024
+        print(f"✅ Compiled {loader.snapshot_path} ({size_kb:.1f} KB)")
+        sys.exit(0)
+    
     # Test the loader
     loader = ConfigLoader()
     
@@ -133,6 +390,12 @@ if __name__ == "__main__":
     print(f"   ✅ Loaded {len(coupons)} monthly coupons:")
     print(f"      Min: {min(coupons)}%, Max: {max(coupons)}%, Avg: {sum(coupons)/len(coupons):.2f}%")
     
+    # Test parse-once cache
+    print("\n5. Config cache statistics...")
+    info = config_cache_info()
+    print(f"   ✅ Files parsed: {info['misses']}, cache hits: {info['hits']} "
+          f"(hit rate {info['hit_rate']*100:.0f}%)")
+    
     print("\n" + "="*80)
     print("✅ ALL CONFIGURATION LOADED SUCCESSFULLY!")
     print("="*80)
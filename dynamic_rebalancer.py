@@ -4,16 +4,120 @@ Allows moving investments between instruments each month
 """
 
 from portfolio_optimizer import DynamicPortfolioOptimizer
+from qp_solver import solve_concentration_qp
+from monte_carlo import MonteCarloResult
+from path_set import get_path_set, paired_difference
+from rebalancing_dp import simplex_grid, solve_rebalancing_schedule
 import pandas as pd
 import numpy as np
-from scipy.optimize import minimize
+
+class RebalancingResult:
+    """
+    Результаты optimize_with_monthly_rebalancing по месяцам, столбцами
+    
+    capital, monthly_income, return_pct, rebalanced and month are contiguous
+    arrays (one value per month), weights is a (months × instruments) matrix
+    in instrument_names order. All arrays are read-only.
+    
+    result[i] still returns the old per-month dict (month, year,
+    month_in_year, capital, monthly_income, return_pct, rebalanced, weights),
+    built on demand; result[a:b] and year(y) are views sharing the arrays;
+    to_dataframe() builds (and keeps) a DataFrame with one weight column per
+    instrument.
+    """
+    
+    def __init__(self, instrument_names, capital, monthly_income, return_pct, rebalanced, weights,
+                 month=None):
+        self.instrument_names = tuple(instrument_names)
+        self.capital = capital
+        self.monthly_income = monthly_income
+        self.return_pct = return_pct
+        self.rebalanced = rebalanced
+        self.weights = weights
+        self.month = np.arange(1, len(capital) + 1) if month is None else month
+        for array in (self.capital, self.monthly_income, self.return_pct, self.rebalanced,
+                      self.weights, self.month):
+            array.setflags(write=False)
+        self._frame = None
+    
+    @property
+    def year(self):
+        return (self.month - 1) // 12 + 1
+    
+    @property
+    def month_in_year(self):
+        return (self.month - 1) % 12 + 1
+    
+    def __len__(self):
+        return len(self.month)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RebalancingResult(self.instrument_names, self.capital[index], self.monthly_income[index],
+                                     self.return_pct[index], self.rebalanced[index], self.weights[index],
+                                     self.month[index])
+        month = int(self.month[index])
+        return {
+            'month': month,
+            'year': (month - 1) // 12 + 1,
+            'month_in_year': (month - 1) % 12 + 1,
+            'capital': self.capital[index],
+            'monthly_income': self.monthly_income[index],
+            'return_pct': self.return_pct[index],
+            'rebalanced': bool(self.rebalanced[index]),
+            'weights': {name: self.weights[index, i] for i, name in enumerate(self.instrument_names)},
+        }
+    
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+    
+    def year_slice(self, year):
+        """Месяцы года year (1, 2, ...) - срез без копирования"""
+        start, stop = np.searchsorted(self.month, [(year - 1) * 12 + 1, year * 12 + 1])
+        return self[start:stop]
+    
+    def to_dataframe(self):
+        """Таблица по месяцам (строится один раз)"""
+        if self._frame is None:
+            frame = pd.DataFrame({
+                'month': self.month,
+                'year': self.year,
+                'month_in_year': self.month_in_year,
+                'capital': self.capital,
+                'monthly_income': self.monthly_income,
+                'return_pct': self.return_pct,
+                'rebalanced': self.rebalanced,
+            })
+            weights = pd.DataFrame(self.weights, columns=list(self.instrument_names))
+            self._frame = pd.concat([frame, weights], axis=1)
+        return self._frame
+
 
 class DynamicRebalancer(DynamicPortfolioOptimizer):
     """Optimizer with monthly rebalancing capability"""
     
-    def __init__(self, use_yaml_config=True, transaction_cost_pct=0.1):
+    # Вес штрафа за концентрацию в месячной задаче: -r·w + 5·||w||²
+    CONCENTRATION_WEIGHT = 5
+    
+    def __init__(self, use_yaml_config=True, transaction_cost_pct=0.1, month_solver='qp',
+                 schedule_grid_step=0.05, drift_band=0.10, gain_band_pct=0.0, band_horizon_months=12):
         super().__init__(use_yaml_config)
         self.transaction_cost_pct = transaction_cost_pct  # Комиссия за перемещение (%)
+        self.month_solver = month_solver  # 'qp' (точная проекция) или 'slsqp'
+        self.schedule_grid_step = schedule_grid_step  # Шаг сетки весов для 'optimal' (доля)
+        # Полоса без сделок для 'threshold': отклонение от цели (сумма |Δw|) и
+        # чистая ожидаемая выгода (% капитала), выше которых портфель ребалансируется
+        self.drift_band = drift_band
+        self.gain_band_pct = gain_band_pct
+        # Сколько месяцев (не дольше конца горизонта) засчитывается выгода сделки -
+        # одинаково для прогноза, путей и бэктеста
+        self.band_horizon_months = band_horizon_months
+        # Повторное решение месячной задачи только при изменении ее входных данных
+        self.use_incremental_solve = True
+        self._last_month_solve = None
+        self.month_solves = 0
+        self.month_solves_skipped = 0
         
     def optimize_with_monthly_rebalancing(self, rate_scenario='base', fx_scenario='base',
                                          capital_scenario='constant', years=3,
@@ -22,147 +126,309 @@ class DynamicRebalancer(DynamicPortfolioOptimizer):
         Оптимизация с возможностью ежемесячной ребалансировки
         
         Parameters:
-        - rebalance_frequency: 'monthly', 'quarterly', 'annual', or 'none'
+        - rebalance_frequency: 'monthly', 'quarterly', 'annual', 'none', 'optimal' or 'threshold'
         - Каждый период пересчитываем оптимальные веса
         - Учитываем комиссии за перемещение средств
+        - 'optimal': моменты и веса ребалансировок выбирает optimal_rebalancing_schedule
+          (максимум итогового капитала с учетом комиссий) вместо фиксированного календаря
+        - 'threshold': веса пересматриваются только в месяцы, когда меняются данные задачи
+          (в остальные месяцы оптимизатор не вызывается), а сделка совершается, только если
+          отклонение от новой цели или чистая выгода выходят за полосу (_band_exceeded)
         """
         
         months_total = years * 12
         
+        # Доходности инструментов на начало каждого месяца (из кривых прогнозов)
+        month_yields = self.monthly_yield_matrix(months_total, rate_scenario, fx_scenario)
+        
         # Determine rebalancing periods
-        if rebalance_frequency == 'monthly':
-            rebalance_months = list(range(months_total))
-        elif rebalance_frequency == 'quarterly':
-            rebalance_months = list(range(0, months_total, 3))
-        elif rebalance_frequency == 'annual':
-            rebalance_months = list(range(0, months_total, 12))
-        else:  # 'none'
-            rebalance_months = [0]  # Only initial allocation
+        if rebalance_frequency == 'optimal':
+            planned_weights = self.optimal_rebalancing_schedule(month_yields)
+            rebalance_months = list(planned_weights)
+        elif rebalance_frequency == 'threshold':
+            # События - месяцы, в которые меняются доходности (и значит цель)
+            planned_weights = None
+            rebalance_months = self._input_change_months(month_yields)
+        else:
+            planned_weights = None
+            rebalance_months = self._rebalance_months(rebalance_frequency, months_total)
+        rebalance_months = set(rebalance_months)
         
         # Initialize
+        table = self.instrument_table
         total_capital = self.initial_capital_rub + self.initial_usd_amount * self.current_usd_rub
         current_capital = total_capital
-        current_weights = {inst: 0 for inst in self.instruments.keys()}
         
         # Initial allocation (month 0)
-        current_weights = self._optimize_for_month(0, rate_scenario, fx_scenario)
+        if planned_weights is not None:
+            current_weights = planned_weights[0]
+        else:
+            current_weights = self._optimize_for_month(0, rate_scenario, fx_scenario, month_yields[0])
         
-        monthly_results = []
+        # Результаты по месяцам - столбцами (без словаря на каждый месяц)
+        capital = np.empty(months_total)
+        income = np.empty(months_total)
+        return_pct = np.empty(months_total)
+        rebalanced = np.zeros(months_total, dtype=bool)
+        rebalanced[0] = True
+        weights = np.empty((months_total, len(table)))
         
         for month in range(months_total):
-            year_idx = month // 12
-            month_in_year = month % 12
-            
             # Check if we should rebalance this month
             if month in rebalance_months and month > 0:
                 # Calculate optimal weights for current conditions
-                new_weights = self._optimize_for_month(month, rate_scenario, fx_scenario)
+                if planned_weights is not None:
+                    new_weights = planned_weights[month]
+                else:
+                    new_weights = self._optimize_for_month(month, rate_scenario, fx_scenario,
+                                                           month_yields[month])
                 
-                # Calculate transaction costs
-                transaction_cost = self._calculate_rebalancing_cost(
-                    current_weights, new_weights, current_capital
-                )
+                # Порог: торгуем, только если отклонение или выгода выходят за полосу
+                trade = True
+                if rebalance_frequency == 'threshold':
+                    trade = bool(self._band_exceeded(table.weights_vector(current_weights),
+                                                     table.weights_vector(new_weights),
+                                                     month_yields[month], months_total - month))
                 
-                # Apply new weights
-                current_weights = new_weights
-                current_capital -= transaction_cost
+                if trade:
+                    # Calculate transaction costs
+                    transaction_cost = self._calculate_rebalancing_cost(
+                        current_weights, new_weights, current_capital
+                    )
+                    
+                    # Apply new weights
+                    current_weights = new_weights
+                    current_capital -= transaction_cost
+                    rebalanced[month] = True
             
             # Calculate returns for this month
-            monthly_return = self._calculate_monthly_return(
-                current_weights, year_idx, month_in_year, rate_scenario, fx_scenario
-            )
+            monthly_return = self._calculate_monthly_return(current_weights, month_yields[month])
             
             monthly_income = current_capital * monthly_return
             current_capital += monthly_income
             
-            monthly_results.append({
-                'month': month + 1,
-                'year': year_idx + 1,
-                'month_in_year': month_in_year + 1,
-                'capital': current_capital,
-                'monthly_income': monthly_income,
-                'return_pct': monthly_return * 100,
-                'rebalanced': month in rebalance_months,
-                'weights': current_weights.copy()
-            })
+            capital[month] = current_capital
+            income[month] = monthly_income
+            return_pct[month] = monthly_return * 100
+            weights[month] = table.weights_vector(current_weights)
+        
+        return RebalancingResult(table.names, capital, income, return_pct, rebalanced, weights)
+    
+    @staticmethod
+    def _rebalance_months(rebalance_frequency, months_total):
+        """Месяцы, в которые пересчитываются веса"""
+        if rebalance_frequency == 'monthly':
+            return list(range(months_total))
+        elif rebalance_frequency == 'quarterly':
+            return list(range(0, months_total, 3))
+        elif rebalance_frequency == 'annual':
+            return list(range(0, months_total, 12))
+        else:  # 'none'
+            return [0]  # Only initial allocation
+    
+    @staticmethod
+    def _input_change_months(month_yields):
+        """Месяц 0 и месяцы, в которые строка доходностей отличается от предыдущей"""
+        changed = np.any(np.diff(month_yields, axis=0) != 0, axis=-1)
+        return [0] + list(np.flatnonzero(changed) + 1)
+    
+    def _band_exceeded(self, current_weights, target_weights, annual_yields, months_left):
+        """
+        Выходит ли сделка current -> target за полосу без сделок (векторно по строкам)
+        
+        Drift is the moved share sum |Δw|; the expected gain is the yield
+        pick-up over band_horizon_months (at most the months_left until the
+        end of the horizon) net of transaction_cost_pct on the moved share,
+        as a percentage of capital.
+        """
+        months_held = min(self.band_horizon_months, months_left)
+        change = np.asarray(target_weights) - np.asarray(current_weights)
+        moved = np.abs(change).sum(axis=-1)
+        gain_pct = (change * annual_yields).sum(axis=-1) * months_held / 12
+        net_gain_pct = gain_pct - moved * self.transaction_cost_pct
+        return (moved > self.drift_band) | (net_gain_pct > self.gain_band_pct)
+    
+    def optimal_rebalancing_schedule(self, month_yields):
+        """
+        Оптимальный план ребалансировок: {месяц: веса} для месяцев, где веса меняются
+        
+        Backward induction (rebalancing_dp) over all weight vectors on a
+        schedule_grid_step grid within the instrument bounds; trades cost
+        transaction_cost_pct of the moved capital. Month 0 is always included.
+        """
+        table = self.instrument_table
+        grid = simplex_grid(table.lower, table.upper, int(round(1 / self.schedule_grid_step)))
+        path, _ = solve_rebalancing_schedule(month_yields, grid, self.transaction_cost_pct)
+        return {month: table.weights_dict(grid[state]) for month, state in enumerate(path)
+                if month == 0 or state != path[month - 1]}
+    
+    def simulate_rebalancing_on_paths(self, path_set, rate_scenario='base', fx_scenario='base',
+                                      rebalance_frequency='monthly'):
+        """
+        optimize_with_monthly_rebalancing на каждом пути path_set сразу
+        
+        Same rules as the deterministic version, but the yields of each month
+        (and thus every rebalancing decision) come from the simulated path.
+        Month problems are solved as the exact concentration QP for all paths
+        at once, whatever month_solver is. 'optimal' applies the plan of
+        optimal_rebalancing_schedule (built on the forecast) to every path;
+        'threshold' reviews a path in the months its yields change (every month
+        on noisy paths) and trades only the paths outside the band.
+        Returns a MonteCarloResult, so strategies evaluated on the same
+        path_set can be compared pairwise.
+        """
+        month_yields = path_set.month_yields(self, rate_scenario, fx_scenario)  # (paths, months, n)
+        plan = None
+        if rebalance_frequency == 'optimal':
+            plan = self.optimal_rebalancing_schedule(
+                self.monthly_yield_matrix(path_set.months, rate_scenario, fx_scenario))
+        return self.rebalance_batch(month_yields, month_yields, rebalance_frequency, plan)
+    
+    def rebalance_batch(self, decision_yields, realized_yields, rebalance_frequency='monthly', plan=None):
+        """
+        Правила optimize_with_monthly_rebalancing для многих независимых строк сразу
+        
+        decision_yields: (rows, months, n) annual after-tax yields (%) the
+        rebalancer sees when choosing weights; realized_yields: the yields the
+        portfolio actually earns (the same array on simulated paths, realized
+        returns in a historical backtest). Rows are simulated paths or
+        historical windows; the loop runs over months only. plan is the
+        {month: weights} schedule for 'optimal'.
+        Returns a MonteCarloResult with one portfolio.
+        """
+        table = self.instrument_table
+        rows, months_total = decision_yields.shape[:2]
+        
+        if rebalance_frequency == 'optimal':
+            if plan is None:
+                raise ValueError("rebalance_frequency='optimal' needs a plan")
+            rebalance_months = set(plan)
+            
+            def optimal_weights(month):
+                return np.broadcast_to(table.weights_vector(plan[month]), (rows, len(table)))
+        else:
+            if rebalance_frequency == 'threshold':
+                rebalance_months = set(range(months_total))  # доходности строки меняются каждый месяц
+            else:
+                rebalance_months = set(self._rebalance_months(rebalance_frequency, months_total))
+            
+            def optimal_weights(month):
+                return solve_concentration_qp(decision_yields[:, month], self.CONCENTRATION_WEIGHT,
+                                              table.lower, table.upper)
+        
+        total_capital = self.initial_capital_rub + self.initial_usd_amount * self.current_usd_rub
+        capital = np.full(rows, float(total_capital))
+        monthly_income = np.empty((1, rows, months_total))
+        weights = optimal_weights(0)
         
-        return monthly_results
+        for month in range(months_total):
+            if month in rebalance_months and month > 0:
+                new_weights = optimal_weights(month)
+                if rebalance_frequency == 'threshold':
+                    # Как в optimize_with_monthly_rebalancing: строка пересматривается, только
+                    # если ее доходности изменились, и торгует, только выйдя за полосу
+                    changed = np.any(decision_yields[:, month] != decision_yields[:, month - 1], axis=-1)
+                    trade = changed & self._band_exceeded(weights, new_weights, decision_yields[:, month],
+                                                          months_total - month)
+                    new_weights = np.where(trade[:, None], new_weights, weights)
+                moved = np.abs(new_weights - weights).sum(axis=1)
+                capital = capital - capital * moved * self.transaction_cost_pct / 100
+                weights = new_weights
+            
+            effective = np.where(weights > 0.001, weights, 0.0)
+            monthly_return = (effective * realized_yields[:, month]).sum(axis=1) / 12 / 100
+            income = capital * monthly_return
+            monthly_income[0, :, month] = income
+            capital = capital + income
+        
+        return MonteCarloResult(monthly_income, capital[None, :], self.monthly_income_target)
     
-    def _optimize_for_month(self, month, rate_scenario, fx_scenario):
+    def _optimize_for_month(self, month, rate_scenario, fx_scenario, adjusted_yields=None):
         """Оптимизация для конкретного месяца с учетом прогноза"""
-        year_idx = month // 12
+        table = self.instrument_table
+        n_instruments = len(table)
+        
+        # Ожидаемая доходность инструментов на ближайший год (вектор)
+        if adjusted_yields is None:
+            adjusted_yields = self.monthly_yield_matrix(month + 1, rate_scenario, fx_scenario)[month]
         
-        instruments_list = list(self.instruments.keys())
-        n_instruments = len(instruments_list)
+        # Задача месяца полностью определяется этими данными: при шаговых кривых
+        # они одинаковы для всех месяцев прогнозного года
+        inputs = (self.month_solver, self.CONCENTRATION_WEIGHT, table.names, table.lower.tobytes(),
+                  table.upper.tobytes(), np.asarray(adjusted_yields, dtype=float).tobytes())
+        if self.use_incremental_solve and self._can_reuse_month_solve(inputs):
+            self.month_solves_skipped += 1
+            return dict(self._last_month_solve['weights'])
+        self.month_solves += 1
+        
+        if self.month_solver == 'qp':
+            # Выпуклая QP: точное решение проекцией на симплекс с границами
+            optimal_weights = solve_concentration_qp(
+                adjusted_yields, self.CONCENTRATION_WEIGHT, table.lower, table.upper
+            )
+            weights = table.weights_dict(optimal_weights)
+            self._last_month_solve = {'inputs': inputs, 'weights': weights, 'fixed_point': True}
+            return dict(weights)
         
         def objective(weights_array):
-            weights_dict = {instrument: weights_array[i] 
-                          for i, instrument in enumerate(instruments_list)}
-            
             # Рассчитываем ожидаемую доходность на ближайший год
-            expected_return = 0
-            for instrument, weight in weights_dict.items():
-                base_yield = self.instruments[instrument]['yield']
-                adjusted_yield = self.calculate_after_tax_yield(
-                    instrument, base_yield, year_idx, rate_scenario
-                )
-                expected_return += weight * adjusted_yield
+            expected_return = float(weights_array @ adjusted_yields)
             
             # Минимизируем отрицательную доходность (= максимизируем доходность)
             # Плюс штраф за концентрацию
-            concentration_penalty = sum([w**2 for w in weights_array]) * 5
+            concentration_penalty = float(weights_array @ weights_array) * self.CONCENTRATION_WEIGHT
             
-            return -expected_return + concentration_penalty
-        
-        # Ограничения и границы
-        constraints = [{'type': 'eq', 'fun': lambda x: sum(x) - 1}]
-        
-        bounds = []
-        for instrument in instruments_list:
-            instrument_data = self.instruments[instrument]
+            # Аналитический градиент: -yields + 2·5·w
+            gradient = -adjusted_yields + 2 * self.CONCENTRATION_WEIGHT * weights_array
             
-            if instrument == 'Структурная облигация Сбер':
-                bounds.append((0, 0.2))
-            elif instrument_data['currency'] == 'USD':
-                bounds.append((0, 0.4))
-            elif instrument_data['risk'] == 'низкий':
-                bounds.append((0, 0.5))
-            else:
-                bounds.append((0, 0.4))
+            return -expected_return + concentration_penalty, gradient
         
         x0 = np.array([1/n_instruments] * n_instruments)
         
-        result = minimize(objective, x0, method='SLSQP', 
-                         constraints=constraints, bounds=bounds,
-                         options={'maxiter': 200})
+        # SLSQP с теплым стартом от решения предыдущего месяца
+        result, x0 = self._minimize_slsqp('optimize_for_month', objective, x0, options={'maxiter': 200})
         
         optimal_weights = result.x if result.success else x0
-        return {instrument: optimal_weights[i] for i, instrument in enumerate(instruments_list)}
+        weights = table.weights_dict(optimal_weights)
+        # Повтор с теплого старта из решения даст то же решение, только если SLSQP
+        # уже не сдвинулся с него (иначе следующий месяц решаем как раньше)
+        self._last_month_solve = {
+            'inputs': inputs, 'weights': weights, 'x': result.x,
+            'fixed_point': bool(result.success) and np.array_equal(result.x, x0),
+        }
+        return dict(weights)
+    
+    def _can_reuse_month_solve(self, inputs):
+        """Даст ли повторное решение месячной задачи с этими данными тот же результат"""
+        last = self._last_month_solve
+        if last is None or last['inputs'] != inputs:
+            return False
+        if self.month_solver == 'qp' or not self.use_warm_start:
+            return True  # решение зависит только от данных задачи
+        # SLSQP стартует из последнего решения семейства: оно должно быть неподвижной точкой
+        family = ('optimize_for_month', self.instrument_table.names)
+        start, found = self.warm_start.initial_guess(family, last['x'])
+        return last['fixed_point'] and found and np.array_equal(start, last['x'])
+    
+    def month_solve_stats(self):
+        """Решенные и пропущенные (неизменные данные) месячные задачи"""
+        return {'solves': self.month_solves, 'skipped': self.month_solves_skipped}
     
-    def _calculate_monthly_return(self, weights, year_idx, month_in_year, rate_scenario, fx_scenario):
-        """Расчет месячной доходности портфеля"""
-        monthly_return = 0
+    def _calculate_monthly_return(self, weights, annual_yields):
+        """Расчет месячной доходности портфеля (annual_yields - строка monthly_yield_matrix)"""
+        weights = self.instrument_table.weights_vector(weights)
+        weights = np.where(weights > 0.001, weights, 0.0)
         
-        for instrument, weight in weights.items():
-            if weight > 0.001:
-                base_yield = self.instruments[instrument]['yield']
-                annual_yield = self.calculate_after_tax_yield(
-                    instrument, base_yield, year_idx, rate_scenario
-                )
-                # Простое приближение: годовая доходность / 12
-                monthly_yield = annual_yield / 12 / 100
-                monthly_return += weight * monthly_yield
+        # Простое приближение: годовая доходность / 12
+        monthly_yields = annual_yields / 12 / 100
         
-        return monthly_return
+        return float(weights @ monthly_yields)
     
     def _calculate_rebalancing_cost(self, old_weights, new_weights, capital):
         """Расчет стоимости ребалансировки (комиссии на перемещение средств)"""
-        total_moved = 0
-        
-        for instrument in old_weights.keys():
-            weight_change = abs(new_weights.get(instrument, 0) - old_weights.get(instrument, 0))
-            amount_moved = capital * weight_change
-            total_moved += amount_moved
+        table = self.instrument_table
+        weight_change = np.abs(table.weights_vector(new_weights) - table.weights_vector(old_weights))
+        total_moved = capital * float(weight_change.sum())
         
         # Комиссия только на фактически перемещенную сумму
         transaction_cost = total_moved * self.transaction_cost_pct / 100
@@ -170,8 +436,13 @@ class DynamicRebalancer(DynamicPortfolioOptimizer):
         return transaction_cost
 
 
-def demonstrate_rebalancing():
-    """Демонстрация динамической ребалансировки"""
+def demonstrate_rebalancing(common_paths=False):
+    """
+    Демонстрация динамической ребалансировки
+    
+    common_paths=True добавляет сравнение стратегий с buy-and-hold на одном
+    наборе путей ставки и курса (см. path_set).
+    """
     
     print("="*100)
     print("ДИНАМИЧЕСКАЯ РЕБАЛАНСИРОВКА ПОРТФЕЛЯ")
@@ -192,7 +463,9 @@ def demonstrate_rebalancing():
         ('none', 'БЕЗ ребалансировки (buy-and-hold)'),
         ('annual', 'ГОДОВАЯ ребалансировка (раз в год)'),
         ('quarterly', 'КВАРТАЛЬНАЯ ребалансировка (раз в 3 месяца)'),
-        ('monthly', 'МЕСЯЧНАЯ ребалансировка (каждый месяц)')
+        ('monthly', 'МЕСЯЧНАЯ ребалансировка (каждый месяц)'),
+        ('optimal', 'ОПТИМАЛЬНЫЙ план (DP с учетом комиссий)'),
+        ('threshold', 'ПО ПОРОГУ (полоса без сделок)')
     ]
     
     comparison_results = []
@@ -210,10 +483,10 @@ def demonstrate_rebalancing():
         )
         
         # Итоговые показатели
-        final_capital = results[-1]['capital']
+        final_capital = results.capital[-1]
         total_profit = final_capital - total_capital
-        avg_monthly_income = sum([r['monthly_income'] for r in results]) / len(results)
-        rebalance_count = sum([1 for r in results if r['rebalanced']])
+        avg_monthly_income = results.monthly_income.mean()
+        rebalance_count = int(results.rebalanced.sum())
         
         print(f"\nРезультаты:")
         print(f"  Итоговый капитал: {final_capital:,.0f} руб")
@@ -223,14 +496,13 @@ def demonstrate_rebalancing():
         
         # Показываем изменения весов (первые 12 месяцев)
         print(f"\n  Распределение по месяцам (первый год):")
-        for i in range(min(12, len(results))):
-            if results[i]['rebalanced']:
-                month_num = results[i]['month']
-                weights = results[i]['weights']
-                print(f"\n  Месяц {month_num}: {'[РЕБАЛАНСИРОВКА]' if i > 0 else '[НАЧАЛО]'}")
-                for inst, weight in sorted(weights.items(), key=lambda x: x[1], reverse=True):
-                    if weight > 0.01:
-                        print(f"    {inst:40s}: {weight*100:5.1f}%")
+        first_year = results.year_slice(1)
+        for i in np.flatnonzero(first_year.rebalanced):
+            print(f"\n  Месяц {first_year.month[i]}: {'[РЕБАЛАНСИРОВКА]' if i > 0 else '[НАЧАЛО]'}")
+            for inst, weight in sorted(zip(first_year.instrument_names, first_year.weights[i]),
+                                       key=lambda x: x[1], reverse=True):
+                if weight > 0.01:
+                    print(f"    {inst:40s}: {weight*100:5.1f}%")
         
         comparison_results.append({
             'Стратегия': label,
@@ -249,6 +521,21 @@ def demonstrate_rebalancing():
     df_comparison = pd.DataFrame(comparison_results)
     print(df_comparison.to_string(index=False))
     
+    solve_stats = rebalancer.month_solve_stats()
+    print(f"\n♻️ Месячных задач решено: {solve_stats['solves']}, "
+          f"пропущено (данные не менялись): {solve_stats['skipped']}")
+    
+    if common_paths:
+        # Те же стратегии при неопределенности: все на одном наборе путей ставки и курса
+        path_set = get_path_set(rebalancer, years=3)
+        baseline = rebalancer.simulate_rebalancing_on_paths(path_set, rebalance_frequency='none')
+        print(f"\n🎲 Стохастическая проверка ({len(path_set):,} общих путей ставки ЦБ и курса), "
+              f"разница итогового капитала с buy-and-hold:")
+        for strategy, label in strategies[1:]:
+            result = rebalancer.simulate_rebalancing_on_paths(path_set, rebalance_frequency=strategy)
+            difference = paired_difference(result.terminal_capital[0], baseline.terminal_capital[0])
+            print(f"   {label:<45} {difference['mean_difference']:>+12,.0f} ± {difference['standard_error']:,.0f} руб")
+    
     # Анализ
     print(f"\n{'='*100}")
     print("ВЫВОДЫ:")
@@ -0,0 +1,93 @@
+"""
+Forecast Curves
+Dense monthly (or daily) CBR rate and USD/RUB curves built once from the yearly forecasts
+"""
+
+import numpy as np
+from scipy.interpolate import CubicSpline
+
+INTERPOLATIONS = ('step', 'linear', 'spline')
+MONTHS_PER_YEAR = 12
+DAYS_PER_YEAR = 365
+
+
+def interpolate_yearly(values, periods, periods_per_year=MONTHS_PER_YEAR, interpolation='step'):
+    """
+    Значения годового прогноза в моменты t = 0, 1/ppy, 2/ppy, ... (в годах)
+
+    values[i] is the forecast for the start of year i. Past the last forecast
+    year the curve stays flat, as everywhere else in the engines.
+    - step:   values[floor(t)] (the yearly model the engines have always used)
+    - linear: straight lines between yearly knots
+    - spline: natural cubic spline through the yearly knots
+    """
+    if interpolation not in INTERPOLATIONS:
+        raise ValueError(f"Unknown interpolation '{interpolation}', expected one of {INTERPOLATIONS}")
+
+    values = np.asarray(values, dtype=float)
+    t = np.arange(periods) / periods_per_year
+    last = len(values) - 1
+
+    if interpolation == 'step' or last == 0:
+        return values[np.minimum(np.floor(t + 1e-9).astype(int), last)]
+
+    knots = np.arange(len(values), dtype=float)
+    t = np.minimum(t, last)
+    if interpolation == 'linear' or last == 1:
+        return np.interp(t, knots, values)
+    return CubicSpline(knots, values, bc_type='natural')(t)
+
+
+class ForecastCurves:
+    """
+    CBR and FX curves per scenario on a regular grid of periods_per_year points
+    per year (12 - monthly, 365 - daily).
+
+    cbr[r, p] is the key rate during period p of rate scenario r; fx[f, p] is
+    the USD/RUB rate at the start of period p. Curves are built for
+    horizon_years and are flat beyond, so any index past the end clamps.
+    """
+
+    def __init__(self, cbr_scenarios, fx_scenarios, interpolation='step',
+                 periods_per_year=MONTHS_PER_YEAR, horizon_years=None):
+        self.interpolation = interpolation
+        self.periods_per_year = periods_per_year
+        self.rate_names = tuple(cbr_scenarios.keys())
+        self.fx_names = tuple(fx_scenarios.keys())
+        self.rate_index = {name: i for i, name in enumerate(self.rate_names)}
+        self.fx_index = {name: i for i, name in enumerate(self.fx_names)}
+        self.key = self.config_key(cbr_scenarios, fx_scenarios, interpolation, periods_per_year)
+
+        if horizon_years is None:
+            horizon_years = max(len(r) for r in list(cbr_scenarios.values()) + list(fx_scenarios.values()))
+        # +1 год: для FX нужен курс через год после последнего периода
+        self.n_periods = (horizon_years + 1) * periods_per_year + 1
+
+        self.cbr = np.array([interpolate_yearly(rates, self.n_periods, periods_per_year, interpolation)
+                             for rates in cbr_scenarios.values()]).reshape(len(self.rate_names), -1)
+        self.fx = np.array([interpolate_yearly(rates, self.n_periods, periods_per_year, interpolation)
+                            for rates in fx_scenarios.values()]).reshape(len(self.fx_names), -1)
+        self.cbr.setflags(write=False)
+        self.fx.setflags(write=False)
+
+    @staticmethod
+    def config_key(cbr_scenarios, fx_scenarios, interpolation, periods_per_year):
+        """Everything the curves depend on; a different key means the curves are stale"""
+        return (
+            tuple((name, tuple(rates)) for name, rates in cbr_scenarios.items()),
+            tuple((name, tuple(rates)) for name, rates in fx_scenarios.items()),
+            interpolation,
+            periods_per_year,
+        )
+
+    def month_index(self, months):
+        """Индексы периодов, с которых начинаются месяцы 0..months-1"""
+        return np.rint(np.arange(months) * self.periods_per_year / MONTHS_PER_YEAR).astype(int)
+
+    def cbr_at(self, rate_scenario, index):
+        """Ставка ЦБ (%) в периодах index (за концом кривой - последнее значение)"""
+        return self.cbr[self.rate_index[rate_scenario], np.minimum(index, self.n_periods - 1)]
+
+    def fx_at(self, fx_scenario, index):
+        """Курс USD/RUB на начало периодов index"""
+        return self.fx[self.fx_index[fx_scenario], np.minimum(index, self.n_periods - 1)]
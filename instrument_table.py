@@ -0,0 +1,123 @@
+"""
+Instrument Table
+Columnar (array-backed) view of the instruments dict for vectorized engines
+"""
+
+import numpy as np
+
+CBR_DEPOSIT_SPREAD = 0.5  # Вклад: ставка ЦБ - 0.5%
+RUONIA_SPREAD = 1.0       # RUONIA ≈ ставка ЦБ - 1.0%
+TAX_FACTOR = 0.87         # НДФЛ 13%
+
+STRUCTURED_BOND = 'Структурная облигация Сбер'
+
+
+def instrument_bounds(name, instrument_data):
+    """Границы доли инструмента в портфеле (min, max)"""
+    if name == STRUCTURED_BOND:
+        return (0, 0.2)  # максимум 20%
+    if instrument_data['currency'] == 'USD':
+        return (0, 0.4)  # максимум 40% в валюте
+    if instrument_data.get('risk', 'низкий') == 'низкий':
+        return (0, 0.5)  # гибкие границы для надежных инструментов
+    return (0, 0.4)
+
+
+# Поля словаря инструмента, которые читает InstrumentTable
+SOURCE_FIELDS = ('yield', 'currency', 'risk', 'cbr_linked', 'ruonia_linked', 'tax_free',
+                 'variable_coupon', 'total_expenses', 'management_fee')
+
+
+def _frozen(array):
+    array.setflags(write=False)
+    return array
+
+
+class InstrumentTable:
+    """
+    Instruments with fixed indices and one NumPy column per attribute.
+
+    Index i in every column is the instrument names[i]; this is also the
+    order of weight vectors passed to the optimizers.
+    """
+
+    def __init__(self, instruments):
+        self.source = instruments
+        self.key = self.source_key(instruments)
+        self.names = tuple(instruments.keys())
+        self.index = {name: i for i, name in enumerate(self.names)}
+        records = [instruments[name] for name in self.names]
+
+        # Boolean masks
+        self.cbr_linked = _frozen(np.array([bool(d.get('cbr_linked', False)) for d in records], dtype=bool))
+        self.ruonia_linked = _frozen(np.array([bool(d.get('ruonia_linked', False)) for d in records], dtype=bool))
+        self.tax_free = _frozen(np.array([bool(d.get('tax_free', False)) for d in records], dtype=bool))
+        self.is_usd = _frozen(np.array([d.get('currency') == 'USD' for d in records], dtype=bool))
+        self.variable_coupon = _frozen(np.array([bool(d.get('variable_coupon', False)) for d in records], dtype=bool))
+        self.rate_linked = _frozen(self.cbr_linked | self.ruonia_linked)
+
+        # Float columns
+        self.base_yield = _frozen(np.array([float(d['yield']) for d in records]))
+        # Спред к ставке ЦБ (RUONIA имеет приоритет, как в calculate_after_tax_yield)
+        self.spread = _frozen(np.where(self.ruonia_linked, RUONIA_SPREAD,
+                                       np.where(self.cbr_linked, CBR_DEPOSIT_SPREAD, 0.0)))
+        self.fees = _frozen(np.array([float(d.get('total_expenses', d.get('management_fee', 0.0)) or 0.0)
+                                      for d in records]))
+        self.tax_factor = _frozen(np.where(self.tax_free, 1.0, TAX_FACTOR))
+
+        bounds = [instrument_bounds(name, d) for name, d in zip(self.names, records)]
+        self.lower = _frozen(np.array([b[0] for b in bounds], dtype=float))
+        self.upper = _frozen(np.array([b[1] for b in bounds], dtype=float))
+
+    @staticmethod
+    def source_key(instruments):
+        """Дешевый ключ содержимого: имена и все читаемые поля (SOURCE_FIELDS)"""
+        return tuple((name, tuple(data.get(field) for field in SOURCE_FIELDS))
+                     for name, data in instruments.items())
+
+    def __len__(self):
+        return len(self.names)
+
+    def bounds(self):
+        """Границы в формате scipy.optimize.minimize"""
+        return list(zip(self.lower.tolist(), self.upper.tolist()))
+
+    def weights_vector(self, weights):
+        """Dict {instrument: weight} (or array) -> array in table order"""
+        if isinstance(weights, dict):
+            return np.array([weights.get(name, 0.0) for name in self.names], dtype=float)
+        return np.asarray(weights, dtype=float)
+
+    def weights_dict(self, weights):
+        """Array in table order -> dict {instrument: weight}"""
+        return {name: weights[i] for i, name in enumerate(self.names)}
+
+    def after_tax_yields(self, cbr_rate, fx_start, fx_end, usd_spread_pct, base_yield=None,
+                         ruonia_rate=None):
+        """
+        Годовая доходность после налогов (%) для всех инструментов сразу.
+
+        cbr_rate, fx_start, fx_end may be scalars or arrays that broadcast
+        against a trailing instrument axis (e.g. shape (..., 1)). ruonia_rate
+        (same shapes) replaces the CBR - RUONIA_SPREAD proxy for RUONIA-linked
+        instruments, e.g. with the realized RUONIA in a backtest.
+        """
+        if base_yield is None:
+            base_yield = self.base_yield
+        cbr_rate = np.asarray(cbr_rate, dtype=float)
+
+        # Корректировка для инструментов, привязанных к ставке ЦБ / RUONIA
+        nominal = np.where(self.rate_linked, cbr_rate - self.spread, base_yield)
+        if ruonia_rate is not None:
+            nominal = np.where(self.ruonia_linked, np.asarray(ruonia_rate, dtype=float), nominal)
+
+        # Налоговая корректировка
+        after_tax = nominal * self.tax_factor
+
+        # Для валютных инструментов учитываем курс за конкретный год с учетом спреда
+        fx_buy_rate = np.asarray(fx_start, dtype=float) * (1 + usd_spread_pct / 200)
+        fx_sell_rate = np.asarray(fx_end, dtype=float) * (1 - usd_spread_pct / 200)
+        fx_gain = (fx_sell_rate - fx_buy_rate) / fx_buy_rate * 100
+        after_tax = after_tax + np.where(self.is_usd, fx_gain, 0.0)
+
+        return np.maximum(after_tax, 0)  # Доходность не может быть отрицательной
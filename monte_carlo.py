@@ -0,0 +1,573 @@
+"""
+Monte Carlo Engine
+Stochastic CBR key rate and USD/RUB paths around the forecast scenarios,
+simulated in chunks against one or many portfolios at once
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import warnings
+import weakref
+from concurrent.futures import as_completed
+
+import numpy as np
+from scipy.special import ndtri
+from scipy.stats import norm, qmc
+
+from forecast_curves import ForecastCurves, MONTHS_PER_YEAR
+from scenario_engine import optimizer_state, submit_to_pool, worker_optimizer
+from streaming_stats import MonteCarloAggregator
+
+# Параметры процессов по умолчанию
+RATE_VOLATILITY = 2.0     # п.п. в год (волатильность отклонения ставки ЦБ от прогноза)
+RATE_MEAN_REVERSION = 1.0  # скорость возврата к прогнозу (1/год)
+FX_VOLATILITY = 0.12       # годовая волатильность USD/RUB
+RATE_FX_CORRELATION = 0.3  # рост ставки обычно сопровождает ослабление рубля
+
+DEFAULT_CHUNK_SIZE = 20000
+
+SAMPLING_METHODS = ('pseudo', 'sobol')
+# Величины, для которых estimate() строит оценку с доверительным интервалом
+ESTIMATE_QUANTITIES = ('prob_income_meets_target', 'mean_monthly_income', 'terminal_capital')
+
+# goal_probabilities: batch size and limits for interactive use
+GOAL_BATCH_SIZE = 4096
+GOAL_TIME_BUDGET = 2.0      # секунды
+GOAL_MAX_PATHS = 2000000
+
+
+def wilson_interval(successes, n, confidence=0.95):
+    """Доверительный интервал Уилсона для доли successes / n (корректен и при p близком к 0 или 1)"""
+    if n == 0:
+        return 0.0, 1.0
+    z = norm.ppf(0.5 + confidence / 2)
+    p = successes / n
+    denominator = 1 + z ** 2 / n
+    center = (p + z ** 2 / (2 * n)) / denominator
+    half_width = z * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denominator
+    return max(float(center - half_width), 0.0), min(float(center + half_width), 1.0)
+
+# RAM-backed directory for the memory-mapped result buffers of run_parallel (if available)
+SHARED_BUFFER_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+class MonteCarloEngine:
+    """
+    Monthly paths of the key rate and USD/RUB.
+
+    Rate:  r_t = mean_t + x_t, where x is an Ornstein-Uhlenbeck process
+           (exact discretization) pulled back to the scenario curve; floored at 0.
+    FX:    S_t = mean_t * exp(y_t), y a Brownian motion with drift -σ²t/2,
+           so E[S_t] follows the FX scenario curve.
+    The two shocks are correlated with correlation rho (a rate hike tends to
+    come with a weaker ruble).
+    Means come from the optimizer's monthly forecast curves (step interpolation
+    by default, i.e. the yearly scenario values).
+
+    Shocks are pseudo-random (sampling='pseudo') or scrambled Sobol points
+    mapped through the normal inverse CDF (sampling='sobol'); antithetic=True
+    pairs every path with its mirror image (-z).
+    """
+
+    def __init__(self, optimizer, rate_scenario='base', fx_scenario='base', years=None,
+                 rate_volatility=RATE_VOLATILITY, mean_reversion=RATE_MEAN_REVERSION,
+                 fx_volatility=FX_VOLATILITY, correlation=RATE_FX_CORRELATION, seed=None,
+                 sampling='pseudo', antithetic=False):
+        if not -1 <= correlation <= 1:
+            raise ValueError("correlation must be between -1 and 1")
+        if sampling not in SAMPLING_METHODS:
+            raise ValueError(f"Unknown sampling '{sampling}', expected one of {SAMPLING_METHODS}")
+        self.optimizer = optimizer
+        self.rate_scenario = rate_scenario
+        self.fx_scenario = fx_scenario
+        self.years = optimizer.years if years is None else years
+        self.months = self.years * MONTHS_PER_YEAR
+        self.rate_volatility = rate_volatility
+        self.mean_reversion = mean_reversion
+        self.fx_volatility = fx_volatility
+        self.correlation = correlation
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.sampling = sampling
+        self.antithetic = antithetic
+        self._sobol = None
+
+        curves = ForecastCurves(optimizer.cbr_scenarios, optimizer.fx_scenarios,
+                                optimizer.curve_interpolation, MONTHS_PER_YEAR)
+        index = np.arange(self.months + 1)
+        self.rate_mean = curves.cbr_at(rate_scenario, index[:-1])  # ставка в течение месяца m
+        self.fx_mean = curves.fx_at(fx_scenario, index)            # курс на начало месяца m (и конец последнего)
+
+    def engine_params(self):
+        """Constructor arguments (except optimizer and seed) to rebuild this engine in a worker"""
+        return {
+            'rate_scenario': self.rate_scenario, 'fx_scenario': self.fx_scenario, 'years': self.years,
+            'rate_volatility': self.rate_volatility, 'mean_reversion': self.mean_reversion,
+            'fx_volatility': self.fx_volatility, 'correlation': self.correlation,
+            'sampling': self.sampling, 'antithetic': self.antithetic,
+        }
+
+    def rescramble(self):
+        """Start a new independently scrambled Sobol sequence (next draws use it)"""
+        self._sobol = None
+
+    def _base_normals(self, n_paths):
+        """Standard normal shocks (2, n_paths, months) from the selected sampler"""
+        if self.sampling == 'pseudo':
+            return self.rng.standard_normal((2, n_paths, self.months))
+
+        if self._sobol is None:
+            self._sobol = qmc.Sobol(d=2 * self.months, scramble=True, seed=self.rng)
+        with warnings.catch_warnings():
+            # Balance properties are best for powers of two, other sizes are still valid
+            warnings.simplefilter('ignore', UserWarning)
+            points = self._sobol.random(n_paths)
+        normals = ndtri(np.clip(points, 1e-12, 1 - 1e-12))
+        # Dimensions are interleaved by month: the first (best distributed) ones drive the first months
+        return normals.reshape(n_paths, self.months, 2).transpose(2, 0, 1)
+
+    def _normals(self, n_paths):
+        """Shocks (2, n_paths, months); with antithetic=True paths i and i + n/2 are mirrored"""
+        if not self.antithetic:
+            return self._base_normals(n_paths)
+        half = self._base_normals((n_paths + 1) // 2)
+        return np.concatenate([half, -half], axis=1)[:, :n_paths]
+
+    def generate_paths(self, n_paths, return_controls=False):
+        """
+        Ставка ЦБ (n_paths, months) и курс USD/RUB (n_paths, months + 1)
+
+        With return_controls=True also returns control variates (n_paths, 2·years):
+        the yearly mean of the (unfloored) rate deviation and the year-end FX
+        ratio S/mean - 1. Both have expectation exactly zero - their value on
+        the forecast path of simulate_portfolio_performance.
+        """
+        return self.paths_from_normals(self._normals(n_paths), return_controls)
+
+    def paths_from_normals(self, normals, return_controls=False):
+        """
+        Paths driven by given shocks (2, n_paths, months) - see generate_paths.
+
+        The same shocks give comparable paths under any scenario or engine
+        parameters (common random numbers, see path_set.PathSet).
+        """
+        dt = 1 / MONTHS_PER_YEAR
+        z_rate, z_other = normals
+        n_paths = z_rate.shape[0]
+        z_fx = self.correlation * z_rate + np.sqrt(1 - self.correlation ** 2) * z_other
+
+        # Ornstein-Uhlenbeck: x_{m+1} = x_m·e^{-κdt} + σ·sqrt((1 - e^{-2κdt}) / 2κ)·z
+        if self.mean_reversion > 0:
+            decay = np.exp(-self.mean_reversion * dt)
+            shock_scale = self.rate_volatility * np.sqrt((1 - decay ** 2) / (2 * self.mean_reversion))
+        else:
+            decay, shock_scale = 1.0, self.rate_volatility * np.sqrt(dt)
+        deviation = np.empty((n_paths, self.months))
+        x = np.zeros(n_paths)
+        for month in range(self.months):
+            deviation[:, month] = x  # ставка в месяце m использует отклонение на его начало
+            x = x * decay + shock_scale * z_rate[:, month]
+        rates = np.maximum(self.rate_mean + deviation, 0.0)
+
+        # Log-normal FX with E[S_t] = mean_t
+        log_moves = self.fx_volatility * np.sqrt(dt) * z_fx - 0.5 * self.fx_volatility ** 2 * dt
+        log_fx = np.concatenate([np.zeros((n_paths, 1)), np.cumsum(log_moves, axis=1)], axis=1)
+        fx = self.fx_mean * np.exp(log_fx)
+
+        if not return_controls:
+            return rates, fx
+        year_rate_deviation = deviation.reshape(n_paths, self.years, MONTHS_PER_YEAR).mean(axis=2)
+        year_end_fx_ratio = np.exp(log_fx[:, MONTHS_PER_YEAR::MONTHS_PER_YEAR]) - 1
+        return rates, fx, np.concatenate([year_rate_deviation, year_end_fx_ratio], axis=1)
+
+    def iter_chunks(self, n_paths, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Generate n_paths in chunks: yields (rates, fx) arrays of at most chunk_size paths"""
+        for start in range(0, n_paths, chunk_size):
+            yield self.generate_paths(min(chunk_size, n_paths - start))
+
+    def simulate_chunk(self, weights_matrix, rates, fx, capital_growth_scenario='constant'):
+        """
+        Капитал и доход k портфелей на каждом пути
+
+        weights_matrix: (k, n_instruments). Returns (monthly_income (k, paths, months),
+        terminal_capital (k, paths), wealth (k, paths, months)), where wealth is the
+        portfolio value at the end of each month (capital plus income accrued so
+        far this year). Same conventions as simulate_portfolio_batch:
+        income accrues monthly on the capital at the start of the year and is
+        capitalized at year end together with the capital change; USD instruments
+        earn the realized FX move of the year (with the buy/sell spread);
+        weights below 0.1% are ignored; capital cannot become negative.
+        With zero volatility the result equals the deterministic simulation
+        (except that FX losses are not floored at zero here).
+        """
+        optimizer = self.optimizer
+        table = optimizer.instrument_table
+        weights = np.atleast_2d(np.asarray(weights_matrix, dtype=float))
+        weights = np.where(weights > 0.001, weights, 0.0)
+        k, n_paths = weights.shape[0], rates.shape[0]
+
+        usd_share = weights @ table.is_usd.astype(float)  # (k,)
+        growth_rate = optimizer.capital_growth_scenarios[capital_growth_scenario]
+        initial_total = optimizer.initial_capital_rub + optimizer.initial_usd_amount * optimizer.current_usd_rub
+        spread = optimizer.usd_spread_pct / 200
+
+        capital = np.full((k, n_paths), float(initial_total))
+        monthly_income = np.empty((k, n_paths, self.months))
+        wealth = np.empty((k, n_paths, self.months))
+        for year in range(self.years):
+            months = slice(year * MONTHS_PER_YEAR, (year + 1) * MONTHS_PER_YEAR)
+
+            # Доходность от ставки ЦБ (%, годовых) по месяцам: FX-часть after_tax_yields
+            # отключена (курс не меняется, без спреда) и учитывается ниже по пути курса
+            yields = table.after_tax_yields(rates[:, months, None], 1.0, 1.0, 0.0)  # (paths, 12, n)
+            rate_return = np.moveaxis(yields @ weights.T, -1, 0) / 100              # (k, paths, 12)
+
+            # Реализованное изменение курса за год (покупка по курсу начала года + спред)
+            fx_gain = fx[:, months.stop] * (1 - spread) / (fx[:, months.start] * (1 + spread)) - 1
+            fx_return = usd_share[:, None] * fx_gain[None, :]                      # (k, paths)
+
+            income = capital[:, :, None] * (rate_return + fx_return[:, :, None]) / MONTHS_PER_YEAR
+            monthly_income[:, :, months] = income
+            wealth[:, :, months] = capital[:, :, None] + np.cumsum(income, axis=2)
+            capital = np.maximum(capital + income.sum(axis=2) + capital * growth_rate, 0)
+            wealth[:, :, months.stop - 1] = capital
+
+        return monthly_income, capital, wealth
+
+    def run(self, weights_matrix, n_paths=100000, capital_growth_scenario='constant',
+            chunk_size=DEFAULT_CHUNK_SIZE):
+        """Simulate n_paths paths for every portfolio in weights_matrix (or a weights dict)"""
+        if isinstance(weights_matrix, dict):
+            weights_matrix = self.optimizer.instrument_table.weights_vector(weights_matrix)
+        weights = np.atleast_2d(np.asarray(weights_matrix, dtype=float))
+        incomes, capitals = [], []
+        for rates, fx in self.iter_chunks(n_paths, chunk_size):
+            income, capital, _ = self.simulate_chunk(weights, rates, fx, capital_growth_scenario)
+            incomes.append(income)
+            capitals.append(capital)
+        return MonteCarloResult(np.concatenate(incomes, axis=1), np.concatenate(capitals, axis=1),
+                                self.optimizer.monthly_income_target)
+
+
+    def estimate(self, weights, quantity='prob_income_meets_target', n_paths=20000,
+                 capital_growth_scenario='constant', replicates=None, control_variate=True):
+        """
+        Оценка среднего quantity с доверительным интервалом и эффективным размером выборки
+
+        quantity: 'prob_income_meets_target' (average monthly income >= target),
+        'mean_monthly_income' or 'terminal_capital' for a single portfolio.
+
+        Variance reduction: antithetic pairs are averaged into one sample;
+        the control variates from generate_paths are regressed out (their mean
+        is known to be zero); with Sobol sampling the standard error comes from
+        `replicates` independently scrambled sequences (8 by default).
+        effective_sample_size is the number of plain Monte Carlo paths that
+        would give the same standard error.
+        """
+        if quantity not in ESTIMATE_QUANTITIES:
+            raise ValueError(f"Unknown quantity '{quantity}', expected one of {ESTIMATE_QUANTITIES}")
+        if isinstance(weights, dict):
+            weights = self.optimizer.instrument_table.weights_vector(weights)
+        if replicates is None:
+            replicates = 8 if self.sampling == 'sobol' else 1
+        per_replicate = n_paths // replicates
+        if self.antithetic:
+            per_replicate -= per_replicate % 2
+
+        def quantity_values(income, capital):
+            if quantity == 'terminal_capital':
+                return capital[0]
+            avg_income = income[0].mean(axis=1)
+            if quantity == 'mean_monthly_income':
+                return avg_income
+            return (avg_income >= self.optimizer.monthly_income_target).astype(float)
+
+        # Прогнозный путь (= simulate_portfolio_performance): точка, вокруг которой работают контрольные переменные
+        income, capital, _ = self.simulate_chunk(weights, self.rate_mean[None, :], self.fx_mean[None, :],
+                                                 capital_growth_scenario)
+        deterministic = float(quantity_values(income, capital)[0])
+
+        replicate_means, replicate_variances, samples = [], [], []
+        for _ in range(replicates):
+            self.rescramble()
+            rates, fx, controls = self.generate_paths(per_replicate, return_controls=True)
+            income, capital, _ = self.simulate_chunk(weights, rates, fx, capital_growth_scenario)
+            values = quantity_values(income, capital)
+            samples.append(values)
+
+            if self.antithetic:
+                half = per_replicate // 2
+                values = (values[:half] + values[half:]) / 2
+                controls = (controls[:half] + controls[half:]) / 2
+            if control_variate:
+                centered = controls - controls.mean(axis=0)
+                beta = np.linalg.lstsq(centered, values - values.mean(), rcond=None)[0]
+                values = values - controls @ beta  # E[controls] = 0
+
+            replicate_means.append(values.mean())
+            replicate_variances.append(values.var(ddof=1) / len(values))
+
+        estimate = float(np.mean(replicate_means))
+        if replicates > 1:
+            variance = float(np.var(replicate_means, ddof=1) / replicates)
+        else:
+            variance = float(replicate_variances[0])
+        plain_variance = float(np.concatenate(samples).var(ddof=1))
+        standard_error = np.sqrt(variance)
+        used_paths = per_replicate * replicates
+        effective = plain_variance / variance if variance > 0 else float('inf')
+
+        return {
+            'quantity': quantity,
+            'estimate': estimate,
+            'standard_error': float(standard_error),
+            'ci95': (estimate - 1.96 * standard_error, estimate + 1.96 * standard_error),
+            'paths': used_paths,
+            'effective_sample_size': effective,
+            'variance_reduction': effective / used_paths,
+            'deterministic': deterministic,
+        }
+
+    def goal_probabilities(self, weights, capital_growth_scenario='constant', tolerance=0.01,
+                           confidence=0.95, time_budget=GOAL_TIME_BUDGET, batch_size=GOAL_BATCH_SIZE,
+                           max_paths=GOAL_MAX_PATHS):
+        """
+        Вероятности достичь цели по доходу и сохранить капитал, с ранней остановкой
+
+        Draws batches of batch_size paths until the confidence interval of both
+        probabilities is at most `tolerance` wide, the next batch would not fit
+        into time_budget seconds or max_paths paths were used, whichever comes first.
+        - income goal: average monthly income over the horizon >= monthly_income_target
+        - capital preserved: terminal capital >= initial capital (RUB + USD at spot)
+        Returns estimates, Wilson intervals, the number of paths, the elapsed
+        time and stop_reason ('converged', 'time_budget' or 'max_paths').
+        """
+        if tolerance <= 0:
+            raise ValueError("tolerance must be positive")
+        if isinstance(weights, dict):
+            weights = self.optimizer.instrument_table.weights_vector(weights)
+        optimizer = self.optimizer
+        initial_total = optimizer.initial_capital_rub + optimizer.initial_usd_amount * optimizer.current_usd_rub
+
+        start = time.perf_counter()
+        n_paths = income_hits = capital_hits = 0
+        elapsed = 0.0
+        while True:
+            rates, fx = self.generate_paths(min(batch_size, max_paths - n_paths))
+            income, capital, _ = self.simulate_chunk(weights, rates, fx, capital_growth_scenario)
+            n_paths += rates.shape[0]
+            income_hits += int((income[0].mean(axis=1) >= optimizer.monthly_income_target).sum())
+            capital_hits += int((capital[0] >= initial_total).sum())
+
+            income_ci = wilson_interval(income_hits, n_paths, confidence)
+            capital_ci = wilson_interval(capital_hits, n_paths, confidence)
+            now = time.perf_counter() - start
+            batch_time, elapsed = now - elapsed, now
+            if max(income_ci[1] - income_ci[0], capital_ci[1] - capital_ci[0]) <= tolerance:
+                stop_reason = 'converged'
+            elif elapsed + batch_time > time_budget:  # следующая пачка не успеет в бюджет
+                stop_reason = 'time_budget'
+            elif n_paths >= max_paths:
+                stop_reason = 'max_paths'
+            else:
+                continue
+            break
+
+        return {
+            'prob_income_meets_target': income_hits / n_paths,
+            'prob_income_meets_target_ci': income_ci,
+            'prob_capital_preserved': capital_hits / n_paths,
+            'prob_capital_preserved_ci': capital_ci,
+            'paths': n_paths,
+            'elapsed': elapsed,
+            'stop_reason': stop_reason,
+        }
+
+    def run_streaming(self, weights_matrix, n_paths=1000000, capital_growth_scenario='constant',
+                      chunk_size=DEFAULT_CHUNK_SIZE, aggregator=None):
+        """
+        Like run, but folds every chunk into a MonteCarloAggregator and drops it,
+        so memory does not grow with n_paths. Pass aggregator to continue a stream.
+        """
+        if isinstance(weights_matrix, dict):
+            weights_matrix = self.optimizer.instrument_table.weights_vector(weights_matrix)
+        weights = np.atleast_2d(np.asarray(weights_matrix, dtype=float))
+        optimizer = self.optimizer
+        initial_total = optimizer.initial_capital_rub + optimizer.initial_usd_amount * optimizer.current_usd_rub
+        if aggregator is None:
+            aggregator = MonteCarloAggregator(len(weights), self.months, optimizer.monthly_income_target)
+        for rates, fx in self.iter_chunks(n_paths, chunk_size):
+            income, capital, wealth = self.simulate_chunk(weights, rates, fx, capital_growth_scenario)
+            aggregator.update(income, capital, wealth, initial_total)
+        return aggregator
+
+
+    def run_parallel(self, weights_matrix, n_paths=1000000, capital_growth_scenario='constant',
+                     chunk_size=DEFAULT_CHUNK_SIZE, max_workers=None, keep_paths=False):
+        """
+        Run blocks of chunk_size paths on a process pool.
+
+        Every block gets its own RNG stream (SeedSequence(seed).spawn), so the
+        result depends on seed and chunk_size but not on the number of workers.
+        Workers write their paths and portfolio results straight into
+        memory-mapped buffers (in /dev/shm where available) instead of
+        pickling arrays back; only block indices travel through the pool.
+        The result arrays are copy-on-write maps of those buffers, not copies;
+        the files are unlinked at once (the mappings stay valid) or, where the
+        OS forbids that, when the result is released.
+        keep_paths=True also returns the simulated rates / fx in the result.
+        """
+        if isinstance(weights_matrix, dict):
+            weights_matrix = self.optimizer.instrument_table.weights_vector(weights_matrix)
+        weights = np.atleast_2d(np.asarray(weights_matrix, dtype=float))
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+
+        k = len(weights)
+        blocks = [(start, min(start + chunk_size, n_paths)) for start in range(0, n_paths, chunk_size)]
+        seeds = np.random.SeedSequence(self.seed).spawn(len(blocks))
+
+        shapes = {
+            'monthly_income': (k, n_paths, self.months),
+            'terminal_capital': (k, n_paths),
+        }
+        if keep_paths:
+            shapes['rates'] = (n_paths, self.months)
+            shapes['fx'] = (n_paths, self.months + 1)
+
+        buffer_dir = tempfile.mkdtemp(prefix='hfo_mc_', dir=SHARED_BUFFER_DIR)
+        try:
+            buffers = {}
+            for name, shape in shapes.items():
+                path = os.path.join(buffer_dir, f'{name}.f8')
+                np.memmap(path, dtype=np.float64, mode='w+', shape=shape).flush()
+                buffers[name] = (path, shape)
+
+            params = self.engine_params()
+            tasks = [(params, weights, capital_growth_scenario, start, stop, seed, buffers)
+                     for (start, stop), seed in zip(blocks, seeds)]
+
+            if max_workers < 2 or len(blocks) < 2:
+                for task in tasks:
+                    _simulate_block(self.optimizer, *task)
+            else:
+                futures = submit_to_pool(optimizer_state(self.optimizer), max_workers,
+                                         _simulate_block_in_worker, tasks)
+                for future in as_completed(futures):
+                    future.result()
+
+            arrays = {name: np.memmap(path, dtype=np.float64, mode='c', shape=shape)
+                      for name, (path, shape) in buffers.items()}
+        except BaseException:
+            shutil.rmtree(buffer_dir, ignore_errors=True)
+            raise
+
+        result = MonteCarloResult(arrays['monthly_income'], arrays['terminal_capital'],
+                                  self.optimizer.monthly_income_target,
+                                  rates=arrays.get('rates'), fx=arrays.get('fx'))
+        # POSIX: the mapped pages live until the arrays are released; Windows keeps mapped files
+        shutil.rmtree(buffer_dir, ignore_errors=True)
+        if os.path.exists(buffer_dir):
+            weakref.finalize(result, shutil.rmtree, buffer_dir, True)
+        return result
+
+
+def _simulate_block(optimizer, params, weights, capital_growth_scenario, start, stop, seed, buffers):
+    """Simulate paths [start, stop) with their own RNG stream and write them into the buffers"""
+    engine = MonteCarloEngine(optimizer, seed=seed, **params)
+    rates, fx = engine.generate_paths(stop - start)
+    income, capital, _ = engine.simulate_chunk(weights, rates, fx, capital_growth_scenario)
+
+    outputs = {'monthly_income': income, 'terminal_capital': capital, 'rates': rates, 'fx': fx}
+    for name, (path, shape) in buffers.items():
+        target = np.memmap(path, dtype=np.float64, mode='r+', shape=shape)
+        if name in ('rates', 'fx'):
+            target[start:stop] = outputs[name]
+        else:
+            target[:, start:stop] = outputs[name]
+        target.flush()
+        del target
+
+
+def _simulate_block_in_worker(*task):
+    _simulate_block(worker_optimizer(), *task)
+
+
+class MonteCarloResult:
+    """
+    Distributions for k portfolios: monthly_income (k, paths, months) and
+    terminal_capital (k, paths), in rubles; optionally the rate / FX paths.
+    """
+
+    def __init__(self, monthly_income, terminal_capital, monthly_income_target, rates=None, fx=None):
+        self.monthly_income = monthly_income
+        self.terminal_capital = terminal_capital
+        self.monthly_income_target = monthly_income_target
+        # Simulated paths (run_parallel with keep_paths=True)
+        self.rates = rates
+        self.fx = fx
+
+    @property
+    def n_paths(self):
+        return self.terminal_capital.shape[1]
+
+    def summary(self, portfolio=0, percentiles=(5, 50, 95)):
+        """Percentiles of average monthly income and terminal capital for one portfolio"""
+        avg_income = self.monthly_income[portfolio].mean(axis=1)
+        terminal = self.terminal_capital[portfolio]
+        result = {
+            'paths': self.n_paths,
+            'mean_monthly_income': float(avg_income.mean()),
+            'mean_terminal_capital': float(terminal.mean()),
+            'prob_income_below_target': float((avg_income < self.monthly_income_target).mean()),
+        }
+        for p, income_q, capital_q in zip(percentiles, np.percentile(avg_income, percentiles),
+                                          np.percentile(terminal, percentiles)):
+            result[f'monthly_income_p{p}'] = float(income_q)
+            result[f'terminal_capital_p{p}'] = float(capital_q)
+        return result
+
+    def income_percentiles(self, portfolio=0, percentiles=(5, 50, 95)):
+        """Percentiles of income per month: (len(percentiles), months)"""
+        return np.percentile(self.monthly_income[portfolio], percentiles, axis=0)
+
+
+def demonstrate_monte_carlo(n_paths=100000):
+    """Распределение дохода и капитала оптимального портфеля"""
+    import time
+    from portfolio_optimizer import DynamicPortfolioOptimizer
+
+    optimizer = DynamicPortfolioOptimizer()
+    weights = optimizer.optimize_portfolio('constant', 'base', 'base')
+
+    print("="*80)
+    print(f"MONTE CARLO: {n_paths:,} ПУТЕЙ СТАВКИ ЦБ И КУРСА USD/RUB")
+    print("="*80)
+
+    start = time.perf_counter()
+    engine = MonteCarloEngine(optimizer, 'base', 'base', seed=42)
+    summary = engine.run_streaming(weights, n_paths).summary()
+    elapsed = time.perf_counter() - start
+
+    print(f"\nСредний месячный доход:  {summary['mean_monthly_income']:>14,.0f} руб")
+    print(f"  5% / 50% / 95%:        {summary['monthly_income_p5']:>14,.0f} / "
+          f"{summary['monthly_income_p50']:,.0f} / {summary['monthly_income_p95']:,.0f} руб")
+    print(f"Итоговый капитал:        {summary['mean_terminal_capital']:>14,.0f} руб")
+    print(f"  5% / 50% / 95%:        {summary['terminal_capital_p5']:>14,.0f} / "
+          f"{summary['terminal_capital_p50']:,.0f} / {summary['terminal_capital_p95']:,.0f} руб")
+    print(f"Вероятность дохода ниже цели: {summary['prob_income_below_target']*100:.1f}%")
+    print(f"Макс. просадка (95%):    {summary['max_drawdown_p95']*100:>14.2f}%")
+    print(f"\n⏱  {elapsed:.2f} с")
+
+    print(f"\nSobol + антитетические пути + контрольные переменные (16 384 пути):")
+    engine = MonteCarloEngine(optimizer, 'base', 'base', seed=42, sampling='sobol', antithetic=True)
+    for quantity in ESTIMATE_QUANTITIES:
+        result = engine.estimate(weights, quantity, 16384)
+        print(f"   {quantity:<26} {result['estimate']:>14,.4f} ± {result['standard_error']:,.4f}  "
+              f"(ESS {result['effective_sample_size']:,.0f}, ×{result['variance_reduction']:.0f})")
+
+
+if __name__ == "__main__":
+    demonstrate_monte_carlo()
@@ -4,6 +4,8 @@ Shows detailed month-by-month payouts from each instrument
 """
 
 from portfolio_optimizer import DynamicPortfolioOptimizer
+from result_store import enable_default_store
+import numpy as np
 import pandas as pd
 
 def generate_monthly_dividend_table():
@@ -100,11 +102,17 @@ def generate_monthly_dividend_table():
         'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь'
     ]
     
+    # Доход по месяцам из помесячных кривых прогнозов (ставка ЦБ и курс на начало месяца)
+    table = optimizer.instrument_table
+    significant = np.array([weight if weight > 0.01 else 0.0 for weight in table.weights_vector(optimal_weights)])
+    month_yields = optimizer.monthly_yield_matrix(len(months), 'base', 'base')
+    month_incomes = total_capital * (month_yields @ significant) / 100 / 12
+    
     monthly_data = []
     cumulative = 0
     
     for i, month in enumerate(months, 1):
-        monthly_income = total_monthly
+        monthly_income = month_incomes[i - 1]
         cumulative += monthly_income
         
         coverage_status = "✅" if monthly_income >= optimizer.monthly_income_target else "⚠️"
@@ -214,5 +222,6 @@ def generate_monthly_dividend_table():
     print("="*100)
 
 if __name__ == "__main__":
+    enable_default_store()
     generate_monthly_dividend_table()
 
@@ -0,0 +1,127 @@
+"""
+Path Set
+Common random numbers: one set of simulated shocks shared by every compared
+portfolio, strategy and scenario
+"""
+
+import numpy as np
+
+from forecast_curves import MONTHS_PER_YEAR
+from monte_carlo import MonteCarloEngine, MonteCarloResult
+from result_cache import ResultCache, result_key
+
+DEFAULT_PATHS = 2000
+
+# Сгенерированные наборы шоков (по параметрам генерации)
+PATH_SET_CACHE = ResultCache(8)
+
+
+class PathSet:
+    """
+    Fixed standard normal shocks (2, n_paths, months) for the rate and FX
+    processes of MonteCarloEngine, plus one extra year of look-ahead (the
+    yearly FX yield of the last months needs the rate a year later).
+
+    Candidates evaluated on the same PathSet see the same market paths, so
+    their differences are estimated from paired samples: the common noise
+    cancels out and far fewer paths are needed than with independent runs.
+    Paths for a (rate, FX) scenario are built from the shocks on first use
+    and cached; different scenarios share the shocks, not the paths.
+    """
+
+    def __init__(self, optimizer, n_paths=DEFAULT_PATHS, years=None, seed=0, **engine_options):
+        self.years = optimizer.years if years is None else years
+        self.months = self.years * MONTHS_PER_YEAR
+        self.seed = seed
+        self.engine_options = engine_options
+        self.key = result_key('path_set', n_paths, self.years, seed, engine_options)
+
+        engine = MonteCarloEngine(optimizer, years=self.years + 1, seed=seed, **engine_options)
+        self.normals = engine._normals(n_paths)
+        self.normals.setflags(write=False)
+        self.n_paths = n_paths
+        self._paths = {}
+
+    def __len__(self):
+        return self.n_paths
+
+    def engine(self, optimizer, rate_scenario='base', fx_scenario='base', lookahead=False):
+        """MonteCarloEngine with this set's parameters (over years, or years + 1 with lookahead)"""
+        years = self.years + 1 if lookahead else self.years
+        return MonteCarloEngine(optimizer, rate_scenario, fx_scenario, years=years, seed=self.seed,
+                                **self.engine_options)
+
+    def paths(self, optimizer, rate_scenario='base', fx_scenario='base'):
+        """
+        Ставка ЦБ (n_paths, months + 12) и курс (n_paths, months + 13), включая год вперед
+
+        Cached per forecast curves and scenario; the arrays are read-only.
+        """
+        key = (optimizer.forecast_curves.key, rate_scenario, fx_scenario)
+        if key not in self._paths:
+            rates, fx = self.engine(optimizer, rate_scenario, fx_scenario, lookahead=True).paths_from_normals(
+                self.normals)
+            rates.setflags(write=False)
+            fx.setflags(write=False)
+            self._paths[key] = (rates, fx)
+        return self._paths[key]
+
+    def evaluate(self, optimizer, weights_matrix, capital_growth_scenario='constant',
+                 rate_scenario='base', fx_scenario='base'):
+        """Static portfolios (k × n, or a weights dict) on these paths: MonteCarloResult"""
+        if isinstance(weights_matrix, dict):
+            weights_matrix = optimizer.instrument_table.weights_vector(weights_matrix)
+        rates, fx = self.paths(optimizer, rate_scenario, fx_scenario)
+        rates, fx = rates[:, :self.months], fx[:, :self.months + 1]
+        engine = self.engine(optimizer, rate_scenario, fx_scenario)
+        income, capital, _ = engine.simulate_chunk(weights_matrix, rates, fx, capital_growth_scenario)
+        return MonteCarloResult(income, capital, optimizer.monthly_income_target, rates, fx)
+
+    def month_yields(self, optimizer, rate_scenario='base', fx_scenario='base'):
+        """
+        Доходности после налогов (%) на начало каждого месяца по каждому пути: (paths, months, n)
+
+        Path counterpart of monthly_yield_matrix: the key rate of the month and
+        the FX move over the following year.
+        """
+        rates, fx = self.paths(optimizer, rate_scenario, fx_scenario)
+        months = np.arange(self.months)
+        return optimizer.instrument_table.after_tax_yields(
+            rates[:, months, None], fx[:, months, None], fx[:, months + MONTHS_PER_YEAR, None],
+            optimizer.usd_spread_pct,
+        )
+
+
+def get_path_set(optimizer, n_paths=DEFAULT_PATHS, years=None, seed=0, **engine_options):
+    """PathSet for these parameters, generated once and reused from PATH_SET_CACHE"""
+    years = optimizer.years if years is None else years
+    key = result_key('path_set', n_paths, years, seed, engine_options)
+    path_set = PATH_SET_CACHE.get(key)
+    if path_set is None:
+        path_set = PathSet(optimizer, n_paths, years, seed, **engine_options)
+        PATH_SET_CACHE.put(key, path_set)
+    return path_set
+
+
+def paired_difference(values, baseline, confidence_z=1.96):
+    """
+    Разница средних двух кандидатов, оцененных на одних и тех же путях
+
+    Returns the mean difference, its standard error from the paired samples,
+    the standard error two independent runs of the same size would have and
+    their variance ratio (how many times fewer paths common random numbers need).
+    """
+    values = np.asarray(values, dtype=float)
+    baseline = np.asarray(baseline, dtype=float)
+    n = len(values)
+    difference = values - baseline
+    paired_se = float(difference.std(ddof=1) / np.sqrt(n))
+    independent_se = float(np.sqrt((values.var(ddof=1) + baseline.var(ddof=1)) / n))
+    mean = float(difference.mean())
+    return {
+        'mean_difference': mean,
+        'standard_error': paired_se,
+        'ci95': (mean - confidence_z * paired_se, mean + confidence_z * paired_se),
+        'independent_standard_error': independent_se,
+        'variance_reduction': (independent_se / paired_se) ** 2 if paired_se > 0 else float('inf'),
+    }
@@ -3,8 +3,44 @@ import numpy as np
 from scipy.optimize import minimize
 import warnings
 import os
+from instrument_table import InstrumentTable
+from yield_engine import YieldCube
+from forecast_curves import ForecastCurves, MONTHS_PER_YEAR
+from warm_start import WarmStartCache
+from result_cache import RESULT_CACHE, result_key
+from result_store import default_store
+from scenario_engine import solve_scenarios
+from monte_carlo import MonteCarloEngine
+from path_set import get_path_set
 warnings.filterwarnings('ignore')
 
+# Ограничение: сумма долей = 1 (с аналитическим якобианом для SLSQP)
+SUM_TO_ONE_CONSTRAINT = {
+    'type': 'eq',
+    'fun': lambda x: np.sum(x) - 1,
+    'jac': lambda x: np.ones_like(x),
+}
+
+# Параметры SLSQP для optimize_portfolio (входят в ключ кэша результатов)
+OPTIMIZE_OPTIONS = {'maxiter': 500, 'ftol': 1e-6}
+# Part of every result key: bump whenever the objective, the solver or the
+# simulation changes, so results stored by an older build are not reused
+RESULT_FORMAT_VERSION = 3
+
+# Поля результата simulate_portfolio_batch (один элемент = один портфель × один год)
+SIMULATION_DTYPE = np.dtype([
+    ('year', np.int32),
+    ('capital_start_rub', np.float64),
+    ('capital_start_usd', np.float64),
+    ('total_capital_start', np.float64),
+    ('portfolio_yield', np.float64),
+    ('annual_income', np.float64),
+    ('monthly_income', np.float64),
+    ('capital_change', np.float64),
+    ('total_capital_end', np.float64),
+    ('usd_share', np.float64),
+])
+
 # Try to import YAML loader
 try:
     from config_loader import ConfigLoader
@@ -13,7 +49,7 @@ except ImportError:
     YAML_AVAILABLE = False
 
 class DynamicPortfolioOptimizer:
-    def __init__(self, use_yaml_config=True):
+    def __init__(self, use_yaml_config=True, use_config_snapshot=False):
         # Начальные параметры (можно редактировать)
         self.initial_capital_rub = 4000000
         self.initial_usd_amount = 10000
@@ -31,16 +67,32 @@ class DynamicPortfolioOptimizer:
             'increase_10': 0.1    # увеличивается 10% в год
         }
         
+        # Внутригодовые кривые прогнозов: 'step' (годовые значения), 'linear' или 'spline';
+        # 12 точек в год - помесячно, 365 - подневно
+        self.curve_interpolation = 'step'
+        self.curve_periods_per_year = MONTHS_PER_YEAR
+        
+        # Предыдущие решения как стартовые точки для следующих оптимизаций
+        self.warm_start = WarmStartCache()
+        self.use_warm_start = True
+        
+        # Кэш результатов (общий для процесса, ключ - хэш всех входных данных)
+        # и постоянное хранилище на диске (переживает перезапуски, None - отключено)
+        self.result_cache = RESULT_CACHE
+        self.result_store = default_store()
+        self.use_result_cache = True
+        
         # Load configuration from YAML files if available
         self.use_yaml = use_yaml_config and YAML_AVAILABLE
         
         if self.use_yaml:
             try:
-                self.config_loader = ConfigLoader()
-                # Load forecasts from YAML
+                # use_config_snapshot: read the compiled snapshot (rebuilt automatically if YAML is newer)
+                self.config_loader = ConfigLoader(use_snapshot=use_config_snapshot)
+                # Load forecasts
                 self.cbr_scenarios = self.config_loader.get_cbr_scenarios()
                 self.fx_scenarios = self.config_loader.get_fx_scenarios()
-                # Load instruments from YAML
+                # Load instruments
                 self.instruments = self.config_loader.load_instruments()
                 # Update instruments with forecast data
                 for name, data in self.instruments.items():
@@ -124,182 +176,414 @@ class DynamicPortfolioOptimizer:
                         'risk': 'низкий', 'tax_free': True, 'currency': 'USD'}  # Keep as currency hedge (0.1% nominal to avoid numerical issues)
         }
     
-    def calculate_after_tax_yield(self, instrument, base_yield, year, scenario):
-        """Расчет доходности после налогов с учетом сценария"""
-        instrument_data = self.instruments[instrument]
-        
-        # Корректировка доходности для инструментов, привязанных к ставке ЦБ
-        if instrument_data.get('cbr_linked', False):
-            cbr_rate = self.cbr_scenarios[scenario][min(year, len(self.cbr_scenarios[scenario])-1)]
-            base_yield = cbr_rate - 0.5  # Ставка ЦБ - 0.5%
-        
-        # Корректировка для инструментов, привязанных к RUONIA (overnight rate)
-        if instrument_data.get('ruonia_linked', False):
-            cbr_rate = self.cbr_scenarios[scenario][min(year, len(self.cbr_scenarios[scenario])-1)]
-            base_yield = cbr_rate - 1.0  # RUONIA ≈ Ставка ЦБ - 1.0%
-        
-        # Налоговая корректировка
-        if instrument_data['tax_free']:
-            after_tax = base_yield
-        else:
-            after_tax = base_yield * 0.87  # НДФЛ 13%
-        
-        # Для валютных инструментов учитываем курс
-        # ИСПРАВЛЕНО: Расчет FX gain для конкретного года (не кумулятивно!)
-        if instrument_data['currency'] == 'USD':
-            # Курс на НАЧАЛО года (предыдущий год)
-            fx_year_start = self.fx_scenarios[scenario][min(year, len(self.fx_scenarios[scenario])-1)]
-            # Курс на КОНЕЦ года (текущий год)
-            fx_year_end = self.fx_scenarios[scenario][min(year + 1, len(self.fx_scenarios[scenario])-1)]
+    @property
+    def instrument_table(self):
+        """
+        Колоночное представление self.instruments
+        
+        Пересобирается, когда меняется любое читаемое таблицей поле, в том числе
+        при правке словаря на месте (ключ - InstrumentTable.source_key).
+        """
+        table = getattr(self, '_instrument_table', None)
+        if table is None or table.key != InstrumentTable.source_key(self.instruments):
+            table = InstrumentTable(self.instruments)
+            self._instrument_table = table
+        return table
+    
+    def invalidate_instrument_table(self):
+        """Принудительно пересобрать таблицу (правки полей обнаруживаются и так)"""
+        self._instrument_table = None
+    
+    @property
+    def yield_cube(self):
+        """Куб доходностей после налогов (пересчитывается при изменении инструментов/прогнозов)"""
+        table = self.instrument_table
+        key = YieldCube.config_key(table, self.cbr_scenarios, self.fx_scenarios, self.usd_spread_pct)
+        cube = getattr(self, '_yield_cube', None)
+        if cube is None or cube.key != key:
+            cube = YieldCube(table, self.cbr_scenarios, self.fx_scenarios, self.usd_spread_pct)
+            self._yield_cube = cube
+        return cube
+    
+    def _result_key(self, kind, capital_growth_scenario, rate_scenario, fx_scenario, *extra):
+        """Хэш всех входных данных, от которых зависит результат kind"""
+        table = self.instrument_table
+        return result_key(
+            kind, RESULT_FORMAT_VERSION,
+            table.names, table.base_yield, table.spread, table.fees, table.tax_factor,
+            table.is_usd, table.rate_linked, table.lower, table.upper,
+            capital_growth_scenario, self.capital_growth_scenarios[capital_growth_scenario],
+            rate_scenario, self.cbr_scenarios[rate_scenario],
+            fx_scenario, self.fx_scenarios[fx_scenario],
+            self.initial_capital_rub, self.initial_usd_amount, self.current_usd_rub,
+            self.monthly_income_target, self.usd_spread_pct, self.years,
+            *extra
+        )
+    
+    def _optimize_key(self, capital_growth_scenario, rate_scenario, fx_scenario,
+                      target_income_coverage=1.0):
+        """Ключ кэша для optimize_portfolio"""
+        return self._result_key('optimize_portfolio', capital_growth_scenario, rate_scenario,
+                                fx_scenario, float(target_income_coverage), 'SLSQP', OPTIMIZE_OPTIONS)
+    
+    def _simulation_key(self, weights_vector, capital_growth_scenario, rate_scenario,
+                        fx_scenario, years=None):
+        """Ключ кэша для simulate_portfolio_performance"""
+        return self._result_key('simulate_portfolio_performance', capital_growth_scenario,
+                                rate_scenario, fx_scenario, weights_vector, years)
+    
+    def _lookup_result(self, key, field, persist=True):
+        """Результат из кэша в памяти, затем (persist=True) из хранилища на диске (или None)"""
+        value = self.result_cache.get(key)
+        if value is None and persist and self.result_store is not None:
+            entry = self.result_store.get(key)
+            if entry is not None and entry[field] is not None:
+                value = entry[field]
+                self.result_cache.put(key, value)
+        return value
+    
+    def _save_result(self, key, kind, field, value, metadata, persist=True):
+        """
+        Сохранить результат в кэш и (persist=True) в хранилище
+        
+        Simulations are cheap and keyed by the weight vector (a new one for
+        every slider move in the web app), so they stay in the memory LRU only.
+        """
+        value.setflags(write=False)
+        self.result_cache.put(key, value)
+        if persist and self.result_store is not None:
+            self.result_store.put(key, kind, metadata=metadata, **{field: value})
+    
+    @property
+    def forecast_curves(self):
+        """Помесячные (или подневные) кривые ставки ЦБ и курса (пересчитываются при изменении прогнозов)"""
+        key = ForecastCurves.config_key(self.cbr_scenarios, self.fx_scenarios,
+                                        self.curve_interpolation, self.curve_periods_per_year)
+        curves = getattr(self, '_forecast_curves', None)
+        if curves is None or curves.key != key:
+            curves = ForecastCurves(self.cbr_scenarios, self.fx_scenarios,
+                                    self.curve_interpolation, self.curve_periods_per_year)
+            self._forecast_curves = curves
+        return curves
+    
+    def _curve_yields(self, index, rate_scenario, fx_scenario):
+        """Доходности после налогов (%) на начало периодов index (len(index) × instruments)"""
+        if fx_scenario is None:
+            fx_scenario = rate_scenario
+        curves = self.forecast_curves
+        index = np.asarray(index)
+        return self.instrument_table.after_tax_yields(
+            curves.cbr_at(rate_scenario, index)[:, None],
+            curves.fx_at(fx_scenario, index)[:, None],
+            curves.fx_at(fx_scenario, index + curves.periods_per_year)[:, None],
+            self.usd_spread_pct,
+        )
+    
+    def period_yield_matrix(self, periods, rate_scenario, fx_scenario=None):
+        """
+        Годовая доходность после налогов (%) на начало каждого периода кривых (periods × instruments)
+        
+        Ставка ЦБ берется из кривой на этот период, валютная доходность - изменение
+        курса за год вперед от начала периода. При curve_interpolation='step'
+        строки совпадают с after_tax_yield_vector соответствующего года.
+        """
+        return self._curve_yields(np.arange(periods), rate_scenario, fx_scenario)
+    
+    def monthly_yield_matrix(self, months, rate_scenario, fx_scenario=None):
+        """То же, что period_yield_matrix, но на начало каждого месяца (при любой частоте кривых)"""
+        return self._curve_yields(self.forecast_curves.month_index(months), rate_scenario, fx_scenario)
+    
+    def after_tax_yield_vector(self, year, rate_scenario, fx_scenario=None):
+        """Доходность после налогов (%) для всех инструментов (в порядке instrument_table)"""
+        if fx_scenario is None:
+            fx_scenario = rate_scenario
+        return self.yield_cube.yields(year, rate_scenario, fx_scenario)
+    
+    def calculate_after_tax_yield(self, instrument, base_yield, year, scenario, fx_scenario=None):
+        """
+        Расчет доходности после налогов с учетом сценария
+        
+        scenario - сценарий ставки ЦБ, fx_scenario - сценарий курса USD/RUB
+        (по умолчанию совпадает со сценарием ставки)
+        """
+        if fx_scenario is None:
+            fx_scenario = scenario
+        table = self.instrument_table
+        i = table.index[instrument]
+        
+        if base_yield == table.base_yield[i] or table.rate_linked[i]:
+            return float(self.yield_cube.yields(year, scenario, fx_scenario)[i])
+        
+        # Нестандартная базовая доходность - считаем напрямую
+        cbr_rates = self.cbr_scenarios[scenario]
+        fx_rates = self.fx_scenarios[fx_scenario]
+        base_yields = table.base_yield.copy()
+        base_yields[i] = base_yield
+        yields = table.after_tax_yields(
+            cbr_rates[min(year, len(cbr_rates)-1)],
+            fx_rates[min(year, len(fx_rates)-1)],      # Курс на НАЧАЛО года
+            fx_rates[min(year + 1, len(fx_rates)-1)],  # Курс на КОНЕЦ года
+            self.usd_spread_pct, base_yield=base_yields
+        )
+        return float(yields[i])
+    
+    def simulate_portfolio_batch(self, weights_matrix, capital_growth_scenario,
+                                 rate_scenario, fx_scenario='base', years=None):
+        """
+        Симуляция сразу k портфелей
+        
+        weights_matrix: (k, n_instruments) в порядке instrument_table (или один вектор / словарь)
+        Возвращает структурированный массив формы (k, years) с полями SIMULATION_DTYPE
+        """
+        if years is None:
+            years = self.years
+        
+        if isinstance(weights_matrix, dict):
+            weights_matrix = self.instrument_table.weights_vector(weights_matrix)
+        weights = np.atleast_2d(np.asarray(weights_matrix, dtype=float))
+        # Учитываем только значимые доли
+        weights = np.where(weights > 0.001, weights, 0.0)
+        k = weights.shape[0]
+        
+        # Доходность портфелей по годам: (k, years)
+        yields = self.yield_cube.year_matrix(years, rate_scenario, fx_scenario)
+        portfolio_yield = weights @ yields.T / 100
+        growth_rate = self.capital_growth_scenarios[capital_growth_scenario]
+        
+        results = np.zeros((k, years), dtype=SIMULATION_DTYPE)
+        initial_total = self.initial_capital_rub + self.initial_usd_amount * self.current_usd_rub
+        # Доля USD сохраняется из года в год (пропорции рубли/USD неизменны)
+        usd_share = self.initial_usd_amount * self.current_usd_rub / initial_total if initial_total else 0.0
+        total_capital = np.full(k, float(initial_total))
+        
+        for year in range(years):
+            row = results[:, year]
+            row['year'] = year + 1
+            row['total_capital_start'] = total_capital
+            if year == 0:
+                row['capital_start_rub'] = self.initial_capital_rub
+                row['capital_start_usd'] = self.initial_usd_amount
+            else:
+                row['capital_start_rub'] = total_capital * (1 - usd_share)
+                row['capital_start_usd'] = total_capital * usd_share / self.current_usd_rub
+            
+            # Годовой и ежемесячный доход
+            annual_income = total_capital * portfolio_yield[:, year]
+            row['portfolio_yield'] = portfolio_yield[:, year] * 100
+            row['annual_income'] = annual_income
+            row['monthly_income'] = annual_income / 12
             
-            # Учитываем bid-ask spread (стоимость конвертации)
-            # При покупке USD: платим fx × (1 + spread/2)
-            # При продаже USD: получаем fx × (1 - spread/2)
-            # Эффективный курс с учетом спреда:
-            fx_buy_rate = fx_year_start * (1 + self.usd_spread_pct / 200)  # Покупка в начале года
-            fx_sell_rate = fx_year_end * (1 - self.usd_spread_pct / 200)   # Продажа в конце года
+            # Изменение капитала согласно сценарию
+            capital_change = total_capital * growth_rate
+            row['capital_change'] = capital_change
             
-            # Прирост ТОЛЬКО за этот год с учетом спреда (в рублях!)
-            fx_gain = (fx_sell_rate - fx_buy_rate) / fx_buy_rate * 100
-            after_tax += fx_gain
+            # Итоговый капитал (не может быть отрицательным)
+            total_capital = np.maximum(total_capital + annual_income + capital_change, 0)
+            row['total_capital_end'] = total_capital
+            row['usd_share'] = usd_share * 100
         
-        return max(after_tax, 0)  # Доходность не может быть отрицательной
+        return results
     
     def simulate_portfolio_performance(self, weights, capital_growth_scenario, 
                                      rate_scenario, fx_scenario='base', years=None):
         """Симуляция работы портфеля на несколько лет"""
+        weights_vector = self.instrument_table.weights_vector(weights)
+        key = None
+        simulation = None
+        if self.use_result_cache:
+            key = self._simulation_key(weights_vector, capital_growth_scenario,
+                                       rate_scenario, fx_scenario, years)
+            simulation = self._lookup_result(key, 'simulation', persist=False)
+        if simulation is None:
+            simulation = self.simulate_portfolio_batch(
+                weights_vector, capital_growth_scenario, rate_scenario, fx_scenario, years
+            )[0]
+            if key is not None:
+                self._save_result(key, 'simulate_portfolio_performance', 'simulation', simulation, {
+                    'capital_scenario': capital_growth_scenario,
+                    'rate_scenario': rate_scenario, 'fx_scenario': fx_scenario,
+                }, persist=False)
+        fields = simulation.dtype.names
+        return [{field: year_row[field].item() for field in fields} for year_row in simulation]
+    
+    def monte_carlo(self, weights, capital_growth_scenario='constant', rate_scenario='base',
+                    fx_scenario='base', n_paths=100000, seed=None, max_workers=None, **engine_options):
+        """
+        Стохастическая симуляция портфеля (или матрицы портфелей) на n_paths путях
+        
+        Пути ставки ЦБ и курса строятся вокруг выбранных сценариев (см. MonteCarloEngine),
+        блоки путей считаются в пуле процессов. Возвращает MonteCarloResult.
+        """
+        engine = MonteCarloEngine(self, rate_scenario, fx_scenario, seed=seed, **engine_options)
+        return engine.run_parallel(weights, n_paths, capital_growth_scenario, max_workers=max_workers)
+    
+    def path_set(self, n_paths=2000, seed=0, years=None, **engine_options):
+        """
+        Общий набор путей ставки ЦБ и курса для сравнения кандидатов (см. path_set.PathSet)
+        
+        Генерируется один раз для заданных параметров и переиспользуется.
+        """
+        return get_path_set(self, n_paths, years, seed, **engine_options)
+    
+    def goal_probabilities(self, weights, capital_growth_scenario='constant', rate_scenario='base',
+                           fx_scenario='base', tolerance=0.01, time_budget=2.0, seed=None, **engine_options):
+        """
+        Вероятности достичь цели по доходу и сохранить капитал (Monte Carlo с ранней остановкой)
+        
+        Пути добавляются пачками, пока доверительный интервал не станет уже tolerance
+        или не истечёт time_budget секунд (см. MonteCarloEngine.goal_probabilities).
+        """
+        engine = MonteCarloEngine(self, rate_scenario, fx_scenario, seed=seed, **engine_options)
+        return engine.goal_probabilities(weights, capital_growth_scenario, tolerance=tolerance,
+                                         time_budget=time_budget)
+    
+    def _capital_path_with_gradient(self, weights, capital_growth_scenario,
+                                    rate_scenario, fx_scenario='base', years=None):
+        """
+        Капитал по годам и его производные по весам (для аналитических градиентов)
+        
+        Та же модель, что и simulate_portfolio_batch, но без порога 0.001 на доли,
+        чтобы функция была гладкой. Возвращает:
+        - yields: (years, n) доходности инструментов (доли, не %)
+        - portfolio_yield: (years,) доходность портфеля p_y = yields[y] @ w
+        - capital: (years + 1,) капитал на начало каждого года T_y (и конец последнего)
+        - d_capital: (years + 1, n) производные dT_y/dw
+        """
         if years is None:
             years = self.years
-            
-        results = []
-        current_capital_rub = self.initial_capital_rub
-        current_usd = self.initial_usd_amount
-        total_capital = current_capital_rub + current_usd * self.current_usd_rub
+        
+        yields = self.yield_cube.year_matrix(years, rate_scenario, fx_scenario) / 100
+        portfolio_yield = yields @ weights
+        growth_rate = self.capital_growth_scenarios[capital_growth_scenario]
+        
+        capital = np.zeros(years + 1)
+        d_capital = np.zeros((years + 1, len(weights)))
+        capital[0] = self.initial_capital_rub + self.initial_usd_amount * self.current_usd_rub
         
         for year in range(years):
-            year_results = {
-                'year': year + 1,
-                'capital_start_rub': current_capital_rub,
-                'capital_start_usd': current_usd,
-                'total_capital_start': total_capital
-            }
-            
-            # Расчет доходности портфеля за год
-            portfolio_yield = 0
-            monthly_income = 0
-            
-            for instrument, weight in weights.items():
-                if weight > 0.001:  # учитываем только значимые доли
-                    instrument_data = self.instruments[instrument]
-                    base_yield = instrument_data['yield']
-                    
-                    # Корректируем доходность
-                    adjusted_yield = self.calculate_after_tax_yield(
-                        instrument, base_yield, year, rate_scenario
-                    )
-                    
-                    instrument_contribution = weight * adjusted_yield / 100
-                    portfolio_yield += instrument_contribution
-                    
-                    # Ежемесячный доход от инструмента
-                    monthly_income += (total_capital * weight * adjusted_yield / 100) / 12
-            
-            # Годовой доход и изменение капитала
-            annual_income = total_capital * portfolio_yield
-            year_results['portfolio_yield'] = portfolio_yield * 100
-            year_results['annual_income'] = annual_income
-            year_results['monthly_income'] = monthly_income
-            
-            # Изменение капитала согласно сценарию
+            # T_{y+1} = T_y * (1 + p_y + g), капитал не может быть отрицательным
+            next_capital = capital[year] * (1 + portfolio_yield[year] + growth_rate)
+            if next_capital > 0:
+                capital[year + 1] = next_capital
+                d_capital[year + 1] = (d_capital[year] * (1 + portfolio_yield[year] + growth_rate)
+                                       + capital[year] * yields[year])
+        
+        return yields, portfolio_yield, capital, d_capital
+    
+    def _optimization_objective(self, weights, capital_growth_scenario, rate_scenario,
+                                fx_scenario, target_income_coverage):
+        """Целевая функция optimize_portfolio и ее аналитический градиент"""
+        yields, portfolio_yield, capital, d_capital = self._capital_path_with_gradient(
+            weights, capital_growth_scenario, rate_scenario, fx_scenario
+        )
+        capital_start = capital[:-1]
+        
+        # Штраф за недополучение дохода: sum (c - m_y/target)^2 по годам с m_y/target < c
+        monthly_income = capital_start * portfolio_yield / 12
+        d_monthly_income = (d_capital[:-1] * portfolio_yield[:, None]
+                            + capital_start[:, None] * yields) / 12
+        income_gap = np.maximum(target_income_coverage - monthly_income / self.monthly_income_target, 0)
+        income_shortfalls = float(income_gap @ income_gap)
+        d_income_shortfalls = -2 * (income_gap / self.monthly_income_target) @ d_monthly_income
+        
+        # Штраф за уменьшение капитала (если это не запланировано): sum (1 - T_{y+1}/T_y)^2
+        capital_decline = 0.0
+        d_capital_decline = np.zeros_like(weights)
+        if capital_growth_scenario not in ['decrease_5', 'decrease_10']:
+            alive = capital_start > 0
             growth_rate = self.capital_growth_scenarios[capital_growth_scenario]
-            capital_change = total_capital * growth_rate
-            
-            # Итоговый капитал
-            total_capital = total_capital + annual_income + capital_change
-            total_capital = max(total_capital, 0)  # Капитал не может быть отрицательным
-            
-            # Распределение между рублями и USD (сохраняем пропорции)
-            usd_share = current_usd * self.current_usd_rub / year_results['total_capital_start']
-            current_capital_rub = total_capital * (1 - usd_share)
-            current_usd = total_capital * usd_share / self.current_usd_rub
-            
-            year_results['capital_change'] = capital_change
-            year_results['total_capital_end'] = total_capital
-            year_results['usd_share'] = usd_share * 100
-            
-            results.append(year_results)
+            # Пока капитал положителен, T_{y+1}/T_y = 1 + p_y + g, а d(ratio)/dw = yields[y]
+            capital_ratio = np.where(capital[1:] > 0, 1 + portfolio_yield + growth_rate, 0.0)
+            capital_gap = np.where(alive, np.maximum(1.0 - capital_ratio, 0), 0.0)
+            capital_decline = float(capital_gap @ capital_gap)
+            d_capital_decline = -2 * (capital_gap * (capital[1:] > 0)) @ yields
         
-        return results
+        # Штраф за концентрацию рисков
+        concentration_penalty = float(weights @ weights) * 10
+        d_concentration_penalty = 20 * weights
+        
+        total_penalty = income_shortfalls * 100 + capital_decline * 50 + concentration_penalty
+        gradient = d_income_shortfalls * 100 + d_capital_decline * 50 + d_concentration_penalty
+        
+        return total_penalty, gradient
     
     def optimize_portfolio(self, capital_growth_scenario='constant', 
                          rate_scenario='base', fx_scenario='base', 
                          target_income_coverage=1.0):
         """Оптимизация портфеля для заданных сценариев"""
-        instruments_list = list(self.instruments.keys())
-        n_instruments = len(instruments_list)
+        table = self.instrument_table
+        n_instruments = len(table)
+        options = dict(OPTIMIZE_OPTIONS)
+        
+        key = None
+        if self.use_result_cache:
+            key = self._optimize_key(capital_growth_scenario, rate_scenario, fx_scenario,
+                                     target_income_coverage)
+            cached = self._lookup_result(key, 'weights')
+            if cached is not None:
+                return table.weights_dict(cached)
         
         def objective(weights_array):
-            # Преобразуем массив в словарь
-            weights_dict = {instrument: weights_array[i] for i, instrument in enumerate(instruments_list)}
-            
-            # Симулируем работу портфеля
-            simulation = self.simulate_portfolio_performance(
-                weights_dict, capital_growth_scenario, rate_scenario, fx_scenario
+            # Штрафы за недополучение дохода, снижение капитала и концентрацию + градиент
+            return self._optimization_objective(
+                weights_array, capital_growth_scenario, rate_scenario,
+                fx_scenario, target_income_coverage
             )
-            
-            # Целевая функция: максимизация покрытия расходов и минимизация риска
-            total_penalty = 0
-            income_shortfalls = 0
-            capital_decline = 0
-            
-            for year_result in simulation:
-                # Штраф за недополучение дохода
-                income_ratio = year_result['monthly_income'] / self.monthly_income_target
-                if income_ratio < target_income_coverage:
-                    income_shortfalls += (target_income_coverage - income_ratio) ** 2
-                
-                # Штраф за уменьшение капитала (если это не запланировано)
-                if capital_growth_scenario not in ['decrease_5', 'decrease_10']:
-                    capital_ratio = year_result['total_capital_end'] / year_result['total_capital_start']
-                    if capital_ratio < 1.0:
-                        capital_decline += (1.0 - capital_ratio) ** 2
-            
-            # Штраф за концентрацию рисков
-            concentration_penalty = sum([w**2 for w in weights_array]) * 10
-            
-            total_penalty = income_shortfalls * 100 + capital_decline * 50 + concentration_penalty
-            
-            return total_penalty
-        
-        # Ограничения
-        constraints = [
-            {'type': 'eq', 'fun': lambda x: sum(x) - 1}  # сумма долей = 1
-        ]
-        
-        # Границы для каждого инструмента
-        bounds = []
-        for instrument in instruments_list:
-            instrument_data = self.instruments[instrument]
-            
-            if instrument == 'Структурная облигация Сбер':
-                bounds.append((0, 0.2))  # максимум 20%
-            elif instrument_data['currency'] == 'USD':
-                bounds.append((0, 0.4))  # максимум 40% в валюте
-            elif instrument_data['risk'] == 'низкий':
-                bounds.append((0, 0.5))  # гибкие границы для надежных инструментов
-            else:
-                bounds.append((0, 0.4))
         
         # Начальное приближение (равномерное распределение)
         x0 = np.array([1/n_instruments] * n_instruments)
         
-        # Оптимизация
-        result = minimize(objective, x0, method='SLSQP', 
-                         constraints=constraints, bounds=bounds, 
-                         options={'maxiter': 500, 'ftol': 1e-6})
+        # Оптимизация (jac=True: objective возвращает значение и аналитический градиент)
+        # Кэшируемый результат - только из холодного старта: иначе ответ по ключу
+        # содержимого зависел бы от того, какая задача решалась перед ним
+        result, x0 = self._minimize_slsqp('optimize_portfolio', objective, x0, options=options,
+                                          warm_start=key is None)
         
         optimal_weights = result.x if result.success else x0
-        return {instrument: optimal_weights[i] for i, instrument in enumerate(instruments_list)}
+        if key is not None:
+            self._save_result(key, 'optimize_portfolio', 'weights', np.array(optimal_weights), {
+                'capital_scenario': capital_growth_scenario,
+                'rate_scenario': rate_scenario, 'fx_scenario': fx_scenario,
+                'solver': 'SLSQP', 'success': bool(result.success), 'iterations': int(result.nit),
+                'objective': float(result.fun), 'message': str(result.message),
+            })
+        return table.weights_dict(optimal_weights)
+    
+    def _minimize_slsqp(self, family, objective, x0, options, warm_start=True):
+        """
+        SLSQP (sum = 1, границы instrument_table) с теплым стартом
+        
+        objective возвращает (значение, градиент). Если для семейства задач есть
+        предыдущее решение и оно не хуже x0, стартуем из него; если теплый старт
+        не сошелся - повторяем из x0. Возвращает (result, фактический x0).
+        warm_start=False always starts from x0 (results that go to the
+        content-addressed caches must not depend on earlier solves); the
+        solution is still recorded as a start for later warm solves.
+        """
+        table = self.instrument_table
+        family = (family, table.names)
+        bounds = table.bounds()
+        
+        def solve(start):
+            return minimize(objective, start, method='SLSQP', jac=True,
+                            constraints=[SUM_TO_ONE_CONSTRAINT],  # сумма долей = 1
+                            bounds=bounds, options=options)
+        
+        start, warm = x0, False
+        if self.use_warm_start and warm_start:
+            candidate, found = self.warm_start.initial_guess(family, x0)
+            if found and objective(candidate)[0] <= objective(x0)[0]:
+                start, warm = candidate, True
+        
+        result = solve(start)
+        if warm and not result.success:
+            start, warm = x0, False
+            result = solve(start)
+        
+        if result.success:
+            self.warm_start.record(family, result.x, result.nit, warm)
+        
+        return result, start
     
     def generate_recommendations(self, capital_growth_scenario='constant', 
                                rate_scenario='base', fx_scenario='base'):
@@ -388,8 +672,13 @@ class DynamicPortfolioOptimizer:
         else:
             print("\n❌ Стратегия не обеспечивает целевой доход")
     
-    def compare_scenarios(self):
-        """Сравнение различных сценариев"""
+    def compare_scenarios(self, common_paths=False):
+        """
+        Сравнение различных сценариев
+        
+        common_paths=True добавляет вероятность дохода ниже цели для каждого
+        сценария на одном наборе путей ставки и курса (см. path_set).
+        """
         print(f"\n{'='*80}")
         print("СРАВНЕНИЕ СЦЕНАРИЕВ")
         print(f"{'='*80}")
@@ -404,12 +693,12 @@ class DynamicPortfolioOptimizer:
         
         comparison_results = []
         
-        for capital_scenario, rate_scenario, fx_scenario, label in scenarios_to_compare:
+        # Сценарии независимы: решаем пакетом (при большом числе - в пуле процессов)
+        solutions = solve_scenarios(self, [scenario[:3] for scenario in scenarios_to_compare])
+        
+        for (capital_scenario, rate_scenario, fx_scenario, label), solution in zip(scenarios_to_compare, solutions):
             print(f"\nАнализ сценария: {label}...")
-            optimal_weights = self.optimize_portfolio(capital_scenario, rate_scenario, fx_scenario)
-            simulation = self.simulate_portfolio_performance(
-                optimal_weights, capital_scenario, rate_scenario, fx_scenario
-            )
+            simulation = solution['simulation']
             
             avg_yield = sum([r['portfolio_yield'] for r in simulation]) / len(simulation)
             avg_income = sum([r['monthly_income'] for r in simulation]) / len(simulation)
@@ -427,6 +716,21 @@ class DynamicPortfolioOptimizer:
         print(f"\n📋 СВОДНОЕ СРАВНЕНИЕ:")
         df_comparison = pd.DataFrame(comparison_results)
         print(df_comparison.to_string(index=False))
+        
+        if common_paths:
+            # Неопределенность: все сценарии на одних и тех же шоках ставки и курса
+            path_set = self.path_set()
+            print(f"\n🎲 Вероятность дохода ниже цели ({len(path_set):,} общих путей ставки ЦБ и курса):")
+            for (capital_scenario, rate_scenario, fx_scenario, label), solution in zip(scenarios_to_compare, solutions):
+                result = path_set.evaluate(self, solution['weights'], capital_scenario, rate_scenario, fx_scenario)
+                print(f"   {label:<25} {result.summary()['prob_income_below_target']*100:5.1f}%")
+        
+        warm_stats = self.warm_start.stats()
+        print(f"\n⚡ Теплый старт: {warm_stats['warm_solves']} из {warm_stats['solves']} решений, "
+              f"сэкономлено ~{warm_stats['iterations_saved']:.0f} итераций SLSQP")
+        cache_stats = self.result_cache.stats()
+        print(f"💾 Кэш результатов: {cache_stats['hits']} попаданий, {cache_stats['misses']} промахов "
+              f"({cache_stats['hit_rate']*100:.0f}%)")
 
 
 def main():
@@ -4,15 +4,17 @@ Maximizes total returns over different time horizons
 """
 
 from portfolio_optimizer import DynamicPortfolioOptimizer
+from path_set import paired_difference
 import numpy as np
-from scipy.optimize import minimize
+from scipy.optimize import linprog
 import pandas as pd
 
 class ProfitMaximizer(DynamicPortfolioOptimizer):
     """Optimizer focused on maximizing total profit"""
     
     def optimize_for_max_profit(self, years_horizon, rate_scenario='base', 
-                                fx_scenario='base', capital_scenario='constant'):
+                                fx_scenario='base', capital_scenario='constant',
+                                use_lp=True):
         """
         Оптимизация для максимизации прибыли за заданный период
         
@@ -20,67 +22,86 @@ class ProfitMaximizer(DynamicPortfolioOptimizer):
         - years_horizon: 1, 2, или 3 года
         - rate_scenario: сценарий ставок ЦБ
         - fx_scenario: сценарий курса валют
+        - use_lp: решать линейный случай точно (scipy HiGHS)
+        
+        Если капитал на начало каждого года не зависит от весов (горизонт 1 год),
+        прибыль T0·(yields·w) линейна по весам, а ограничения - симплекс с границами:
+        задача решается точно как LP. При более длинном горизонте доход
+        реинвестируется (сложный процент) и цель нелинейна - тогда SLSQP,
+        стартующий из решения линеаризованной LP.
+        
+        Returns dict с ключом 'solver': 'lp' или 'slsqp' (какой путь был выбран)
         """
-        instruments_list = list(self.instruments.keys())
-        n_instruments = len(instruments_list)
+        table = self.instrument_table
+        n_instruments = len(table)
+        bounds = table.bounds()
+        
+        yields_matrix = self.yield_cube.year_matrix(years_horizon, rate_scenario, fx_scenario) / 100
+        initial_total = self.initial_capital_rub + self.initial_usd_amount * self.current_usd_rub
+        profit_scale = max(initial_total, 1.0)
+        
+        # Линеаризация: капитал по годам без реинвестирования дохода, T_y = T0·(1+g)^y
+        growth_rate = self.capital_growth_scenarios[capital_scenario]
+        linear_capital = initial_total * (1 + growth_rate) ** np.arange(years_horizon)
+        linear_profit = linear_capital @ yields_matrix
+        
+        lp_weights = None
+        if use_lp:
+            lp_result = linprog(-linear_profit / profit_scale, A_eq=np.ones((1, n_instruments)),
+                                b_eq=[1.0], bounds=bounds, method='highs')
+            if lp_result.success:
+                lp_weights = np.clip(lp_result.x, table.lower, table.upper)
+        
+        # Горизонт 1 год: прибыль линейна - LP дает точный оптимум (вершину многогранника)
+        if lp_weights is not None and years_horizon <= 1:
+            return {
+                'weights': table.weights_dict(lp_weights),
+                'total_profit': float(linear_profit @ lp_weights),
+                'success': True,
+                'solver': 'lp'
+            }
         
         def objective(weights_array):
-            """Максимизация прибыли = минимизация отрицательной прибыли"""
-            weights_dict = {instrument: weights_array[i] 
-                          for i, instrument in enumerate(instruments_list)}
-            
-            # Симулируем портфель
-            simulation = self.simulate_portfolio_performance(
-                weights_dict, capital_scenario, rate_scenario, fx_scenario, years=years_horizon
+            """Максимизация прибыли = минимизация отрицательной прибыли (+ аналитический градиент)"""
+            _, portfolio_yield, capital, d_capital = self._capital_path_with_gradient(
+                weights_array, capital_scenario, rate_scenario, fx_scenario, years=years_horizon
             )
             
-            # Считаем общую прибыль за период
-            total_profit = 0
-            for year_result in simulation:
-                total_profit += year_result['annual_income']
+            # Общая прибыль за период: sum T_y * p_y
+            total_profit = float(capital[:-1] @ portfolio_yield)
+            d_total_profit = portfolio_yield @ d_capital[:-1] + capital[:-1] @ yields_matrix
             
             # Минимизируем ОТРИЦАТЕЛЬНУЮ прибыль = максимизируем прибыль!
-            return -total_profit
-        
-        # Ограничения
-        constraints = [
-            {'type': 'eq', 'fun': lambda x: sum(x) - 1}  # сумма = 1
-        ]
+            # (в долях начального капитала - иначе SLSQP плохо обусловлен при значениях ~1e6)
+            return -total_profit / profit_scale, -d_total_profit / profit_scale
         
-        # Границы (те же что и раньше)
-        bounds = []
-        for instrument in instruments_list:
-            instrument_data = self.instruments[instrument]
-            
-            if instrument == 'Структурная облигация Сбер':
-                bounds.append((0, 0.2))
-            elif instrument_data['currency'] == 'USD':
-                bounds.append((0, 0.4))
-            elif instrument_data['risk'] == 'низкий':
-                bounds.append((0, 0.5))
-            else:
-                bounds.append((0, 0.4))
-        
-        # Начальное приближение
-        x0 = np.array([1/n_instruments] * n_instruments)
+        # Начальное приближение: решение линеаризованной LP (или равномерное),
+        # либо предыдущее решение, если оно лучше (теплый старт)
+        x0 = lp_weights if lp_weights is not None else np.array([1/n_instruments] * n_instruments)
         
         # Оптимизация
-        result = minimize(objective, x0, method='SLSQP', 
-                         constraints=constraints, bounds=bounds,
-                         options={'maxiter': 500, 'ftol': 1e-6})
+        result, x0 = self._minimize_slsqp(
+            'optimize_for_max_profit', objective, x0, options={'maxiter': 500, 'ftol': 1e-6}
+        )
         
         optimal_weights = result.x if result.success else x0
-        optimal_profit = -result.fun if result.success else 0
+        optimal_profit = -result.fun * profit_scale if result.success else 0
         
         return {
-            'weights': {instrument: optimal_weights[i] for i, instrument in enumerate(instruments_list)},
+            'weights': table.weights_dict(optimal_weights),
             'total_profit': optimal_profit,
-            'success': result.success
+            'success': result.success,
+            'solver': 'slsqp'
         }
 
 
-def compare_profit_scenarios():
-    """Сравнение оптимизации для 1, 2 и 3 лет"""
+def compare_profit_scenarios(common_paths=False):
+    """
+    Сравнение оптимизации для 1, 2 и 3 лет
+    
+    common_paths=True добавляет итоговый капитал портфелей всех горизонтов
+    на одном наборе путей ставки и курса (см. path_set).
+    """
     
     print("="*100)
     print("МАКСИМИЗАЦИЯ ПРИБЫЛИ - СРАВНЕНИЕ ГОРИЗОНТОВ")
@@ -104,6 +125,7 @@ def compare_profit_scenarios():
     ]
     
     results_summary = []
+    horizon_weights = []
     
     for years, label in scenarios:
         print(f"\n{'='*100}")
@@ -119,6 +141,8 @@ def compare_profit_scenarios():
         
         weights = result['weights']
         total_profit = result['total_profit']
+        solver_label = 'точное LP (HiGHS)' if result['solver'] == 'lp' else 'SLSQP (сложный процент)'
+        print(f"Метод решения: {solver_label}")
         
         # Детальная симуляция
         simulation = optimizer.simulate_portfolio_performance(
@@ -188,6 +212,7 @@ def compare_profit_scenarios():
             'Топ инструмент': max(weights.items(), key=lambda x: x[1])[0],
             'Топ доля': max(weights.values()) * 100
         })
+        horizon_weights.append(optimizer.instrument_table.weights_vector(weights))
     
     # Сравнительная таблица
     print(f"\n{'='*100}")
@@ -197,6 +222,17 @@ def compare_profit_scenarios():
     df_summary = pd.DataFrame(results_summary)
     print(df_summary.to_string(index=False))
     
+    if common_paths:
+        # Портфели всех горизонтов на одних и тех же путях ставки и курса (3 года)
+        path_set = optimizer.path_set(years=3)
+        paths_result = path_set.evaluate(optimizer, np.array(horizon_weights))
+        print(f"\n🎲 Итоговый капитал через 3 года на {len(path_set):,} общих путях ставки ЦБ и курса "
+              f"(разница с портфелем на {scenarios[0][1]}):")
+        for i, (years, label) in enumerate(scenarios):
+            difference = paired_difference(paths_result.terminal_capital[i], paths_result.terminal_capital[0])
+            print(f"   {label:7s}: {paths_result.terminal_capital[i].mean():>14,.0f} руб "
+                  f"({difference['mean_difference']:>+10,.0f} ± {difference['standard_error']:,.0f})")
+    
     # Анализ
     print(f"\n{'='*100}")
     print("🔍 АНАЛИЗ:")
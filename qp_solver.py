@@ -0,0 +1,86 @@
+"""
+QP Solver
+Exact solvers for small quadratic programs over the box-constrained simplex
+"""
+
+import numpy as np
+
+
+def project_capped_simplex(point, lower, upper, total=1.0):
+    """
+    Евклидова проекция точки на {w : sum(w) = total, lower <= w <= upper}
+
+    Решение имеет вид w_i = clip(point_i - tau, lower_i, upper_i), где сумма
+    g(tau) = sum clip(...) кусочно-линейна и не возрастает по tau. Перебираем
+    точки излома g и находим tau точно линейной интерполяцией на нужном отрезке.
+    """
+    point = np.asarray(point, dtype=float)
+    lower = np.asarray(lower, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+
+    if lower.sum() > total + 1e-12 or upper.sum() < total - 1e-12:
+        raise ValueError("Infeasible bounds: sum(lower) <= total <= sum(upper) is required")
+
+    # Точки излома g(tau) и значения g в них (по убыванию g)
+    breakpoints = np.unique(np.concatenate([point - lower, point - upper]))
+    sums = np.clip(point[None, :] - breakpoints[:, None], lower, upper).sum(axis=1)
+
+    # g убывает по tau: ищем соседние изломы с sums[j] >= total >= sums[j+1]
+    j = np.searchsorted(-sums, -total, side='right') - 1
+    if j < 0:
+        tau = breakpoints[0]
+    elif j >= len(breakpoints) - 1:
+        tau = breakpoints[-1]
+    else:
+        lo, hi = breakpoints[j], breakpoints[j + 1]
+        g_lo, g_hi = sums[j], sums[j + 1]
+        tau = lo if g_lo == g_hi else lo + (g_lo - total) * (hi - lo) / (g_lo - g_hi)
+
+    return np.clip(point - tau, lower, upper)
+
+
+def project_capped_simplex_rows(points, lower, upper, total=1.0):
+    """
+    project_capped_simplex для каждой строки матрицы points (rows × n) сразу
+
+    Same breakpoint search, vectorized over rows (used to solve one QP per
+    Monte Carlo path at once).
+    """
+    points = np.asarray(points, dtype=float)
+    lower = np.asarray(lower, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+
+    if lower.sum() > total + 1e-12 or upper.sum() < total - 1e-12:
+        raise ValueError("Infeasible bounds: sum(lower) <= total <= sum(upper) is required")
+
+    breakpoints = np.sort(np.concatenate([points - lower, points - upper], axis=1), axis=1)
+    sums = np.clip(points[:, None, :] - breakpoints[:, :, None], lower, upper).sum(axis=2)
+
+    # Последний излом с g >= total (g не возрастает вдоль строки)
+    rows = np.arange(points.shape[0])
+    last = breakpoints.shape[1] - 1
+    j = (sums >= total).sum(axis=1) - 1
+    inner = np.clip(j, 0, last - 1)
+    lo, hi = breakpoints[rows, inner], breakpoints[rows, inner + 1]
+    g_lo, g_hi = sums[rows, inner], sums[rows, inner + 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tau = np.where(g_lo == g_hi, lo, lo + (g_lo - total) * (hi - lo) / (g_lo - g_hi))
+    tau = np.where(j < 0, breakpoints[:, 0], np.where(j >= last, breakpoints[:, -1], tau))
+
+    return np.clip(points - tau[:, None], lower, upper)
+
+
+def solve_concentration_qp(expected_returns, concentration, lower, upper, total=1.0):
+    """
+    Точное решение min  -r·w + c·||w||²  при sum(w) = total, lower <= w <= upper
+
+    Так как -r·w + c·||w||² = c·||w - r/(2c)||² + const, оптимум -
+    проекция r/(2c) на ограниченный симплекс. For a matrix of expected
+    returns (rows × n) every row is solved independently.
+    """
+    if concentration <= 0:
+        raise ValueError("concentration must be positive for a strictly convex QP")
+    target = np.asarray(expected_returns, dtype=float) / (2 * concentration)
+    if target.ndim == 2:
+        return project_capped_simplex_rows(target, lower, upper, total)
+    return project_capped_simplex(target, lower, upper, total)
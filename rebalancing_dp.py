@@ -0,0 +1,140 @@
+"""
+Rebalancing DP
+Optimal rebalancing schedule by backward induction over a discretized weight grid
+"""
+
+import numpy as np
+
+# One Bellman step costs O(states · n² · steps) time and O(states) memory:
+# a 1% grid over four instruments (~26k states) takes seconds for 10 years
+MAX_GRID_STATES = 60000
+
+
+def simplex_grid(lower, upper, steps):
+    """
+    Все веса с шагом 1/steps: sum(w) = 1, lower <= w <= upper (states × n)
+
+    Weights are multiples of 1/steps; bounds are rounded inwards to the grid.
+    """
+    lower = np.asarray(lower, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+    low = np.ceil(lower * steps - 1e-9).astype(int)
+    high = np.floor(upper * steps + 1e-9).astype(int)
+
+    # Наращиваем частичные векторы по одному инструменту, отсекая недостижимые суммы
+    points = np.zeros((1, 0), dtype=int)
+    for i in range(len(lower)):
+        remaining_low, remaining_high = low[i + 1:].sum(), high[i + 1:].sum()
+        options = np.arange(low[i], high[i] + 1)
+        points = np.hstack([np.repeat(points, len(options), axis=0),
+                            np.tile(options, len(points))[:, None]])
+        totals = points.sum(axis=1)
+        points = points[(totals + remaining_low <= steps) & (totals + remaining_high >= steps)]
+
+    if len(points) == 0:
+        raise ValueError(f"No weights on a 1/{steps} grid satisfy the bounds; use a finer grid")
+    return points / steps
+
+
+def _grid_steps(grid):
+    """Шаг сетки simplex_grid: веса кратны 1/steps"""
+    values = np.unique(grid)
+    steps = int(round(1 / np.diff(values).min())) if len(values) > 1 else 1
+    if not np.allclose(grid * steps, np.rint(grid * steps)):
+        raise ValueError("grid must contain multiples of 1/steps (use simplex_grid)")
+    return steps
+
+
+def _transfer_neighbors(points, steps):
+    """
+    Индексы соседей по одной единичной передаче веса i -> j: (n·(n-1), states)
+
+    points are integer grid coordinates; missing neighbours (outside the
+    bounds) point to the extra index len(points).
+    """
+    n = points.shape[1]
+    radix = (steps + 1) ** np.arange(n)
+    codes = points @ radix
+    order = np.argsort(codes)
+    sorted_codes = codes[order]
+    pairs = [(i, j) for i in range(n) for j in range(n) if i != j]
+    neighbors = np.full((len(pairs), len(points)), len(points), dtype=np.int64)
+    for row, (i, j) in enumerate(pairs):
+        valid = (points[:, i] > 0) & (points[:, j] < steps)
+        target = codes[valid] - radix[i] + radix[j]
+        position = np.minimum(np.searchsorted(sorted_codes, target), len(codes) - 1)
+        found = sorted_codes[position] == target
+        neighbors[row, np.flatnonzero(valid)[found]] = order[position[found]]
+    return neighbors
+
+
+def solve_rebalancing_schedule(month_yields, grid, transaction_cost_pct):
+    """
+    Когда и во что ребалансировать, чтобы максимизировать итоговый капитал
+
+    month_yields: (months, n) annual after-tax yields (%) of each month,
+    grid: (states, n) weight vectors from simplex_grid. Each month the capital
+    is multiplied by (1 - cost·|w' - w|₁) for moving from w to w' and then by
+    (1 + yields·w'/1200), so log-capital is additive and backward induction
+    over the grid is exact:
+
+        V_t(w) = max_w' [log(1 - cost·|w' - w|₁) + log(1 + yields_t·w'/1200) + V_{t+1}(w')]
+
+    Grid points at L1 distance 2k/steps are exactly k unit transfers apart
+    (within the bounds), and the trade factor only falls with distance, so
+
+        V_t(w) = max_k [log(1 - cost·2k/steps) + max of continuation within k transfers of w]
+
+    The inner maxima grow by one neighbour step per k, with no states × states
+    table; k stops once no trade can beat staying put. Only the transfer
+    count of the best move is kept per state, and the target is recovered
+    along the optimal path afterwards.
+
+    The first allocation is free (as in optimize_with_monthly_rebalancing).
+    Returns (state index per month (months,), log growth of the schedule).
+    """
+    month_yields = np.asarray(month_yields, dtype=float)
+    grid = np.asarray(grid, dtype=float)
+    months, states = len(month_yields), len(grid)
+    if states > MAX_GRID_STATES:
+        raise ValueError(f"{states} grid states exceed {MAX_GRID_STATES}; use a coarser grid")
+
+    steps = _grid_steps(grid)
+    points = np.rint(grid * steps).astype(np.int64)
+    neighbors = _transfer_neighbors(points, steps)
+    # log(1 - cost·|Δw|₁) после k единичных передач (|Δw|₁ = 2k/steps)
+    log_keep = np.log(1 - transaction_cost_pct / 100 * 2 * np.arange(steps + 1) / steps)
+    # log(1 + доход месяца) для каждого состояния и месяца: (months, states)
+    log_growth = np.log1p(month_yields @ grid.T / 1200)
+
+    values = np.zeros((months + 1, states))  # V_t; V_months = 0
+    transfers = np.zeros((months, states), dtype=np.int16)  # k лучшего перехода
+    ball = np.empty(states + 1)  # максимум продолжения в шаре; последний элемент - "нет соседа"
+    ball[states] = -np.inf
+    for month in range(months - 1, 0, -1):
+        continuation = log_growth[month] + values[month + 1]
+        best = continuation.copy()
+        ball[:states] = continuation
+        top = continuation.max()
+        for k in range(1, steps + 1):
+            if log_keep[k] + top <= best.min():
+                break
+            grown = ball[:states].copy()
+            for row in neighbors:
+                np.maximum(grown, ball[row], out=grown)
+            ball[:states] = grown
+            candidate = grown + log_keep[k]
+            improved = candidate > best
+            best[improved] = candidate[improved]
+            transfers[month, improved] = k
+        values[month] = best
+
+    # Начальное распределение без комиссии, затем лучший переход из фактического состояния
+    path = np.empty(months, dtype=np.int32)
+    path[0] = int(np.argmax(log_growth[0] + values[1]))
+    for month in range(1, months):
+        distance = np.abs(points - points[path[month - 1]]).sum(axis=1) // 2
+        reachable = distance <= transfers[month, path[month - 1]]
+        candidate = log_growth[month] + values[month + 1] + log_keep[np.minimum(distance, steps)]
+        path[month] = int(np.argmax(np.where(reachable, candidate, -np.inf)))
+    return path, float(log_growth[0, path[0]] + values[1, path[0]])
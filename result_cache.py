@@ -0,0 +1,116 @@
+"""
+Result Cache
+In-process LRU cache of optimization results keyed by a content hash of the inputs
+"""
+
+import hashlib
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _encode(obj, digest):
+    """Feed a canonical, type-tagged encoding of obj into digest"""
+    if obj is None:
+        digest.update(b'N')
+    elif isinstance(obj, (bool, np.bool_)):
+        digest.update(b'B1' if obj else b'B0')
+    elif isinstance(obj, (int, np.integer)):
+        digest.update(b'I' + str(int(obj)).encode() + b';')
+    elif isinstance(obj, (float, np.floating)):
+        digest.update(b'F' + struct.pack('<d', float(obj)))
+    elif isinstance(obj, str):
+        data = obj.encode('utf-8')
+        digest.update(b'S' + str(len(data)).encode() + b':' + data)
+    elif isinstance(obj, np.ndarray):
+        array = np.ascontiguousarray(obj)
+        digest.update(b'A' + array.dtype.str.encode() + repr(array.shape).encode())
+        digest.update(array.tobytes())
+    elif isinstance(obj, dict):
+        digest.update(b'D' + str(len(obj)).encode() + b':')
+        for key in sorted(obj, key=repr):
+            _encode(key, digest)
+            _encode(obj[key], digest)
+    elif isinstance(obj, (list, tuple)):
+        digest.update(b'L' + str(len(obj)).encode() + b':')
+        for item in obj:
+            _encode(item, digest)
+    else:
+        raise TypeError(f"Cannot hash {type(obj).__name__} for the result cache")
+
+
+def result_key(*parts):
+    """Stable SHA-256 hex digest of the inputs (same values -> same key across runs)"""
+    digest = hashlib.sha256()
+    _encode(parts, digest)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Least-recently-used cache with a fixed number of entries.
+
+    Values should be immutable (tuples, read-only arrays); callers build
+    fresh dicts / lists from them so cached results cannot be modified.
+    """
+
+    def __init__(self, maxsize=256):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Cached value (marked as most recently used) or default"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """Store value, evicting the least recently used entries over maxsize"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def clear(self):
+        """Drop all entries (statistics are kept)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hits, misses, evictions, entries and hit rate"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'maxsize': self.maxsize,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Общий кэш процесса: разные экземпляры оптимизатора с одинаковыми входами делят результаты
+RESULT_CACHE = ResultCache(maxsize=256)
@@ -0,0 +1,300 @@
+"""
+Result Store
+Persistent SQLite store of optimization results shared across processes and restarts
+
+The store is opt-in: the web app and the monthly report enable it with
+enable_default_store(), any process with $PORTFOLIO_RESULT_STORE=<path>.
+Plain optimizers (tests, scripts) keep results in memory only.
+
+Usage:
+    python result_store.py                      # summary
+    python result_store.py --list [--limit N]   # newest entries
+    python result_store.py --prune [--ttl-days D] [--max-entries N]
+    python result_store.py --clear
+"""
+
+import argparse
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+
+STORE_FILENAME = 'result_store.sqlite'
+DEFAULT_TTL_DAYS = 30
+DEFAULT_MAX_ENTRIES = 5000
+# put() applies the TTL and size limits after this many inserts
+PRUNE_EVERY = 100
+
+# PORTFOLIO_RESULT_STORE=<path> enables the store at path, an empty value disables it
+STORE_ENV_VAR = 'PORTFOLIO_RESULT_STORE'
+
+
+def default_store_path():
+    """STORE_FILENAME in the user cache directory ($XDG_CACHE_HOME or ~/.cache)"""
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'portfolio_optimizer', STORE_FILENAME)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key        TEXT PRIMARY KEY,
+    kind       TEXT NOT NULL,
+    created    REAL NOT NULL,
+    accessed   REAL NOT NULL,
+    hits       INTEGER NOT NULL DEFAULT 0,
+    weights    BLOB,
+    simulation BLOB,
+    metadata   TEXT
+);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+"""
+
+
+def _to_blob(array):
+    """Array -> .npy bytes (keeps dtype, including structured dtypes)"""
+    if array is None:
+        return None
+    buffer = io.BytesIO()
+    np.save(buffer, np.asarray(array), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _from_blob(blob):
+    """.npy bytes -> read-only array"""
+    if blob is None:
+        return None
+    array = np.load(io.BytesIO(blob), allow_pickle=False)
+    array.setflags(write=False)
+    return array
+
+
+class ResultStore:
+    """
+    Key/value store of solver results on disk.
+
+    Keys are the content hashes from result_cache.result_key, so an entry is
+    reused by any process as long as the configuration and call parameters
+    are the same. The database runs in WAL mode: many readers and one writer
+    can work concurrently (Streamlit, cron reports, batch workers).
+    """
+
+    def __init__(self, path=None, ttl_days=DEFAULT_TTL_DAYS, max_entries=DEFAULT_MAX_ENTRIES):
+        if path is None:
+            path = default_store_path()
+        directory = os.path.dirname(os.path.abspath(path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            raise sqlite3.OperationalError(f"cannot create {directory}: {e}") from e
+        self.path = path
+        self.ttl_days = ttl_days
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._inserts_since_prune = 0
+        self._connection()  # create the schema eagerly so errors surface here
+
+    def _connection(self):
+        """One connection per thread (sqlite3 connections are not thread-safe)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(_SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        """
+        Stored entry {'kind', 'weights', 'simulation', 'metadata', 'created'}
+        or None if missing / older than ttl_days
+        """
+        try:
+            connection = self._connection()
+            row = connection.execute(
+                'SELECT kind, created, weights, simulation, metadata FROM results WHERE key = ?',
+                (key,)
+            ).fetchone()
+            now = time.time()
+            if row is None or (self.ttl_days is not None and now - row[1] > self.ttl_days * 86400):
+                self.misses += 1
+                return None
+            connection.execute('UPDATE results SET accessed = ?, hits = hits + 1 WHERE key = ?',
+                               (now, key))
+        except sqlite3.Error:
+            self.errors += 1
+            return None
+
+        self.hits += 1
+        kind, created, weights, simulation, metadata = row
+        return {
+            'kind': kind,
+            'created': created,
+            'weights': _from_blob(weights),
+            'simulation': _from_blob(simulation),
+            'metadata': json.loads(metadata) if metadata else {},
+        }
+
+    def put(self, key, kind, weights=None, simulation=None, metadata=None):
+        """Insert or replace an entry; returns False if the database is not writable"""
+        now = time.time()
+        try:
+            self._connection().execute(
+                'INSERT OR REPLACE INTO results (key, kind, created, accessed, hits, weights, simulation, metadata) '
+                'VALUES (?, ?, ?, ?, 0, ?, ?, ?)',
+                (key, kind, now, now, _to_blob(weights), _to_blob(simulation),
+                 json.dumps(metadata or {}, ensure_ascii=False, default=str))
+            )
+        except sqlite3.Error:
+            self.errors += 1
+            return False
+        # Лимиты применяются по ходу записи: файл не растет без --prune
+        self._inserts_since_prune += 1
+        if self._inserts_since_prune >= PRUNE_EVERY:
+            self._inserts_since_prune = 0
+            try:
+                self.prune()
+            except sqlite3.Error:
+                self.errors += 1
+        return True
+
+    def prune(self, ttl_days=None, max_entries=None):
+        """
+        Delete entries older than ttl_days, then the least recently used ones
+        beyond max_entries. Defaults to the store settings. Returns rows deleted.
+        """
+        ttl_days = self.ttl_days if ttl_days is None else ttl_days
+        max_entries = self.max_entries if max_entries is None else max_entries
+        connection = self._connection()
+        deleted = 0
+        if ttl_days is not None:
+            cursor = connection.execute('DELETE FROM results WHERE created < ?',
+                                        (time.time() - ttl_days * 86400,))
+            deleted += cursor.rowcount
+        if max_entries is not None:
+            cursor = connection.execute(
+                'DELETE FROM results WHERE key NOT IN '
+                '(SELECT key FROM results ORDER BY accessed DESC LIMIT ?)',
+                (max_entries,)
+            )
+            deleted += cursor.rowcount
+        return deleted
+
+    def clear(self):
+        """Delete all entries"""
+        self._connection().execute('DELETE FROM results')
+
+    def entries(self, limit=20):
+        """Newest entries without the payload: (key, kind, created, accessed, hits, metadata)"""
+        rows = self._connection().execute(
+            'SELECT key, kind, created, accessed, hits, metadata FROM results '
+            'ORDER BY accessed DESC LIMIT ?', (limit,)
+        ).fetchall()
+        return [
+            {'key': key, 'kind': kind, 'created': created, 'accessed': accessed,
+             'hits': hits, 'metadata': json.loads(metadata) if metadata else {}}
+            for key, kind, created, accessed, hits, metadata in rows
+        ]
+
+    def stats(self):
+        """Entries by kind, file size and hit/miss counters of this process"""
+        by_kind = dict(self._connection().execute(
+            'SELECT kind, COUNT(*) FROM results GROUP BY kind'
+        ).fetchall())
+        lookups = self.hits + self.misses
+        return {
+            'path': self.path,
+            'entries': sum(by_kind.values()),
+            'by_kind': by_kind,
+            'size_kb': os.path.getsize(self.path) / 1024 if os.path.exists(self.path) else 0.0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        """Close this thread's connection"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+_default_store = None
+_default_store_path = None
+_default_store_lock = threading.Lock()
+
+
+def enable_default_store(path=None):
+    """Opt this process in to the persistent store (at path, default_store_path() by default)"""
+    global _default_store_path
+    with _default_store_lock:
+        _default_store_path = path or default_store_path()
+
+
+def default_store():
+    """
+    Process-wide store, pruned to the TTL and size limits when opened.
+
+    Enabled by enable_default_store() or $PORTFOLIO_RESULT_STORE (which wins;
+    an empty value disables it). Returns None if not enabled or the location
+    is not writable (read-only deployments).
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            path = os.environ.get(STORE_ENV_VAR, _default_store_path)
+            if not path:
+                return None
+            try:
+                _default_store = ResultStore(path)
+                _default_store.prune()  # записи, устаревшие с прошлого запуска
+            except sqlite3.Error:
+                return None
+        return _default_store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and prune the optimization result store")
+    parser.add_argument('--path', help=f"database file (default: ${STORE_ENV_VAR} or {default_store_path()})")
+    parser.add_argument('--list', action='store_true', help="show the most recently used entries")
+    parser.add_argument('--limit', type=int, default=20, help="entries to show with --list")
+    parser.add_argument('--prune', action='store_true', help="apply TTL and size limits")
+    parser.add_argument('--ttl-days', type=float, default=DEFAULT_TTL_DAYS)
+    parser.add_argument('--max-entries', type=int, default=DEFAULT_MAX_ENTRIES)
+    parser.add_argument('--clear', action='store_true', help="delete all entries")
+    args = parser.parse_args(argv)
+
+    store = ResultStore(args.path or os.environ.get(STORE_ENV_VAR) or None,
+                        ttl_days=args.ttl_days, max_entries=args.max_entries)
+
+    if args.clear:
+        store.clear()
+        print("🗑️  Result store cleared")
+    if args.prune:
+        deleted = store.prune()
+        print(f"✂️  Pruned {deleted} entries (TTL {args.ttl_days:g} days, max {args.max_entries})")
+    if args.list:
+        for entry in store.entries(args.limit):
+            accessed = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['accessed']))
+            meta = entry['metadata']
+            scenario = '/'.join(str(meta[k]) for k in ('capital_scenario', 'rate_scenario', 'fx_scenario') if k in meta)
+            print(f"{entry['key'][:12]}  {entry['kind']:<32} {accessed}  hits={entry['hits']:<4} {scenario}")
+
+    info = store.stats()
+    print(f"📦 {info['path']}: {info['entries']} entries, {info['size_kb']:.1f} KB")
+    for kind, count in sorted(info['by_kind'].items()):
+        print(f"   - {kind}: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+Scenario Engine
+Solves batches of independent (capital, rate, FX) scenarios, optionally over a process pool
+"""
+
+import atexit
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from result_cache import ResultCache, result_key
+
+# Pool start-up (importing scipy/pandas in every worker) takes about a second;
+# shipping one scenario to a running worker and back costs a few milliseconds.
+# The pool is used only when the measured serial cost of a batch saves more.
+POOL_STARTUP_SECONDS = 1.0
+POOL_TASK_SECONDS = 0.003
+
+# Optimizer attributes shipped to the workers once (instead of re-reading YAML)
+STATE_ATTRIBUTES = (
+    'initial_capital_rub', 'initial_usd_amount', 'current_usd_rub', 'monthly_income_target',
+    'years', 'usd_spread_pct', 'capital_growth_scenarios', 'cbr_scenarios', 'fx_scenarios',
+    'instruments', 'use_warm_start', 'curve_interpolation', 'curve_periods_per_year',
+)
+
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+
+# Optimizer of the current worker process (set by _init_worker)
+_worker_optimizer = None
+
+
+def scenario_grid(optimizer):
+    """Все комбинации (капитал, ставка, курс): 5 × 3 × 3 для стандартной конфигурации"""
+    return list(itertools.product(optimizer.capital_growth_scenarios,
+                                  optimizer.cbr_scenarios, optimizer.fx_scenarios))
+
+
+def optimizer_state(optimizer):
+    """Picklable snapshot of everything a worker needs to reproduce optimizer's solves"""
+    state = {name: getattr(optimizer, name) for name in STATE_ATTRIBUTES}
+    store = optimizer.result_store if optimizer.use_result_cache else None
+    state['result_store_path'] = store.path if store is not None else None
+    state['use_result_cache'] = optimizer.use_result_cache
+    return state
+
+
+def optimizer_from_state(state):
+    """Independent optimizer rebuilt from optimizer_state (no YAML reads)"""
+    from portfolio_optimizer import DynamicPortfolioOptimizer
+    from result_store import ResultStore
+
+    state = dict(state)
+    store_path = state.pop('result_store_path')
+    optimizer = DynamicPortfolioOptimizer(use_yaml_config=False)
+    for name, value in state.items():
+        setattr(optimizer, name, value)
+    optimizer.invalidate_instrument_table()
+    # Теплый старт зависел бы от того, какой воркер и в каком порядке решал сценарии
+    optimizer.use_warm_start = False
+    # Свой кэш в памяти; хранилище на диске общее с исходным оптимизатором
+    optimizer.result_cache = ResultCache()
+    optimizer.result_store = ResultStore(store_path) if store_path else None
+    return optimizer
+
+
+def _init_worker(state):
+    """Build the worker's optimizer from the shipped state (runs once per process)"""
+    global _worker_optimizer
+    _worker_optimizer = optimizer_from_state(state)
+
+
+def worker_optimizer():
+    """Optimizer of the current pool worker (None outside the pool)"""
+    return _worker_optimizer
+
+
+def _solve(optimizer, scenario):
+    capital_scenario, rate_scenario, fx_scenario = scenario
+    weights = optimizer.optimize_portfolio(capital_scenario, rate_scenario, fx_scenario)
+    simulation = optimizer.simulate_portfolio_performance(
+        weights, capital_scenario, rate_scenario, fx_scenario
+    )
+    return {
+        'capital_scenario': capital_scenario,
+        'rate_scenario': rate_scenario,
+        'fx_scenario': fx_scenario,
+        'weights': weights,
+        'simulation': simulation,
+    }
+
+
+def _solve_in_worker(scenario):
+    return _solve(_worker_optimizer, scenario)
+
+
+def _pool_key_for(state, max_workers):
+    return result_key(state), max_workers
+
+
+def pool_is_running(state, max_workers):
+    """True if a pool for this state and size is already started"""
+    with _pool_lock:
+        return _pool is not None and _pool_key == _pool_key_for(state, max_workers)
+
+
+def submit_to_pool(state, max_workers, function, tasks):
+    """
+    Submit function(*task) for every task to the pool initialized with state
+
+    The pool is reused while state and size are unchanged. A pool for another
+    state is retired without cancelling its queue: futures other callers
+    already hold still complete, then its workers exit. Tasks are submitted
+    under the lock, so a concurrent state change cannot retire the pool
+    between lookup and submission.
+    """
+    global _pool, _pool_key
+    key = _pool_key_for(state, max_workers)
+    with _pool_lock:
+        if _pool is None or _pool_key != key:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                        initargs=(state,))
+            _pool_key = key
+        return [_pool.submit(function, *task) for task in tasks]
+
+
+def shutdown_pool():
+    """Stop the worker processes (started lazily by iter_scenario_results)"""
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+        _pool_key = None
+
+
+atexit.register(shutdown_pool)
+
+
+def _pool_pays_off(per_solve, remaining, max_workers, pool_running):
+    """Serial time saved by max_workers workers exceeds start-up and dispatch costs"""
+    saved = remaining * (per_solve * (1 - 1 / max_workers) - POOL_TASK_SECONDS)
+    return saved > (0.0 if pool_running else POOL_STARTUP_SECONDS)
+
+
+def iter_scenario_results(optimizer, scenarios, max_workers=None, min_parallel=None):
+    """
+    Решение набора сценариев; результаты выдаются по мере готовности (не по порядку)
+
+    scenarios: iterable of (capital_scenario, rate_scenario, fx_scenario)
+    Yields dicts with the scenario names, 'weights' and 'simulation'.
+
+    Scenarios already in the optimizer's memory cache are answered in-process
+    first. By default the first uncached scenario is also solved in-process
+    and timed: the rest go to a process pool only if their estimated serial
+    time saves more than the pool start-up (nothing when a pool for this
+    state is running) and the per-task dispatch cost. min_parallel=N instead
+    uses the pool for any N or more uncached scenarios. Worker results are
+    added to the optimizer's memory cache (and written to the shared result
+    store by the workers themselves).
+    """
+    scenarios = [tuple(scenario) for scenario in scenarios]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    pending = []
+    for scenario in scenarios:
+        cached = optimizer.use_result_cache and optimizer._optimize_key(*scenario) in optimizer.result_cache
+        if cached:
+            yield _solve(optimizer, scenario)
+        else:
+            pending.append(scenario)
+
+    if max_workers < 2 or len(pending) < 2:
+        use_pool = False
+    elif min_parallel is not None:
+        use_pool = len(pending) >= min_parallel
+    else:
+        start = time.perf_counter()
+        result = _solve(optimizer, pending[0])
+        per_solve = time.perf_counter() - start
+        pending = pending[1:]
+        yield result
+        use_pool = _pool_pays_off(per_solve, len(pending), max_workers,
+                                  pool_is_running(optimizer_state(optimizer), max_workers))
+
+    if not use_pool:
+        for scenario in pending:
+            yield _solve(optimizer, scenario)
+        return
+
+    futures = submit_to_pool(optimizer_state(optimizer), max_workers, _solve_in_worker,
+                             [(scenario,) for scenario in pending])
+    for future in as_completed(futures):
+        result = future.result()
+        if optimizer.use_result_cache:
+            _remember(optimizer, result)
+        yield result
+
+
+def _remember(optimizer, result):
+    """Put a worker's result into the parent's memory cache"""
+    scenario = (result['capital_scenario'], result['rate_scenario'], result['fx_scenario'])
+    weights = optimizer.instrument_table.weights_vector(result['weights'])
+    weights.setflags(write=False)
+    optimizer.result_cache.put(optimizer._optimize_key(*scenario), weights)
+
+
+def solve_scenarios(optimizer, scenarios, max_workers=None, min_parallel=None):
+    """Like iter_scenario_results, but returns the results in the order of scenarios"""
+    scenarios = [tuple(scenario) for scenario in scenarios]
+    results = {}
+    for result in iter_scenario_results(optimizer, scenarios, max_workers, min_parallel):
+        results[(result['capital_scenario'], result['rate_scenario'], result['fx_scenario'])] = result
+    return [results[scenario] for scenario in scenarios]
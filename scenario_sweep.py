@@ -0,0 +1,240 @@
+"""
+Scenario Sweep
+Optimal portfolios for every capital × rate × FX scenario combination, precomputed and indexed
+
+Usage:
+    python scenario_sweep.py                                   # summary of all combinations
+    python scenario_sweep.py --capital constant --rate base --fx pessimistic
+"""
+
+import argparse
+import copy
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from portfolio_optimizer import (DynamicPortfolioOptimizer, OPTIMIZE_OPTIONS, RESULT_FORMAT_VERSION,
+                                 SIMULATION_DTYPE)
+from result_cache import result_key
+from scenario_engine import (STATE_ATTRIBUTES, iter_scenario_results, optimizer_from_state,
+                             optimizer_state, scenario_grid)
+
+
+def sweep_key(optimizer):
+    """Hash of everything the sweep depends on (changes whenever the config does)"""
+    state = {name: getattr(optimizer, name) for name in STATE_ATTRIBUTES if name != 'use_warm_start'}
+    return result_key('scenario_sweep', RESULT_FORMAT_VERSION, state, OPTIMIZE_OPTIONS)
+
+
+class ScenarioSweep:
+    """
+    Indexed table of solved scenarios.
+
+    weights[c, r, f] is the optimal weight vector (instrument_table order) for
+    capital scenario c, rate scenario r and FX scenario f; simulation[c, r, f]
+    holds the SIMULATION_DTYPE rows for every year of that portfolio.
+    """
+
+    def __init__(self, key, capital_names, rate_names, fx_names, instrument_names,
+                 weights, simulation):
+        self.key = key
+        self.capital_names = tuple(capital_names)
+        self.rate_names = tuple(rate_names)
+        self.fx_names = tuple(fx_names)
+        self.instrument_names = tuple(instrument_names)
+        self.capital_index = {name: i for i, name in enumerate(self.capital_names)}
+        self.rate_index = {name: i for i, name in enumerate(self.rate_names)}
+        self.fx_index = {name: i for i, name in enumerate(self.fx_names)}
+        self.weights = weights
+        self.simulation = simulation
+        self.weights.setflags(write=False)
+        self.simulation.setflags(write=False)
+
+    def __len__(self):
+        return len(self.capital_names) * len(self.rate_names) * len(self.fx_names)
+
+    def _position(self, capital_scenario, rate_scenario, fx_scenario):
+        return (self.capital_index[capital_scenario], self.rate_index[rate_scenario],
+                self.fx_index[fx_scenario])
+
+    def lookup(self, capital_scenario, rate_scenario, fx_scenario):
+        """Веса {инструмент: доля} и симуляция (список словарей по годам) для комбинации"""
+        position = self._position(capital_scenario, rate_scenario, fx_scenario)
+        weights = self.weights[position]
+        simulation = self.simulation[position]
+        fields = simulation.dtype.names
+        return {
+            'weights': {name: weights[i] for i, name in enumerate(self.instrument_names)},
+            'simulation': [{field: year_row[field].item() for field in fields} for year_row in simulation],
+        }
+
+    def summary(self, monthly_income_target):
+        """Сводная таблица по всем комбинациям (одна строка на комбинацию)"""
+        rows = []
+        for capital_scenario in self.capital_names:
+            for rate_scenario in self.rate_names:
+                for fx_scenario in self.fx_names:
+                    simulation = self.simulation[self._position(capital_scenario, rate_scenario, fx_scenario)]
+                    avg_income = float(simulation['monthly_income'].mean())
+                    rows.append({
+                        'Капитал': capital_scenario,
+                        'Ставка ЦБ': rate_scenario,
+                        'Курс USD': fx_scenario,
+                        'Ср. доходность': float(simulation['portfolio_yield'].mean()),
+                        'Ср. месячный доход': avg_income,
+                        'Итоговый капитал': float(simulation['total_capital_end'][-1]),
+                        'Покрытие расходов': avg_income / monthly_income_target * 100,
+                    })
+        return pd.DataFrame(rows)
+
+
+def compute_sweep(optimizer, max_workers=None, progress=None):
+    """
+    Solve every combination (through scenario_engine, in a process pool when
+    worthwhile) and pack the results into a ScenarioSweep.
+    progress(done, total) is called after each solved combination.
+    """
+    table = optimizer.instrument_table
+    capital_names = tuple(optimizer.capital_growth_scenarios)
+    rate_names = tuple(optimizer.cbr_scenarios)
+    fx_names = tuple(optimizer.fx_scenarios)
+    shape = (len(capital_names), len(rate_names), len(fx_names))
+
+    weights = np.zeros(shape + (len(table),))
+    simulation = np.zeros(shape + (optimizer.years,), dtype=SIMULATION_DTYPE)
+    grid = scenario_grid(optimizer)
+
+    for done, result in enumerate(iter_scenario_results(optimizer, grid, max_workers), start=1):
+        capital_scenario, rate_scenario, fx_scenario = (
+            result['capital_scenario'], result['rate_scenario'], result['fx_scenario'])
+        position = (capital_names.index(capital_scenario), rate_names.index(rate_scenario),
+                    fx_names.index(fx_scenario))
+        weights[position] = table.weights_vector(result['weights'])
+        simulation[position] = optimizer.simulate_portfolio_batch(
+            weights[position], capital_scenario, rate_scenario, fx_scenario)[0]
+        if progress is not None:
+            progress(done, len(grid))
+
+    return ScenarioSweep(sweep_key(optimizer), capital_names, rate_names, fx_names,
+                         table.names, weights, simulation)
+
+
+def load_or_compute_sweep(optimizer, max_workers=None, progress=None):
+    """Sweep for the current config from the result store, computing (and storing) it if missing"""
+    key = sweep_key(optimizer)
+    store = optimizer.result_store if optimizer.use_result_cache else None
+
+    if store is not None:
+        entry = store.get(key)
+        if entry is not None and entry['weights'] is not None:
+            meta = entry['metadata']
+            return ScenarioSweep(key, meta['capital'], meta['rate'], meta['fx'], meta['instruments'],
+                                 entry['weights'].copy(), entry['simulation'].copy())
+
+    sweep = compute_sweep(optimizer, max_workers, progress)
+    if store is not None:
+        store.put(key, 'scenario_sweep', weights=sweep.weights, simulation=sweep.simulation, metadata={
+            'capital': sweep.capital_names, 'rate': sweep.rate_names, 'fx': sweep.fx_names,
+            'instruments': sweep.instrument_names,
+        })
+    return sweep
+
+
+class BackgroundSweep:
+    """
+    Keeps a sweep for the latest config, recomputing it in a background thread.
+
+    Call refresh(optimizer) on every run (e.g. every Streamlit rerun): when the
+    config has changed a new computation starts on an independent copy of the
+    optimizer, and current() returns the sweep once it matches the config.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._sweep = None
+        self._pending_key = None
+        self._thread = None
+        self.progress = (0, 0)
+        self.error = None
+
+    def refresh(self, optimizer):
+        """Start a background computation if the sweep for optimizer's config is not ready"""
+        key = sweep_key(optimizer)
+        with self._lock:
+            if (self._sweep is not None and self._sweep.key == key) or self._pending_key == key:
+                return
+            self._pending_key = key
+            self.progress = (0, 0)
+            self.error = None
+            # Independent copy: the UI thread keeps using (and editing) the original
+            state = copy.deepcopy(optimizer_state(optimizer))
+            self._thread = threading.Thread(target=self._run, args=(key, state), daemon=True)
+            self._thread.start()
+
+    def _run(self, key, state):
+        def progress(done, total):
+            self.progress = (done, total)
+        try:
+            sweep = load_or_compute_sweep(optimizer_from_state(state), self.max_workers, progress)
+        except Exception as e:  # surfaced through .error, the thread must not die silently
+            with self._lock:
+                if self._pending_key == key:
+                    self._pending_key = None
+                    self.error = e
+            return
+        with self._lock:
+            if self._pending_key == key:
+                self._sweep = sweep
+                self._pending_key = None
+
+    def current(self, optimizer):
+        """Sweep matching optimizer's current config, or None while it is being computed"""
+        sweep = self._sweep
+        return sweep if sweep is not None and sweep.key == sweep_key(optimizer) else None
+
+    def wait(self, timeout=None):
+        """Block until the running computation (if any) finishes"""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Look up optimal portfolios for any scenario combination")
+    parser.add_argument('--capital', help="capital growth scenario (e.g. constant)")
+    parser.add_argument('--rate', help="CBR rate scenario (e.g. base)")
+    parser.add_argument('--fx', help="USD/RUB scenario (e.g. base)")
+    parser.add_argument('--workers', type=int, default=None, help="process pool size")
+    args = parser.parse_args(argv)
+
+    optimizer = DynamicPortfolioOptimizer()
+    sweep = load_or_compute_sweep(optimizer, args.workers)
+
+    if args.capital or args.rate or args.fx:
+        combination = (args.capital or 'constant', args.rate or 'base', args.fx or 'base')
+        try:
+            result = sweep.lookup(*combination)
+        except KeyError as e:
+            print(f"❌ Unknown scenario: {e}")
+            return 1
+        print(f"\n📊 Оптимальный портфель: капитал={combination[0]}, ставка={combination[1]}, курс={combination[2]}")
+        for name, weight in sorted(result['weights'].items(), key=lambda item: -item[1]):
+            if weight > 0.01:
+                print(f"   {name:<45} {weight*100:5.1f}%")
+        print(f"\n📈 Прогноз:")
+        for row in result['simulation']:
+            print(f"   Год {row['year']}: доходность {row['portfolio_yield']:.1f}%, "
+                  f"доход {row['monthly_income']:,.0f} руб/мес, капитал {row['total_capital_end']:,.0f} руб")
+        return 0
+
+    summary = sweep.summary(optimizer.monthly_income_target)
+    print(f"\n📋 ВСЕ КОМБИНАЦИИ СЦЕНАРИЕВ ({len(sweep)}):")
+    print(summary.to_string(index=False, float_format=lambda v: f"{v:,.1f}"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+Streaming Statistics
+Constant-memory aggregation of Monte Carlo chunks: moments, quantile sketches,
+shortfall probabilities and drawdowns
+"""
+
+import numpy as np
+
+DEFAULT_COMPRESSION = 200
+
+
+class RunningMoments:
+    """
+    Mean and variance over a stream of chunks (Welford / Chan et al. merge).
+
+    update(values) reduces over axis 0, so the statistics have the shape of
+    values.shape[1:] - e.g. (months,) for a (paths, months) chunk.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self._m2 = None
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        n = values.shape[0]
+        if n == 0:
+            return
+        chunk_mean = values.mean(axis=0)
+        chunk_m2 = ((values - chunk_mean) ** 2).sum(axis=0)
+        if self.count == 0:
+            self.count, self.mean, self._m2 = n, chunk_mean, chunk_m2
+            return
+        total = self.count + n
+        delta = chunk_mean - self.mean
+        self.mean = self.mean + delta * n / total
+        self._m2 = self._m2 + chunk_m2 + delta ** 2 * self.count * n / total
+        self.count = total
+
+    @property
+    def variance(self):
+        """Sample variance (ddof=1)"""
+        if self.count < 2:
+            return np.zeros_like(self.mean) if self.mean is not None else 0.0
+        return self._m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    @property
+    def standard_error(self):
+        """Standard error of the mean"""
+        return self.std / np.sqrt(max(self.count, 1))
+
+
+class QuantileSketch:
+    """
+    Merging t-digest: a bounded set of weighted centroids.
+
+    Each update merges the new values into the centroids and re-compresses
+    them with the k1 scale function k(q) = δ/2π · asin(2q - 1), so centroids
+    stay small near the tails (accurate extreme percentiles) and the sketch
+    never holds more than ~δ centroids regardless of the stream length.
+    """
+
+    def __init__(self, compression=DEFAULT_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        if values.size == 0:
+            return
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        means = np.concatenate([self.means, values])
+        weights = np.concatenate([self.weights, np.ones(values.size)])
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+
+        # Centroid boundaries: equal steps of the k1 scale function in quantile space
+        total = weights.sum()
+        q_mid = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q_mid - 1)
+        groups = np.floor(k - k[0]).astype(int)
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+
+        merged_weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / merged_weights
+        self.weights = merged_weights
+
+    def quantile(self, q):
+        """Approximate q-quantile(s), q in [0, 1]"""
+        if self.weights.size == 0:
+            raise ValueError("Empty sketch")
+        q = np.asarray(q, dtype=float)
+        total = self.weights.sum()
+        positions = np.cumsum(self.weights) - self.weights / 2
+        result = np.interp(q * total, np.r_[0.0, positions, total],
+                           np.r_[self.min, self.means, self.max])
+        return float(result) if result.ndim == 0 else result
+
+    def percentile(self, p):
+        return self.quantile(np.asarray(p, dtype=float) / 100)
+
+
+class MonteCarloAggregator:
+    """
+    Streaming summary of Monte Carlo chunks for k portfolios.
+
+    Keeps, per portfolio: moments and a quantile sketch of the average monthly
+    income, terminal capital and maximum drawdown; per-month income moments;
+    counts of paths missing the income target (on average and per month).
+    Memory is O(k · (months + compression)), independent of the path count.
+    """
+
+    def __init__(self, n_portfolios, months, monthly_income_target, compression=DEFAULT_COMPRESSION):
+        self.n_portfolios = n_portfolios
+        self.months = months
+        self.monthly_income_target = monthly_income_target
+        self.n_paths = 0
+
+        self.income = [RunningMoments() for _ in range(n_portfolios)]
+        self.capital = [RunningMoments() for _ in range(n_portfolios)]
+        self.drawdown = [RunningMoments() for _ in range(n_portfolios)]
+        self.monthly = [RunningMoments() for _ in range(n_portfolios)]
+        self.income_sketch = [QuantileSketch(compression) for _ in range(n_portfolios)]
+        self.capital_sketch = [QuantileSketch(compression) for _ in range(n_portfolios)]
+        self.drawdown_sketch = [QuantileSketch(compression) for _ in range(n_portfolios)]
+
+        self.below_target = np.zeros(n_portfolios, dtype=np.int64)
+        self.month_below_target = np.zeros((n_portfolios, months), dtype=np.int64)
+
+    def update(self, monthly_income, terminal_capital, wealth, initial_capital):
+        """
+        Add one chunk: monthly_income and wealth (k, paths, months),
+        terminal_capital (k, paths); initial_capital is the wealth before month 0.
+        """
+        self.n_paths += terminal_capital.shape[1]
+        avg_income = monthly_income.mean(axis=2)
+
+        # Максимальная просадка: падение от предыдущего максимума стоимости портфеля
+        peaks = np.maximum.accumulate(np.maximum(wealth, initial_capital), axis=2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            drawdowns = np.where(peaks > 0, 1 - wealth / peaks, 0.0).max(axis=2)
+
+        for i in range(self.n_portfolios):
+            self.income[i].update(avg_income[i])
+            self.capital[i].update(terminal_capital[i])
+            self.drawdown[i].update(drawdowns[i])
+            self.monthly[i].update(monthly_income[i])
+            self.income_sketch[i].update(avg_income[i])
+            self.capital_sketch[i].update(terminal_capital[i])
+            self.drawdown_sketch[i].update(drawdowns[i])
+
+        self.below_target += (avg_income < self.monthly_income_target).sum(axis=1)
+        self.month_below_target += (monthly_income < self.monthly_income_target).sum(axis=1)
+
+    def summary(self, portfolio=0, percentiles=(5, 50, 95)):
+        """Same keys as MonteCarloResult.summary plus standard errors and drawdown stats"""
+        income, capital, drawdown = self.income[portfolio], self.capital[portfolio], self.drawdown[portfolio]
+        result = {
+            'paths': self.n_paths,
+            'mean_monthly_income': float(income.mean),
+            'mean_terminal_capital': float(capital.mean),
+            'prob_income_below_target': float(self.below_target[portfolio] / max(self.n_paths, 1)),
+            'monthly_income_std': float(income.std),
+            'terminal_capital_std': float(capital.std),
+            'mean_terminal_capital_se': float(capital.standard_error),
+            'mean_max_drawdown': float(drawdown.mean),
+        }
+        income_q = self.income_sketch[portfolio].percentile(percentiles)
+        capital_q = self.capital_sketch[portfolio].percentile(percentiles)
+        drawdown_q = self.drawdown_sketch[portfolio].percentile(percentiles)
+        for p, iq, cq, dq in zip(percentiles, income_q, capital_q, drawdown_q):
+            result[f'monthly_income_p{p}'] = float(iq)
+            result[f'terminal_capital_p{p}'] = float(cq)
+            result[f'max_drawdown_p{p}'] = float(dq)
+        return result
+
+    def month_shortfall_probability(self, portfolio=0):
+        """Вероятность дохода ниже цели в каждом месяце: (months,)"""
+        return self.month_below_target[portfolio] / max(self.n_paths, 1)
@@ -0,0 +1,192 @@
+"""
+Test script for the Configuration Loader
+Checks the parse-once YAML cache, its invalidation and the binary snapshot
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from config_loader import ConfigLoader, config_cache_info, invalidate_config_cache
+
+CONFIG_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _copy_configs():
+    """Copy YAML configs into a temporary directory"""
+    tmp_dir = tempfile.mkdtemp(prefix='hfo_config_')
+    for name in ('instruments_config.yaml', 'forecasts_config.yaml'):
+        shutil.copy(os.path.join(CONFIG_DIR, name), tmp_dir)
+    return tmp_dir
+
+
+def test_parse_once():
+    """Repeated scenario lookups parse forecasts_config.yaml only once"""
+    tmp_dir = _copy_configs()
+    try:
+        loader = ConfigLoader(tmp_dir)
+        before = config_cache_info()
+        loader.get_cbr_scenarios()
+        loader.get_fx_scenarios()
+        loader.get_structured_bond_coupons()
+        after = config_cache_info()
+
+        assert after['misses'] - before['misses'] == 1
+        assert after['hits'] - before['hits'] == 2
+        assert not os.path.exists(loader.snapshot_path)  # snapshot is opt-in
+        print("✅ forecasts_config.yaml parsed once for three lookups")
+    finally:
+        invalidate_config_cache()
+        shutil.rmtree(tmp_dir)
+
+
+def test_immutable_views():
+    """Shared documents are read-only, returned scenarios and instruments are copies"""
+    tmp_dir = _copy_configs()
+    try:
+        loader = ConfigLoader(tmp_dir, use_snapshot=True)
+        forecasts = loader.load_forecasts()
+        assert isinstance(forecasts, dict)
+        forecasts['cbr_scenarios'] = {}
+        assert loader.load_forecasts()['cbr_scenarios']
+        try:
+            loader._forecasts_document()['cbr_scenarios'] = {}
+            raise AssertionError("cached forecasts must be read-only")
+        except TypeError:
+            pass
+
+        rates = loader.get_cbr_scenarios()['base']
+        rates.append(99.0)
+        assert loader.get_cbr_scenarios()['base'][-1] != 99.0
+
+        instruments = loader.load_instruments()
+        name = next(iter(instruments))
+        instruments[name]['yield'] = -1
+        assert loader.load_instruments()[name]['yield'] != -1
+        print("✅ Cached documents are immutable, callers get private copies")
+    finally:
+        invalidate_config_cache()
+        shutil.rmtree(tmp_dir)
+
+
+def test_mtime_invalidation():
+    """Editing the YAML file invalidates the cached document"""
+    tmp_dir = _copy_configs()
+    try:
+        loader = ConfigLoader(tmp_dir, use_snapshot=True)
+        assert loader.get_cbr_scenarios()['base'][0] == 16.5
+
+        path = os.path.join(tmp_dir, 'forecasts_config.yaml')
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text.replace('rates: [16.5, 16.0, 12.0', 'rates: [15.5, 16.0, 12.0', 1))
+        stamp = time.time() + 5
+        os.utime(path, (stamp, stamp))
+
+        assert loader.get_cbr_scenarios()['base'][0] == 15.5
+
+        assert invalidate_config_cache(path) == 1
+        assert invalidate_config_cache(path) == 0
+        print("✅ Edited YAML is re-parsed, explicit invalidation works")
+    finally:
+        invalidate_config_cache()
+        shutil.rmtree(tmp_dir)
+
+
+def test_snapshot_compile():
+    """Snapshot is compiled on first use, has no descriptions and matches YAML"""
+    tmp_dir = _copy_configs()
+    try:
+        loader = ConfigLoader(tmp_dir, use_snapshot=True)
+        yaml_loader = ConfigLoader(tmp_dir, use_snapshot=False)
+        assert not os.path.exists(loader.snapshot_path)
+
+        instruments = loader.load_instruments()
+        assert os.path.exists(loader.snapshot_path)
+        assert all('description' not in data for data in instruments.values())
+        assert set(instruments) == set(yaml_loader.load_instruments())
+        assert loader.get_cbr_scenarios() == yaml_loader.get_cbr_scenarios()
+        assert loader.get_fx_scenarios() == yaml_loader.get_fx_scenarios()
+        assert loader.get_structured_bond_coupons() == yaml_loader.get_structured_bond_coupons()
+        assert loader.get_instrument_description('USD CASH')
+        print("✅ Snapshot compiled, matches YAML, descriptions available on demand")
+    finally:
+        invalidate_config_cache()
+        shutil.rmtree(tmp_dir)
+
+
+def test_snapshot_edit_during_compile():
+    """A YAML edit made while the snapshot is compiled is not stamped as fresh"""
+    tmp_dir = _copy_configs()
+    forecasts_path = os.path.join(tmp_dir, 'forecasts_config.yaml')
+    original = ConfigLoader.get_fx_scenarios
+
+    def get_fx_scenarios_then_edit(self):
+        scenarios = original(self)
+        with open(forecasts_path, 'a') as f:
+            f.write('\n# edited while compiling\n')
+        return scenarios
+
+    try:
+        loader = ConfigLoader(tmp_dir, use_snapshot=True)
+        ConfigLoader.get_fx_scenarios = get_fx_scenarios_then_edit
+        try:
+            loader.compile_snapshot()
+        finally:
+            ConfigLoader.get_fx_scenarios = original
+        assert not os.path.exists(loader.snapshot_path)
+
+        # Следующая загрузка компилирует заново - уже из нового содержимого
+        loader.load_instruments()
+        assert os.path.exists(loader.snapshot_path)
+        print("✅ Snapshot is not written when YAML changes during compilation")
+    finally:
+        invalidate_config_cache()
+        shutil.rmtree(tmp_dir)
+
+
+def test_snapshot_without_yaml():
+    """A fresh process can start from the snapshot alone"""
+    tmp_dir = _copy_configs()
+    try:
+        expected = ConfigLoader(tmp_dir, use_snapshot=True).get_fx_scenarios()
+        for name in ('instruments_config.yaml', 'forecasts_config.yaml'):
+            os.remove(os.path.join(tmp_dir, name))
+        invalidate_config_cache()
+
+        assert ConfigLoader(tmp_dir, use_snapshot=True).get_fx_scenarios() == expected
+        print("✅ Snapshot loads without PyYAML parsing or YAML files")
+    finally:
+        invalidate_config_cache()
+        shutil.rmtree(tmp_dir)
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("="*80)
+    print("CONFIGURATION LOADER TEST SUITE")
+    print("="*80)
+
+    try:
+        test_parse_once()
+        test_immutable_views()
+        test_mtime_invalidation()
+        test_snapshot_compile()
+        test_snapshot_edit_during_compile()
+        test_snapshot_without_yaml()
+    except Exception as e:
+        print(f"\n❌ Config loader test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+    print("\n✅ All config loader tests passed!")
+    return True
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,226 @@
+"""
+Test script for the Monte Carlo engine
+Checks path generation, streaming statistics, variance reduction, goal
+probabilities and common random numbers
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from portfolio_optimizer import DynamicPortfolioOptimizer
+from profit_maximizer import ProfitMaximizer
+from dynamic_rebalancer import DynamicRebalancer
+from two_tier_strategy import TwoTierStrategy
+from qp_solver import project_capped_simplex, project_capped_simplex_rows
+from monte_carlo import GOAL_MAX_PATHS, MonteCarloEngine
+from path_set import get_path_set, paired_difference
+from streaming_stats import QuantileSketch, RunningMoments
+from scenario_engine import shutdown_pool
+
+
+def test_monte_carlo():
+    """Stochastic paths: unbiased around the forecasts, deterministic limit, batched portfolios"""
+    optimizer = DynamicPortfolioOptimizer(use_yaml_config=False)
+    weights = optimizer.instrument_table.weights_vector(optimizer.optimize_portfolio())
+
+    # Zero volatility reproduces simulate_portfolio_performance
+    flat = MonteCarloEngine(optimizer, rate_volatility=0, fx_volatility=0, seed=1).run(weights, 4)
+    simulation = optimizer.simulate_portfolio_performance(weights, 'constant', 'base', 'base')
+    assert np.allclose(flat.terminal_capital, simulation[-1]['total_capital_end'])
+    assert np.allclose(flat.monthly_income[0, :, :12], simulation[0]['monthly_income'])
+
+    engine = MonteCarloEngine(optimizer, seed=7)
+    rates, fx = engine.generate_paths(50000)
+    assert rates.shape == (50000, 36) and fx.shape == (50000, 37) and rates.min() >= 0
+    assert np.allclose(fx.mean(axis=0), engine.fx_mean, rtol=0.01)
+    rate_shocks = np.diff(rates - engine.rate_mean, axis=1)
+    fx_shocks = np.diff(np.log(fx / engine.fx_mean), axis=1)[:, :-1]
+    assert 0.25 < np.corrcoef(rate_shocks.ravel(), fx_shocks.ravel())[0, 1] < 0.35
+
+    # Same seed -> same paths; k portfolios in one pass equal separate runs
+    uniform = np.full(len(weights), 1 / len(weights))
+    batch = MonteCarloEngine(optimizer, seed=3).run(np.vstack([weights, uniform]), 3000, chunk_size=1000)
+    single = MonteCarloEngine(optimizer, seed=3).run(uniform, 3000, chunk_size=1000)
+    assert np.allclose(batch.terminal_capital[1], single.terminal_capital[0])
+    summary = batch.summary()
+    assert summary['terminal_capital_p5'] < summary['terminal_capital_p50'] < summary['terminal_capital_p95']
+    print("✅ Monte Carlo paths and batched simulation are consistent")
+
+
+def test_streaming_stats():
+    """Chunked moments and quantile sketches match full-array statistics"""
+    rng = np.random.default_rng(11)
+    values = rng.lognormal(size=(200000, 3))
+    moments, sketch = RunningMoments(), QuantileSketch()
+    for chunk in np.array_split(values, 37):
+        moments.update(chunk)
+        sketch.update(chunk[:, 0])
+    assert np.allclose(moments.mean, values.mean(axis=0))
+    assert np.allclose(moments.variance, values.var(axis=0, ddof=1))
+    assert len(sketch.means) <= sketch.compression
+    for p in (1, 5, 50, 95, 99):
+        assert np.isclose(sketch.percentile(p), np.percentile(values[:, 0], p), rtol=0.01)
+
+    optimizer = DynamicPortfolioOptimizer(use_yaml_config=False)
+    weights = optimizer.optimize_portfolio()
+    full = MonteCarloEngine(optimizer, seed=5).run(weights, 20000, chunk_size=5000).summary()
+    streamed = MonteCarloEngine(optimizer, seed=5).run_streaming(weights, 20000, chunk_size=5000).summary()
+    assert streamed['prob_income_below_target'] == full['prob_income_below_target']
+    assert np.isclose(streamed['mean_terminal_capital'], full['mean_terminal_capital'])
+    assert np.isclose(streamed['terminal_capital_p5'], full['terminal_capital_p5'], rtol=1e-3)
+    assert 0 <= streamed['max_drawdown_p95'] < 1
+    print("✅ Streaming statistics match full-array results")
+
+
+def test_parallel_monte_carlo():
+    """Pool workers fill shared buffers; results do not depend on the worker count"""
+    import glob
+    import monte_carlo
+
+    optimizer = DynamicPortfolioOptimizer(use_yaml_config=False)
+    weights = optimizer.optimize_portfolio()
+    before = set(glob.glob(os.path.join(monte_carlo.SHARED_BUFFER_DIR or tempfile.gettempdir(), 'hfo_mc_*')))
+    try:
+        serial = optimizer.monte_carlo(weights, n_paths=9000, seed=21, max_workers=1)
+        engine = MonteCarloEngine(optimizer, seed=21)
+        parallel = engine.run_parallel(weights, 9000, chunk_size=5000, max_workers=2, keep_paths=True)
+        again = MonteCarloEngine(optimizer, seed=21).run_parallel(
+            weights, 9000, chunk_size=5000, max_workers=1)
+    finally:
+        shutdown_pool()
+    after = set(glob.glob(os.path.join(monte_carlo.SHARED_BUFFER_DIR or tempfile.gettempdir(), 'hfo_mc_*')))
+
+    assert serial.terminal_capital.shape == (1, 9000)
+    assert np.array_equal(parallel.terminal_capital, again.terminal_capital)
+    assert parallel.rates.shape == (9000, 36) and parallel.fx.shape == (9000, 37)
+    # Independent streams: blocks are not copies of each other
+    assert not np.allclose(parallel.rates[:5000].mean(axis=0), parallel.rates[5000:].mean(axis=0), atol=1e-6)
+    assert after == before  # buffers removed
+    # Results map the buffers instead of copying them; copy-on-write keeps them writable
+    assert isinstance(parallel.monthly_income, np.memmap) and parallel.monthly_income.flags.writeable
+    print("✅ Parallel Monte Carlo is reproducible across worker counts")
+
+
+def test_variance_reduction():
+    """Sobol + antithetic + control variates: same answer as plain MC, much smaller error"""
+    optimizer = DynamicPortfolioOptimizer(use_yaml_config=False)
+    weights = optimizer.optimize_portfolio()
+
+    engine = MonteCarloEngine(optimizer, seed=5, sampling='sobol', antithetic=True)
+    normals = engine._normals(1024)
+    assert normals.shape == (2, 1024, 36)
+    assert np.array_equal(normals[:, 512:], -normals[:, :512])
+
+    plain = MonteCarloEngine(optimizer, seed=5).estimate(weights, 'mean_monthly_income', 8192,
+                                                         control_variate=False)
+    reduced = engine.estimate(weights, 'mean_monthly_income', 8192)
+    assert abs(plain['variance_reduction'] - 1) < 1e-9
+    assert reduced['variance_reduction'] > 100
+    assert abs(reduced['estimate'] - plain['estimate']) < 4 * plain['standard_error']
+
+    # Controls are zero-mean deviations from the forecast path of simulate_portfolio_performance
+    simulation = optimizer.simulate_portfolio_performance(weights, 'constant', 'base', 'base')
+    expected_income = np.mean([year['monthly_income'] for year in simulation])
+    assert np.isclose(reduced['deterministic'], expected_income, rtol=1e-9)
+
+    probability = engine.estimate(weights, 'prob_income_meets_target', 8192)
+    assert 0 <= probability['estimate'] <= 1 and probability['effective_sample_size'] > 8192
+    print("✅ Quasi-Monte Carlo with variance reduction matches plain Monte Carlo")
+
+
+def test_goal_probabilities():
+    """Early stopping: narrower tolerance -> more paths; the time budget bounds latency"""
+    optimizer = DynamicPortfolioOptimizer(use_yaml_config=False)
+    weights = optimizer.optimize_portfolio()
+
+    coarse = optimizer.goal_probabilities(weights, tolerance=0.05, seed=3)
+    fine = optimizer.goal_probabilities(weights, tolerance=0.015, seed=3)
+    assert coarse['stop_reason'] == fine['stop_reason'] == 'converged'
+    assert coarse['paths'] < fine['paths']
+    low, high = fine['prob_income_meets_target_ci']
+    assert high - low <= 0.015 and low <= fine['prob_income_meets_target'] <= high
+    assert abs(coarse['prob_income_meets_target'] - fine['prob_income_meets_target']) < 0.05
+
+    limited = optimizer.goal_probabilities(weights, tolerance=1e-4, time_budget=0.2, seed=3)
+    assert limited['stop_reason'] == 'time_budget' and limited['paths'] < GOAL_MAX_PATHS
+
+    engine = MonteCarloEngine(optimizer, seed=3)
+    capped = engine.goal_probabilities(weights, tolerance=1e-4, time_budget=60, batch_size=1000, max_paths=2500)
+    assert capped['stop_reason'] == 'max_paths' and capped['paths'] == 2500
+    print("✅ Goal probabilities stop at the requested precision or time budget")
+
+
+def test_common_random_numbers():
+    """Candidates share one cached path set; paired differences have a much smaller error"""
+    rebalancer = DynamicRebalancer(use_yaml_config=False)
+    table = rebalancer.instrument_table
+
+    rng = np.random.default_rng(4)
+    points = rng.normal(0, 1, (200, len(table)))
+    expected = np.array([project_capped_simplex(p, table.lower, table.upper) for p in points])
+    assert np.allclose(project_capped_simplex_rows(points, table.lower, table.upper), expected, atol=1e-12)
+
+    # Without volatility every path is the forecast: same result as the deterministic engines
+    flat = get_path_set(rebalancer, 50, seed=1, rate_volatility=0, fx_volatility=0)
+    assert get_path_set(rebalancer, 50, seed=1, rate_volatility=0, fx_volatility=0) is flat
+    deterministic = rebalancer.optimize_with_monthly_rebalancing(rebalance_frequency='quarterly')
+    on_paths = rebalancer.simulate_rebalancing_on_paths(flat, rebalance_frequency='quarterly')
+    assert np.allclose(on_paths.terminal_capital, deterministic[-1]['capital'], rtol=1e-10)
+
+    two_tier = TwoTierStrategy(use_yaml_config=False)
+    assert np.allclose(two_tier.simulate_two_tier_on_paths(flat).monthly_income[0, 0],
+                       [month['monthly_income'] for month in _quiet(two_tier.optimize_two_tier)],
+                       rtol=1e-10)
+
+    path_set = rebalancer.path_set(n_paths=1000, seed=2)
+    rates, fx = path_set.paths(rebalancer, 'base', 'base')
+    assert rates.shape == (1000, 48) and fx.shape == (1000, 49)
+    # Different scenarios are driven by the same shocks
+    pessimistic_rates, _ = path_set.paths(rebalancer, 'pessimistic', 'base')
+    assert np.corrcoef(rates[:, 12], pessimistic_rates[:, 12])[0, 1] > 0.99
+
+    maximizer = ProfitMaximizer(use_yaml_config=False)
+    candidates = np.array([table.weights_vector(maximizer.optimize_for_max_profit(years)['weights'])
+                           for years in (1, 3)])
+    result = path_set.evaluate(maximizer, candidates)
+    difference = paired_difference(result.terminal_capital[1], result.terminal_capital[0])
+    assert difference['standard_error'] < difference['independent_standard_error'] / 3
+    print("✅ Common random numbers: shared path sets and paired comparisons")
+
+
+def _quiet(function, *args, **kwargs):
+    """Call a printing demo function with its output suppressed"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+def run_all_tests():
+    """Run all tests"""
+    print("="*80)
+    print("MONTE CARLO TEST SUITE")
+    print("="*80)
+
+    try:
+        test_monte_carlo()
+        test_streaming_stats()
+        test_parallel_monte_carlo()
+        test_variance_reduction()
+        test_goal_probabilities()
+        test_common_random_numbers()
+    except Exception as e:
+        print(f"\n❌ Monte Carlo test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+    print("\n✅ All Monte Carlo tests passed!")
+    return True
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,216 @@
+"""
+Test script for rebalancing
+Checks the DP schedule, incremental month solves, columnar results, the
+no-trade band and the rolling historical backtest
+"""
+
+import itertools
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from dynamic_rebalancer import DynamicRebalancer
+from two_tier_strategy import TwoTierStrategy
+from path_set import get_path_set
+from backtest import BACKTEST_POLICIES, HISTORY_FILES, HistoricalBacktest, MarketHistory
+from rebalancing_dp import simplex_grid, solve_rebalancing_schedule
+
+
+def test_rebalancing_schedule_dp():
+    """Backward induction matches brute force and beats fixed calendars"""
+    grid = simplex_grid([0, 0, 0.1], [0.6, 1, 0.5], 10)
+    assert np.allclose(grid.sum(axis=1), 1)
+    assert grid[:, 0].max() <= 0.6 + 1e-12 and grid[:, 2].min() >= 0.1 - 1e-12
+    assert len(grid) == len({tuple(row) for row in np.round(grid, 9)})
+
+    rng = np.random.default_rng(8)
+    month_yields = rng.uniform(2, 20, (5, 3))
+    small_grid = simplex_grid([0, 0, 0], [1, 1, 1], 2)
+    path, log_growth = solve_rebalancing_schedule(month_yields, small_grid, 2.0)
+
+    def log_capital(states):
+        total, previous = 0.0, None
+        for month, state in enumerate(states):
+            if previous is not None:
+                total += np.log(1 - 0.02 * np.abs(small_grid[state] - small_grid[previous]).sum())
+            total += np.log1p(month_yields[month] @ small_grid[state] / 1200)
+            previous = state
+        return total
+
+    best = max(itertools.product(range(len(small_grid)), repeat=len(month_yields)), key=log_capital)
+    assert np.isclose(log_growth, log_capital(best)) and np.isclose(log_capital(path), log_capital(best))
+
+    rebalancer = DynamicRebalancer(use_yaml_config=False)
+    optimal = rebalancer.optimize_with_monthly_rebalancing(rebalance_frequency='optimal')
+    for frequency in ('none', 'annual', 'monthly'):
+        calendar = rebalancer.optimize_with_monthly_rebalancing(rebalance_frequency=frequency)
+        assert optimal[-1]['capital'] >= calendar[-1]['capital']
+    assert optimal[0]['rebalanced'] and sum(month['rebalanced'] for month in optimal) < 36
+    print("✅ DP rebalancing schedule is optimal on its grid")
+
+
+def test_incremental_month_solves():
+    """Unchanged month inputs reuse the previous solution with identical results"""
+    for solver in ('qp', 'slsqp'):
+        results = []
+        for incremental in (False, True):
+            rebalancer = DynamicRebalancer(use_yaml_config=False, month_solver=solver)
+            rebalancer.use_incremental_solve = incremental
+            results.append([rebalancer.optimize_with_monthly_rebalancing(rate_scenario=rate)
+                            for rate in ('base', 'optimistic')])
+        for plain, incremental in zip(*results):
+            assert np.array_equal(plain.capital, incremental.capital)
+            assert np.array_equal(plain.weights, incremental.weights)
+        stats = rebalancer.month_solve_stats()
+        assert stats['solves'] + stats['skipped'] == 72 and stats['skipped'] >= 48
+
+    # Monthly-varying inputs (linear curves) are re-solved every month
+    rebalancer = DynamicRebalancer(use_yaml_config=False)
+    rebalancer.curve_interpolation = 'linear'
+    rebalancer.optimize_with_monthly_rebalancing()
+    assert rebalancer.month_solve_stats() == {'solves': 36, 'skipped': 0}
+    print("✅ Month problems are re-solved only when their inputs change")
+
+
+def test_columnar_rebalancing_result():
+    """Monthly results are arrays; rows, year views and the DataFrame agree"""
+    rebalancer = DynamicRebalancer(use_yaml_config=False)
+    result = rebalancer.optimize_with_monthly_rebalancing(years=3, rebalance_frequency='quarterly')
+    table = rebalancer.instrument_table
+
+    assert len(result) == 36 and result.weights.shape == (36, len(table))
+    assert result.capital.flags.c_contiguous and not result.capital.flags.writeable
+    assert result.rebalanced.sum() == 12 and result[3]['rebalanced'] and not result[4]['rebalanced']
+    row = result[-1]
+    assert row['month'] == 36 and row['year'] == 3 and row['month_in_year'] == 12
+    assert row['capital'] == result.capital[-1]
+    assert np.array_equal(table.weights_vector(row['weights']), result.weights[-1])
+
+    second_year = result.year_slice(2)
+    assert len(second_year) == 12 and second_year.month[0] == 13
+    assert np.shares_memory(second_year.weights, result.weights)
+    assert np.shares_memory(second_year.capital, result.capital)
+
+    frame = result.to_dataframe()
+    assert frame is result.to_dataframe()
+    assert list(frame.columns[-len(table):]) == list(table.names)
+    assert np.allclose(frame.groupby('year')['monthly_income'].sum(),
+                       [result.year_slice(year).monthly_income.sum() for year in (1, 2, 3)])
+    print("✅ Columnar rebalancing results with zero-copy year views")
+
+
+def test_threshold_rebalancing():
+    """No-trade band: solver runs only when inputs change, trades only outside the band"""
+    rebalancer = DynamicRebalancer(use_yaml_config=False)
+    none = rebalancer.optimize_with_monthly_rebalancing(rebalance_frequency='none')
+    annual = rebalancer.optimize_with_monthly_rebalancing(rebalance_frequency='annual')
+
+    # Step curves change once a year: three optimizer calls in 36 months
+    rebalancer = DynamicRebalancer(use_yaml_config=False)
+    rebalancer.use_incremental_solve = False
+    wide = rebalancer.optimize_with_monthly_rebalancing(rebalance_frequency='threshold')
+    assert rebalancer.month_solve_stats()['solves'] == 3
+    assert np.array_equal(wide.capital, none.capital) and wide.rebalanced.sum() == 1
+
+    # Any change trades: the same as re-optimizing at every change of the forecast
+    rebalancer.drift_band, rebalancer.gain_band_pct = 0.0, -np.inf
+    tight = rebalancer.optimize_with_monthly_rebalancing(rebalance_frequency='threshold')
+    assert np.array_equal(tight.capital, annual.capital)
+    assert list(np.flatnonzero(tight.rebalanced)) == [0, 12, 24]
+
+    path_set = get_path_set(rebalancer, 300, seed=6)
+    rebalancer.drift_band, rebalancer.gain_band_pct = 0.05, 0.0
+    banded = rebalancer.simulate_rebalancing_on_paths(path_set, rebalance_frequency='threshold')
+    monthly = rebalancer.simulate_rebalancing_on_paths(path_set, rebalance_frequency='monthly')
+    assert banded.terminal_capital.mean() > monthly.terminal_capital.mean()
+
+    # Без шума путь совпадает с прогнозом: на путях и в прогнозе одна и та же полоса
+    # (gain-only band: a 1-month horizon would trade at months 12 and 24, 12 months would not)
+    rebalancer = DynamicRebalancer(use_yaml_config=False, drift_band=np.inf, gain_band_pct=-0.01)
+    flat = get_path_set(rebalancer, 2, seed=0, rate_volatility=0.0, fx_volatility=0.0)
+    for horizon, trades in ((12, [0]), (1, [0, 12, 24])):
+        rebalancer.band_horizon_months = horizon
+        deterministic = rebalancer.optimize_with_monthly_rebalancing(rebalance_frequency='threshold')
+        on_paths = rebalancer.simulate_rebalancing_on_paths(flat, rebalance_frequency='threshold')
+        assert list(np.flatnonzero(deterministic.rebalanced)) == trades
+        assert np.allclose(on_paths.monthly_income[0], deterministic.monthly_income)
+        assert np.allclose(on_paths.terminal_capital[0], deterministic.capital[-1])
+    print("✅ Threshold rebalancing trades only outside the no-trade band")
+
+
+def test_historical_backtest():
+    """Rolling windows over CSV history: batched policies match single-window runs"""
+    days = pd.bdate_range('2012-01-01', '2024-12-31')
+    rng = np.random.default_rng(9)
+    cbr = np.round(np.clip(8 + np.cumsum(rng.normal(0, 0.05, len(days))), 4, 20) * 4) / 4
+    fx = 60 * np.exp(np.cumsum(rng.normal(0.0001, 0.008, len(days))))
+    with tempfile.TemporaryDirectory() as directory:
+        # Формат выгрузки ЦБ: DD.MM.YYYY и десятичная запятая
+        pd.DataFrame({'date': days.strftime('%d.%m.%Y'),
+                      'rate': [f"{v:.2f}".replace('.', ',') for v in cbr]}).to_csv(
+            os.path.join(directory, HISTORY_FILES['cbr']), index=False)
+        pd.DataFrame({'date': days.strftime('%Y-%m-%d'), 'rate': cbr - 0.3}).to_csv(
+            os.path.join(directory, HISTORY_FILES['ruonia']), index=False)
+        pd.DataFrame({'date': days.strftime('%Y-%m-%d'), 'rate': fx}).to_csv(
+            os.path.join(directory, HISTORY_FILES['usd_rub']), index=False)
+        history = MarketHistory.from_csv(directory)
+
+    assert len(history) == 13 * 12 and history.dates[0] == pd.Timestamp('2012-01-01')
+    assert np.isclose(history.cbr[0], cbr[days < '2012-02-01'].mean())
+    assert np.isclose(history.ruonia[0], history.cbr[0] - 0.3)
+
+    backtest = HistoricalBacktest(history, years=3, rebalancer=DynamicRebalancer(use_yaml_config=False),
+                                  two_tier=TwoTierStrategy(use_yaml_config=False))
+    assert len(backtest) == len(history) - 36
+    result = backtest.run()
+    assert result.result.terminal_capital.shape == (len(BACKTEST_POLICIES), len(backtest))
+
+    # Окна независимы: пакетный расчет совпадает с расчетом одного окна
+    decision, realized = backtest.yields()
+    for policy in ('quarterly', 'threshold'):
+        income, capital = result.policy(policy)
+        single = backtest.rebalancer.rebalance_batch(decision[40:41], realized[40:41], policy)
+        assert np.allclose(single.monthly_income[0, 0], income[40])
+        assert np.isclose(single.terminal_capital[0, 0], capital[40])
+
+    # Two-tier row follows the month-by-month rules with realized RUONIA for SBMM
+    strategy = backtest.two_tier
+    total = strategy.initial_capital_rub + strategy.initial_usd_amount * strategy.current_usd_rub
+    deposit, sbmm = total * strategy.deposit_allocation, total * strategy.dynamic_allocation
+    for month in range(36):
+        sbmm += sbmm * backtest.ruonia[7, month] / 12 / 100
+    assert np.isclose(result.policy('two_tier')[1][7], deposit + sbmm)
+
+    summary = result.summary()
+    assert list(summary.index) == list(BACKTEST_POLICIES)
+    assert (summary['terminal_capital_p5'] <= summary['terminal_capital_p95']).all()
+    print(f"✅ Historical backtest: {len(backtest)} rolling windows, {len(BACKTEST_POLICIES)} policies")
+
+def run_all_tests():
+    """Run all tests"""
+    print("="*80)
+    print("REBALANCING TEST SUITE")
+    print("="*80)
+
+    try:
+        test_rebalancing_schedule_dp()
+        test_incremental_month_solves()
+        test_columnar_rebalancing_result()
+        test_threshold_rebalancing()
+        test_historical_backtest()
+    except Exception as e:
+        print(f"\n❌ Rebalancing test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+    print("\n✅ All rebalancing tests passed!")
+    return True
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,162 @@
+"""
+Test script for the Result Store
+Checks persistence across store instances / processes, TTL and size pruning
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import portfolio_optimizer
+from portfolio_optimizer import DynamicPortfolioOptimizer, SIMULATION_DTYPE
+from result_cache import ResultCache
+from result_store import PRUNE_EVERY, ResultStore
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_round_trip():
+    """Weights, structured simulation arrays and metadata survive a reopen"""
+    tmp_dir = tempfile.mkdtemp(prefix='hfo_store_')
+    try:
+        path = os.path.join(tmp_dir, 'results.sqlite')
+        simulation = np.zeros(3, dtype=SIMULATION_DTYPE)
+        simulation['year'] = [1, 2, 3]
+        ResultStore(path).put('k', 'optimize_portfolio', weights=np.array([0.25, 0.75]),
+                              simulation=simulation, metadata={'solver': 'SLSQP'})
+
+        entry = ResultStore(path).get('k')
+        assert np.array_equal(entry['weights'], [0.25, 0.75])
+        assert entry['simulation'].dtype == SIMULATION_DTYPE
+        assert list(entry['simulation']['year']) == [1, 2, 3]
+        assert entry['metadata'] == {'solver': 'SLSQP'}
+        assert not entry['weights'].flags.writeable
+        assert ResultStore(path).get('missing') is None
+        print("✅ Entries round-trip through SQLite")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_prune():
+    """TTL removes old entries, max_entries keeps the most recently used"""
+    tmp_dir = tempfile.mkdtemp(prefix='hfo_store_')
+    try:
+        store = ResultStore(os.path.join(tmp_dir, 'results.sqlite'), ttl_days=None, max_entries=None)
+        for key in ('a', 'b', 'c'):
+            store.put(key, 'optimize_portfolio', weights=np.ones(2))
+            time.sleep(0.01)
+        store.get('a')  # 'a' becomes the most recently used
+
+        assert store.prune(max_entries=2) == 1
+        assert store.get('b') is None and store.get('a') is not None
+
+        old = time.time() - 3 * 86400
+        store._connection().execute("UPDATE results SET created = ? WHERE key = 'c'", (old,))
+        assert store.prune(ttl_days=1) == 1
+        assert store.stats()['entries'] == 1
+        print("✅ Prune applies TTL and size limits")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_put_enforces_limits():
+    """Writes prune the store themselves; simulations and old result versions are not persisted"""
+    tmp_dir = tempfile.mkdtemp(prefix='hfo_store_')
+    try:
+        store = ResultStore(os.path.join(tmp_dir, 'results.sqlite'), ttl_days=None, max_entries=10)
+        for i in range(PRUNE_EVERY):
+            store.put(f'k{i}', 'optimize_portfolio', weights=np.ones(2))
+        assert store.stats()['entries'] == 10
+
+        optimizer = DynamicPortfolioOptimizer(use_yaml_config=False)
+        optimizer.result_cache = ResultCache()
+        optimizer.result_store = ResultStore(os.path.join(tmp_dir, 'optimizer.sqlite'))
+        weights = optimizer.optimize_portfolio('constant', 'base', 'base')
+        optimizer.simulate_portfolio_performance(weights, 'constant', 'base', 'base')
+        assert optimizer.result_store.stats()['by_kind'] == {'optimize_portfolio': 1}
+
+        # Другая версия формата - другой ключ: старые веса не переиспользуются
+        key = optimizer._optimize_key('constant', 'base', 'base')
+        portfolio_optimizer.RESULT_FORMAT_VERSION += 1
+        try:
+            assert optimizer._optimize_key('constant', 'base', 'base') != key
+        finally:
+            portfolio_optimizer.RESULT_FORMAT_VERSION -= 1
+        print("✅ Store stays within its limits and is keyed by the result format version")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_store_is_opt_in():
+    """Plain optimizers get no persistent store; the environment variable enables it"""
+    env = {key: value for key, value in os.environ.items() if key != 'PORTFOLIO_RESULT_STORE'}
+    script = ("from portfolio_optimizer import DynamicPortfolioOptimizer\n"
+              "print(DynamicPortfolioOptimizer(use_yaml_config=False).result_store)\n")
+    output = subprocess.run([sys.executable, '-c', script], cwd=PACKAGE_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout.strip().splitlines()
+    assert output[-1] == 'None'
+    print("✅ Result store is opt-in")
+
+
+def test_shared_across_processes():
+    """A second process reuses the optimization stored by the first one"""
+    tmp_dir = tempfile.mkdtemp(prefix='hfo_store_')
+    try:
+        path = os.path.join(tmp_dir, 'results.sqlite')
+        script = (
+            "from portfolio_optimizer import DynamicPortfolioOptimizer\n"
+            "o = DynamicPortfolioOptimizer(use_yaml_config=False)\n"
+            "w = o.optimize_portfolio('constant', 'base', 'base')\n"
+            "print(o.result_store.hits, repr([round(float(v), 10) for v in w.values()]))\n"
+        )
+        env = dict(os.environ, PORTFOLIO_RESULT_STORE=path)
+        runs = [subprocess.run([sys.executable, '-c', script], cwd=PACKAGE_DIR, env=env,
+                               capture_output=True, text=True, check=True).stdout.strip().splitlines()[-1]
+                for _ in range(2)]
+
+        first_hits, first_weights = runs[0].split(' ', 1)
+        second_hits, second_weights = runs[1].split(' ', 1)
+        assert first_hits == '0' and second_hits == '1'
+        assert first_weights == second_weights
+
+        # In-process: a fresh memory cache falls back to the store
+        optimizer = DynamicPortfolioOptimizer(use_yaml_config=False)
+        optimizer.result_cache = ResultCache()
+        optimizer.result_store = ResultStore(path)
+        optimizer.optimize_portfolio('constant', 'base', 'base')
+        assert optimizer.result_store.hits == 1
+        print("✅ Results are reused across processes")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("="*80)
+    print("RESULT STORE TEST SUITE")
+    print("="*80)
+
+    try:
+        test_round_trip()
+        test_prune()
+        test_put_enforces_limits()
+        test_store_is_opt_in()
+        test_shared_across_processes()
+    except Exception as e:
+        print(f"\n❌ Result store test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+    print("\n✅ All result store tests passed!")
+    return True
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
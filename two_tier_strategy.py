@@ -4,6 +4,8 @@ Fixed deposit + Dynamic SBMM/USD rebalancing
 """
 
 from portfolio_optimizer import DynamicPortfolioOptimizer
+from monte_carlo import MonteCarloResult
+from path_set import paired_difference
 import pandas as pd
 import numpy as np
 
@@ -56,26 +58,27 @@ class TwoTierStrategy(DynamicPortfolioOptimizer):
         current_sbmm = dynamic_capital  # Start with all in SBMM
         current_usd_rub = 0
         
+        # Кривые прогнозов на начало каждого месяца (любой горизонт)
+        curves = self.forecast_curves
+        month_index = curves.month_index(years * 12)
+        cbr_rates = curves.cbr_at(rate_scenario, month_index)
+        fx_rates = curves.fx_at(fx_scenario, month_index)
+        # Курс через год от начала месяца - ожидание по валюте
+        fx_year_ahead = curves.fx_at(fx_scenario, month_index + curves.periods_per_year)
+        
         for month in range(years * 12):
             year_idx = month // 12
             
             # Calculate yields for this month
-            cbr_rate = self.cbr_scenarios[rate_scenario][min(year_idx, len(self.cbr_scenarios[rate_scenario])-1)]
+            cbr_rate = float(cbr_rates[month])
             
             # SBMM yield this year
             sbmm_annual_yield = (cbr_rate - 1.0)  # RUONIA = CBR - 1%
             sbmm_monthly_yield = sbmm_annual_yield / 12 / 100
             
-            # USD expected gain for NEXT month
-            fx_current = self.fx_scenarios[fx_scenario][min(year_idx, len(self.fx_scenarios[fx_scenario])-1)]
-            fx_next_month = self.fx_scenarios[fx_scenario][min(year_idx, len(self.fx_scenarios[fx_scenario])-1)]
-            # Approximate monthly USD change (simplified)
-            if month < 12:
-                fx_next = self.fx_scenarios[fx_scenario][1]
-            elif month < 24:
-                fx_next = self.fx_scenarios[fx_scenario][2]
-            else:
-                fx_next = self.fx_scenarios[fx_scenario][3]
+            # USD expected gain for NEXT month (годовое изменение курса / 12)
+            fx_current = float(fx_rates[month])
+            fx_next = float(fx_year_ahead[month])
             
             usd_expected_monthly = ((fx_next - fx_current) / fx_current / 12) * 100 if fx_next > fx_current else 0
             
@@ -124,8 +127,53 @@ class TwoTierStrategy(DynamicPortfolioOptimizer):
         
         return monthly_results
     
-    def display_two_tier_results(self):
-        """Показать результаты двухуровневой стратегии"""
+    def simulate_two_tier_on_paths(self, path_set, rate_scenario='base', fx_scenario='base'):
+        """
+        optimize_two_tier на каждом пути path_set сразу (без печати)
+        
+        The key rate of every month comes from the simulated path; as in
+        optimize_two_tier, the dynamic tier stays in SBMM and the deposit
+        tier pays (CBR - 0.5%) after tax on the fixed deposit capital.
+        Returns a MonteCarloResult for comparison with other candidates on
+        the same path_set.
+        """
+        rates, _ = path_set.paths(self, rate_scenario, fx_scenario)
+        return self.two_tier_batch(rates[:, :path_set.months])
+    
+    def two_tier_batch(self, cbr_rates, sbmm_rates=None):
+        """
+        Двухуровневая стратегия для многих строк ставки сразу
+        
+        cbr_rates: (rows, months) key rate (%) of each month; sbmm_rates: the
+        SBMM yield (%), CBR - 1% (the RUONIA proxy of optimize_two_tier) by
+        default, the realized RUONIA in a historical backtest.
+        Returns a MonteCarloResult with one portfolio.
+        """
+        total_capital = self.initial_capital_rub + self.initial_usd_amount * self.current_usd_rub
+        deposit_capital = total_capital * self.deposit_allocation
+        cbr_rates = np.asarray(cbr_rates, dtype=float)
+        if sbmm_rates is None:
+            sbmm_rates = cbr_rates - 1.0
+        
+        sbmm_monthly_yield = np.asarray(sbmm_rates, dtype=float) / 12 / 100
+        # SBMM реинвестируется: капитал на начало месяца - произведение прошлых множителей
+        growth = np.cumprod(1 + sbmm_monthly_yield, axis=1)
+        sbmm_start = total_capital * self.dynamic_allocation * np.concatenate(
+            [np.ones((len(cbr_rates), 1)), growth[:, :-1]], axis=1)
+        sbmm_income = sbmm_start * sbmm_monthly_yield
+        deposit_income = deposit_capital * (cbr_rates - 0.5) * 0.87 / 100 / 12
+        
+        monthly_income = sbmm_income + deposit_income
+        terminal_capital = deposit_capital + sbmm_start[:, -1] + sbmm_income[:, -1]
+        return MonteCarloResult(monthly_income[None], terminal_capital[None], self.monthly_income_target)
+    
+    def display_two_tier_results(self, common_paths=False):
+        """
+        Показать результаты двухуровневой стратегии
+        
+        common_paths=True добавляет сравнение с оптимальным статическим
+        портфелем на одном наборе путей ставки и курса (см. path_set).
+        """
         
         results = self.optimize_two_tier()
         
@@ -166,6 +214,15 @@ class TwoTierStrategy(DynamicPortfolioOptimizer):
         print(f"{'='*100}")
         print(f"Итоговый капитал:   {final_result['total_capital']:>15,.0f} руб")
         print(f"Прибыль:            {total_profit:>15,.0f} руб ({total_profit/(self.initial_capital_rub + self.initial_usd_amount * self.current_usd_rub)*100:.2f}%)")
+        
+        if common_paths:
+            # Сравнение с оптимальным статическим портфелем на одних и тех же путях ставки и курса
+            path_set = self.path_set(years=3)
+            two_tier = self.simulate_two_tier_on_paths(path_set)
+            static = path_set.evaluate(self, self.optimize_portfolio())
+            difference = paired_difference(two_tier.terminal_capital[0], static.terminal_capital[0])
+            print(f"\n🎲 Против оптимального портфеля ({len(path_set):,} общих путей): "
+                  f"{difference['mean_difference']:+,.0f} ± {difference['standard_error']:,.0f} руб итогового капитала")
         print(f"{'='*100}\n")
 
 
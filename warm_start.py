@@ -0,0 +1,70 @@
+"""
+Warm Start
+Reuses the previous solution of a similar problem as the next starting point
+"""
+
+import threading
+
+import numpy as np
+
+
+class WarmStartCache:
+    """
+    Last solution per problem family (e.g. 'optimize_portfolio' over the same
+    instruments) plus iteration statistics.
+
+    Scenario parameters are deliberately not part of the family key: the
+    answer for the next month / scenario / UI rerun is usually close to the
+    previous one, which is exactly what makes it a good starting point.
+
+    Iterations saved are estimated against the average iteration count of
+    cold starts (solves from the uniform portfolio) of the same family.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._solutions = {}
+        self._cold_iterations = {}  # family -> (total iterations, cold solves)
+        self.solves = 0
+        self.warm_solves = 0
+        self.iterations = 0
+        self.iterations_saved = 0.0
+
+    def initial_guess(self, family, default):
+        """Previous solution of this family (if shapes match) or default"""
+        with self._lock:
+            entry = self._solutions.get(family)
+        if entry is not None and entry['x'].shape == np.shape(default):
+            return entry['x'].copy(), True
+        return np.asarray(default, dtype=float), False
+
+    def record(self, family, x, iterations, warm):
+        """Store a converged solution and update iteration statistics"""
+        x = np.array(x, dtype=float)
+
+        with self._lock:
+            self._solutions[family] = {'x': x}
+            self.solves += 1
+            self.iterations += int(iterations)
+            total, count = self._cold_iterations.get(family, (0, 0))
+            if warm:
+                self.warm_solves += 1
+                if count:
+                    self.iterations_saved += max(total / count - iterations, 0)
+            else:
+                self._cold_iterations[family] = (total + int(iterations), count + 1)
+
+    def clear(self):
+        """Forget stored solutions (statistics are kept)"""
+        with self._lock:
+            self._solutions.clear()
+
+    def stats(self):
+        """Solves, warm-started solves, iterations used and estimated iterations saved"""
+        with self._lock:
+            return {
+                'solves': self.solves,
+                'warm_solves': self.warm_solves,
+                'iterations': self.iterations,
+                'iterations_saved': round(self.iterations_saved, 1),
+            }
@@ -8,6 +8,9 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from portfolio_optimizer import DynamicPortfolioOptimizer
+from result_store import enable_default_store
+from scenario_engine import solve_scenarios
+from scenario_sweep import BackgroundSweep
 import sys
 
 # Page config
@@ -97,12 +100,33 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Initialize session state
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def cached_goal_probabilities(key, _optimizer, weights, capital_scenario, rate_scenario, fx_scenario):
+    """
+    goal_probabilities один раз на набор входных данных
+
+    key is the optimizer's result key of the weights, scenarios and parameters;
+    the optimizer itself is not hashed. Reruns with the same inputs reuse the
+    estimate instead of spending another time_budget on Monte Carlo.
+    """
+    return _optimizer.goal_probabilities(weights, capital_scenario, rate_scenario, fx_scenario,
+                                         tolerance=0.02, time_budget=1.0, seed=0)
+
+
+# Initialize session state (results persist across restarts in the result store)
 if 'optimizer' not in st.session_state:
-    st.session_state.optimizer = DynamicPortfolioOptimizer()
+    enable_default_store()
+    st.session_state.optimizer = DynamicPortfolioOptimizer(use_config_snapshot=True)
 
 optimizer = st.session_state.optimizer
 
+# All capital × rate × FX combinations, recomputed in the background when the config changes
+if 'sweep' not in st.session_state:
+    st.session_state.sweep = BackgroundSweep()
+
+background_sweep = st.session_state.sweep
+
 # Sidebar
 with st.sidebar:
     st.image("https://img.icons8.com/fluency/96/000000/money-bag.png", width=80)
@@ -164,36 +188,39 @@ with st.sidebar:
     st.subheader("Сценарии")
     capital_scenario = st.selectbox(
         "Изменение капитала",
-        options=['constant', 'decrease_5', 'decrease_10', 'increase_5', 'increase_10'],
+        options=list(optimizer.capital_growth_scenarios),
         format_func=lambda x: {
             'constant': 'Постоянный',
             'decrease_5': 'Снижение 5%/год',
             'decrease_10': 'Снижение 10%/год',
             'increase_5': 'Рост 5%/год',
             'increase_10': 'Рост 10%/год'
-        }[x]
+        }.get(x, x)
     )
     
     rate_scenario = st.selectbox(
         "Ставка ЦБ",
-        options=['base', 'pessimistic', 'optimistic'],
+        options=list(optimizer.cbr_scenarios),
         format_func=lambda x: {
             'base': 'Базовый',
             'pessimistic': 'Пессимистичный',
             'optimistic': 'Оптимистичный'
-        }[x]
+        }.get(x, x)
     )
     
     fx_scenario = st.selectbox(
         "Курс валют",
-        options=['base', 'pessimistic', 'optimistic'],
+        options=list(optimizer.fx_scenarios),
         format_func=lambda x: {
             'base': 'Базовый',
             'pessimistic': 'Пессимистичный',
             'optimistic': 'Оптимистичный'
-        }[x]
+        }.get(x, x)
     )
 
+background_sweep.refresh(optimizer)
+sweep = background_sweep.current(optimizer)
+
 # Main header
 st.markdown('<p class="main-header">💰 Hedge Fund Portfolio Optimizer</p>', unsafe_allow_html=True)
 
@@ -229,16 +256,21 @@ with tab1:
     st.subheader("Оптимальное распределение активов")
     
     with st.spinner("Оптимизация портфеля..."):
-        optimal_weights = optimizer.optimize_portfolio(capital_scenario, rate_scenario, fx_scenario)
+        if sweep is not None:
+            optimal_weights = sweep.lookup(capital_scenario, rate_scenario, fx_scenario)['weights']
+        else:
+            optimal_weights = optimizer.optimize_portfolio(capital_scenario, rate_scenario, fx_scenario)
         
+    # After-tax yields for year 1 (lookup into the precomputed yield cube)
+    first_year_yields = optimizer.after_tax_yield_vector(0, rate_scenario, fx_scenario)
+    
     # Prepare allocation data
     allocation_data = []
     for instrument, weight in optimal_weights.items():
         if weight > 0.01:
             instrument_info = optimizer.instruments[instrument]
             capital_allocated = total_capital * weight
-            base_yield = instrument_info['yield']
-            adjusted_yield = optimizer.calculate_after_tax_yield(instrument, base_yield, 0, rate_scenario)
+            adjusted_yield = float(first_year_yields[optimizer.instrument_table.index[instrument]])
             
             if instrument_info['currency'] == 'USD':
                 capital_display = f"${capital_allocated/optimizer.current_usd_rub:,.0f}"
@@ -251,7 +283,7 @@ with tab1:
                 'Доля': f"{weight*100:.1f}%",
                 'Сумма': capital_display,
                 'Валюта': instrument_info['currency'],
-                'Доходность': f"{base_yield:.1f}%",
+                'Доходность': f"{instrument_info['yield']:.1f}%",
                 'После налогов': f"{adjusted_yield:.1f}%",
                 'Налог': 'Нет' if instrument_info.get('tax_free') else 'НДФЛ 13%',
                 'weight': weight,
@@ -291,6 +323,22 @@ with tab1:
             title='Распределение по типам инструментов'
         )
         st.plotly_chart(fig_type, width='stretch')
+    
+    # Вероятности целей: Monte Carlo с ранней остановкой (ограниченное время ответа)
+    goals_key = optimizer._result_key('goal_probabilities', capital_scenario, rate_scenario, fx_scenario,
+                                      optimizer.instrument_table.weights_vector(optimal_weights))
+    goals = cached_goal_probabilities(goals_key, optimizer, optimal_weights,
+                                      capital_scenario, rate_scenario, fx_scenario)
+    col1, col2 = st.columns(2)
+    with col1:
+        low, high = goals['prob_income_meets_target_ci']
+        st.metric("Вероятность достичь цели по доходу", f"{goals['prob_income_meets_target']*100:.1f}%",
+                  help=f"95% интервал: {low*100:.1f}–{high*100:.1f}%")
+    with col2:
+        low, high = goals['prob_capital_preserved_ci']
+        st.metric("Вероятность сохранить капитал", f"{goals['prob_capital_preserved']*100:.1f}%",
+                  help=f"95% интервал: {low*100:.1f}–{high*100:.1f}%")
+    st.caption(f"🎲 {goals['paths']:,} путей ставки ЦБ и курса за {goals['elapsed']:.2f} с")
 
 # Tab 2: Forecast
 with tab2:
@@ -390,8 +438,7 @@ with tab3:
         capital = item['capital_rub']
         
         # Get adjusted yield
-        base_yield = optimizer.instruments[instrument]['yield']
-        adjusted_yield = optimizer.calculate_after_tax_yield(instrument, base_yield, 0, rate_scenario)
+        adjusted_yield = float(first_year_yields[optimizer.instrument_table.index[instrument]])
         
         # Calculate monthly income
         annual_income = capital * adjusted_yield / 100
@@ -541,9 +588,9 @@ with tab5:
     comparison_data = []
     
     with st.spinner("Сравнение сценариев..."):
-        for capital_s, rate_s, fx_s, label in scenarios:
-            weights = optimizer.optimize_portfolio(capital_s, rate_s, fx_s)
-            sim = optimizer.simulate_portfolio_performance(weights, capital_s, rate_s, fx_s)
+        solutions = solve_scenarios(optimizer, [scenario[:3] for scenario in scenarios])
+        for (capital_s, rate_s, fx_s, label), solution in zip(scenarios, solutions):
+            sim = solution['simulation']
             
             avg_yield = sum([r['portfolio_yield'] for r in sim]) / len(sim)
             avg_income = sum([r['monthly_income'] for r in sim]) / len(sim)
@@ -592,6 +639,24 @@ with tab5:
             color_continuous_scale='Greens'
         )
         st.plotly_chart(fig_comp_capital, width='stretch')
+    
+    # Full capital × rate × FX grid (precomputed in the background, answered by lookup)
+    st.markdown("#### Все комбинации сценариев")
+    if sweep is None:
+        background_sweep.wait(timeout=10)
+        sweep = background_sweep.current(optimizer)
+    if sweep is None and background_sweep.error is not None:
+        st.warning(f"⚠️ Не удалось рассчитать сетку сценариев: {background_sweep.error}")
+    elif sweep is None:
+        done, total = background_sweep.progress
+        st.info(f"⏳ Сетка сценариев рассчитывается в фоне ({done} из {total})...")
+    else:
+        st.dataframe(sweep.summary(optimizer.monthly_income_target).style.format({
+            'Ср. доходность': '{:.1f}%',
+            'Ср. месячный доход': '{:,.0f} руб',
+            'Итоговый капитал': '{:,.0f} руб',
+            'Покрытие расходов': '{:.0f}%'
+        }), width='stretch', hide_index=True)
 
 # Tab 6: Instruments
 with tab6:
@@ -647,9 +712,13 @@ with tab6:
             if data.get('variable_coupon'):
                 st.warning("📊 Переменные месячные купоны (см. вкладку 'Прогнозы')")
             
-            if data.get('description'):
+            # Descriptions are not part of the compiled snapshot - read from YAML on demand
+            description = data.get('description')
+            if not description and getattr(optimizer, 'config_loader', None) is not None:
+                description = optimizer.config_loader.get_instrument_description(name)
+            if description:
                 st.markdown("**Описание:**")
-                st.write(data['description'])
+                st.write(description)
     
     st.divider()
     st.info("💡 Чтобы добавить новый инструмент, отредактируйте `instruments_config.yaml` и выполните `git push`")
@@ -818,6 +887,15 @@ with tab7:
     st.divider()
     st.info("💡 Обновляйте прогнозы ежеквартально в файле `forecasts_config.yaml`, затем выполните `git push`")
 
+# Solver statistics (optimizer persists in session_state, so warm starts chain across reruns)
+with st.sidebar:
+    warm_stats = optimizer.warm_start.stats()
+    st.caption(f"⚡ Теплый старт: {warm_stats['warm_solves']}/{warm_stats['solves']} решений, "
+               f"сэкономлено ~{warm_stats['iterations_saved']:.0f} итераций")
+    cache_stats = optimizer.result_cache.stats()
+    st.caption(f"💾 Кэш результатов: {cache_stats['hits']} попаданий / {cache_stats['misses']} промахов "
+               f"({cache_stats['hit_rate']*100:.0f}%)")
+
 # Footer
 st.divider()
 st.markdown("""
@@ -0,0 +1,70 @@
+"""
+Yield Engine
+Precomputed after-tax yield cube: year × rate scenario × FX scenario × instrument
+"""
+
+import numpy as np
+
+
+class YieldCube:
+    """
+    After-tax yields (%) for every instrument, year and scenario pair.
+
+    The rate axis (CBR key rate) and the FX axis (USD/RUB) are independent,
+    so any rate scenario can be combined with any FX scenario.
+    Years past the end of the forecasts reuse the last forecast value, exactly
+    like the scalar calculate_after_tax_yield.
+    """
+
+    def __init__(self, table, cbr_scenarios, fx_scenarios, usd_spread_pct):
+        self.table = table
+        self.rate_names = tuple(cbr_scenarios.keys())
+        self.fx_names = tuple(fx_scenarios.keys())
+        self.rate_index = {name: i for i, name in enumerate(self.rate_names)}
+        self.fx_index = {name: i for i, name in enumerate(self.fx_names)}
+        self.key = self.config_key(table, cbr_scenarios, fx_scenarios, usd_spread_pct)
+
+        # Past this many years every scenario series is flat
+        self.n_years = max([len(r) for r in cbr_scenarios.values()] +
+                           [len(r) for r in fx_scenarios.values()])
+        years = np.arange(self.n_years)
+
+        # cbr[y, r]: ставка ЦБ в году y
+        cbr = np.array([[rates[min(y, len(rates)-1)] for rates in cbr_scenarios.values()]
+                        for y in years], dtype=float).reshape(self.n_years, len(self.rate_names))
+        # fx_start[y, f], fx_end[y, f]: курс на начало и конец года y
+        fx_start = np.array([[rates[min(y, len(rates)-1)] for rates in fx_scenarios.values()]
+                             for y in years], dtype=float).reshape(self.n_years, len(self.fx_names))
+        fx_end = np.array([[rates[min(y + 1, len(rates)-1)] for rates in fx_scenarios.values()]
+                           for y in years], dtype=float).reshape(self.n_years, len(self.fx_names))
+
+        # Broadcast to (year, rate, fx, instrument)
+        cube = table.after_tax_yields(
+            cbr[:, :, None, None],
+            fx_start[:, None, :, None],
+            fx_end[:, None, :, None],
+            usd_spread_pct,
+        )
+        self.values = np.ascontiguousarray(cube)
+        self.values.setflags(write=False)
+
+    @staticmethod
+    def config_key(table, cbr_scenarios, fx_scenarios, usd_spread_pct):
+        """Everything the cube depends on; a different key means the cube is stale"""
+        return (
+            id(table),
+            tuple((name, tuple(rates)) for name, rates in cbr_scenarios.items()),
+            tuple((name, tuple(rates)) for name, rates in fx_scenarios.items()),
+            float(usd_spread_pct),
+        )
+
+    def yields(self, year, rate_scenario, fx_scenario):
+        """Вектор доходностей инструментов (%) за год year"""
+        return self.values[min(year, self.n_years - 1),
+                           self.rate_index[rate_scenario],
+                           self.fx_index[fx_scenario]]
+
+    def year_matrix(self, years, rate_scenario, fx_scenario):
+        """Матрица доходностей (years × instruments) для годов 0..years-1"""
+        year_idx = np.minimum(np.arange(years), self.n_years - 1)
+        return self.values[year_idx, self.rate_index[rate_scenario], self.fx_index[fx_scenario]]